@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Weighted aggregates (totals, beneficiaries, means) of OpenFisca variables and ERF data"""
+
+
+from __future__ import division
+
+import logging
+
+import numpy
+from pandas import concat, DataFrame
+
+
+log = logging.getLogger(__name__)
+
+
+def compute_weighted_aggregates(values, weight):
+    """
+    Returns the weighted totals, beneficiaries (non zero values) and means of the rows of values in one pass
+
+    values is an array of shape (variables, observations) and weight an array of observations weights.
+    """
+    values = numpy.atleast_2d(values)
+    amount = values.dot(weight)
+    beneficiaries = (values != 0).dot(weight)
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        mean = numpy.where(beneficiaries > 0, amount / beneficiaries, 0)
+    return amount, beneficiaries, mean
+
+
+def compute_openfisca_aggregates(survey_scenario = None, variables = None, unit = 1e6):
+    """
+    Returns a DataFrame indexed by variable of the weighted amounts (in unit), beneficiaries and means of variables
+
+    Variables are grouped by entity and aggregated with the weights of their entity.
+    """
+    if variables is None:
+        from . import AGGREGATES_DEFAULT_VARS
+        variables = AGGREGATES_DEFAULT_VARS
+    simulation = survey_scenario.simulation
+    weight_name_by_entity_key_plural = survey_scenario.weight_column_name_by_entity_key_plural
+    variables_by_entity_key_plural = dict()
+    for variable in variables:
+        entity_key_plural = simulation.get_or_new_holder(variable).entity.key_plural
+        variables_by_entity_key_plural.setdefault(entity_key_plural, list()).append(variable)
+
+    data_frames = list()
+    for entity_key_plural, entity_variables in variables_by_entity_key_plural.iteritems():
+        weight = simulation.calculate(weight_name_by_entity_key_plural[entity_key_plural])
+        values = numpy.vstack([simulation.calculate(variable) for variable in entity_variables])
+        amount, beneficiaries, mean = compute_weighted_aggregates(values, weight)
+        data_frames.append(DataFrame(
+            dict(entity = entity_key_plural, amount = amount / unit, beneficiaries = beneficiaries, mean = mean),
+            index = entity_variables,
+            ))
+    return concat(data_frames).reindex(variables)[['entity', 'amount', 'beneficiaries', 'mean']]
+
+
+def compare_aggregates(survey_scenario = None, variables = None, unit = 1e6):
+    """
+    Returns a table comparing OpenFisca and ERF aggregates of variables for the year of survey_scenario
+    """
+    from .erf.aggregates import build_erf_aggregates
+    if variables is None:
+        from . import AGGREGATES_DEFAULT_VARS
+        variables = AGGREGATES_DEFAULT_VARS
+    openfisca_aggregates = compute_openfisca_aggregates(survey_scenario, variables = variables, unit = unit)
+    erf_aggregates = build_erf_aggregates(variables = variables, year = survey_scenario.year, unit = unit)
+    return build_aggregates_comparison(openfisca_aggregates, erf_aggregates)
+
+
+def build_aggregates_comparison(openfisca_aggregates, erf_aggregates):
+    """
+    Returns the table comparing the amounts and beneficiaries of openfisca_aggregates and erf_aggregates by variable
+
+    The differences of the variables missing in erf_aggregates are missing.
+    """
+    comparison = openfisca_aggregates.join(erf_aggregates[['amount', 'beneficiaries']], rsuffix = '_erf')
+    comparison.rename(columns = dict(amount = 'amount_of', beneficiaries = 'beneficiaries_of'), inplace = True)
+    comparison['difference'] = comparison['amount_of'] - comparison['amount_erf']
+    comparison['relative_difference'] = comparison['difference'] / comparison['amount_erf'].abs()
+    return comparison
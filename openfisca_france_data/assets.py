@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import logging
+import os
+
+from pandas import ExcelFile, read_pickle
+
+from .temporary import get_tmp_directory
+
+
+log = logging.getLogger(__name__)
+
+data_frame_by_key = dict()
+
+
+def get_cache_directory():
+    try:
+        tmp_directory = get_tmp_directory()
+    except Exception as error:
+        log.info("No tmp_directory configured, Excel assets are not cached on disk: {}".format(error))
+        return None
+    cache_directory = os.path.join(tmp_directory, 'excel_assets')
+    if not os.path.isdir(cache_directory):
+        try:
+            os.makedirs(cache_directory)
+        except OSError:
+            if not os.path.isdir(cache_directory):
+                raise
+    return cache_directory
+
+
+def read_excel(file_path, sheetname = 0, **kwargs):
+    """
+    Return the DataFrame of the sheet sheetname of the Excel file file_path (kwargs are passed to ExcelFile.parse)
+
+    Each sheet is parsed once: the DataFrame is kept in memory and pickled in the excel_assets subdirectory of the
+    temporary directory, under a key built from the path and modification time of the file, the sheet and kwargs. A
+    modified file is therefore parsed again. A copy is returned, which the caller is free to modify.
+    """
+    file_path = os.path.abspath(file_path)
+    key = hashlib.md5(repr((
+        file_path,
+        os.path.getmtime(file_path),
+        sheetname,
+        sorted(kwargs.items()),
+        ))).hexdigest()
+    data_frame = data_frame_by_key.get(key)
+    if data_frame is None:
+        cache_directory = get_cache_directory()
+        pickle_path = os.path.join(cache_directory, "{}.pkl".format(key)) if cache_directory is not None else None
+        if pickle_path is not None and os.path.exists(pickle_path):
+            data_frame = read_pickle(pickle_path)
+        else:
+            log.info("Parsing sheet {} of {}".format(sheetname, file_path))
+            data_frame = ExcelFile(file_path).parse(sheetname, **kwargs)
+            if pickle_path is not None:
+                # Write then rename so that concurrent builds never read a partial file
+                tmp_pickle_path = "{}.{}.tmp".format(pickle_path, os.getpid())
+                data_frame.to_pickle(tmp_pickle_path)
+                os.rename(tmp_pickle_path, pickle_path)
+        data_frame_by_key[key] = data_frame
+    return data_frame.copy()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Binning of continuous variables into compact categorical codes (deciles, size or age brackets...)"""
+
+
+from __future__ import division
+
+import numpy
+
+
+def weighted_quantiles(values, weights, quantiles):
+    """
+    Returns the weighted quantiles of values
+
+    The quantiles are those of mark_weighted_percentiles with method 2 (stats.stackexchange formula), computed with
+    a cumulative sum and a binary search instead of loops over the observations.
+
+    Parameters
+    ----------
+    values, weights : array
+        Observed values and their weights
+    quantiles : array
+        Probabilities (between 0 and 1) of the quantiles
+    """
+    values = numpy.asarray(values)
+    quantiles = numpy.asarray(quantiles, dtype = float)
+    sort_index = numpy.argsort(values)
+    sorted_values = values[sort_index].astype(float)
+    sorted_weights = numpy.asarray(weights, dtype = float)[sort_index]
+    count = len(sorted_values)
+    s_values = numpy.zeros(count)
+    s_values[1:] = numpy.arange(1, count) * sorted_weights[1:] + (count - 1) * numpy.cumsum(sorted_weights)[:-1]
+    norm_s_values = s_values / s_values[-1]
+
+    low = numpy.clip(numpy.searchsorted(norm_s_values, quantiles, side = 'right') - 1, 0, count - 1)
+    high = numpy.minimum(low + 1, count - 1)
+    span = s_values[high] - s_values[low]
+    with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+        fraction = numpy.where(span > 0, (quantiles * s_values[-1] - s_values[low]) / span, 0)
+    result = sorted_values[low] + fraction * (sorted_values[high] - sorted_values[low])
+    result[quantiles <= norm_s_values[0]] = sorted_values[0]
+    result[quantiles >= norm_s_values[-1]] = sorted_values[-1]
+    return result
+
+
+def bin_values(values, cuts = None, weights = None, quantiles = None, right = True, start = 1, return_cuts = False):
+    """
+    Returns the codes of the bins of values
+
+    Parameters
+    ----------
+    values : array
+        Values to bin
+    cuts : array, default None
+        Increasing cut points between the bins
+    weights : array, default None
+        Weights of the values, used when the cut points are weighted quantiles
+    quantiles : int or array, default None
+        Number of bins of equal weights (10 for deciles) or probabilities of the cut points, used when cuts is None
+    right : bool, default True
+        Whether a value equal to a cut point falls in the lower bin, i.e. whether bins are closed on their right
+    start : int, default 1
+        Code of the first bin
+    return_cuts : bool, default False
+        Whether to return the cut points along with the codes
+
+    Returns
+    -------
+    The int8 codes, start for the values below the first cut point (and for missing values) and start + len(cuts)
+    for the values above the last one, and the cut points if return_cuts is True
+    """
+    values = numpy.asarray(values)
+    if cuts is None:
+        assert quantiles is not None, "Either cuts or quantiles must be given"
+        if numpy.isscalar(quantiles):
+            quantiles = numpy.linspace(0, 1, quantiles + 1)[1:-1]
+        if weights is None:
+            weights = numpy.ones(len(values))
+        cuts = weighted_quantiles(values, weights, quantiles)
+    cuts = numpy.sort(numpy.asarray(cuts, dtype = float))
+    assert start + len(cuts) <= numpy.iinfo(numpy.int8).max, "Too many bins for int8 codes"
+    codes = numpy.searchsorted(cuts, values, side = 'left' if right else 'right').astype(numpy.int8)
+    if values.dtype.kind == 'f':
+        codes[numpy.isnan(values)] = 0
+    codes += start
+    if return_cuts:
+        return codes, cuts
+    return codes
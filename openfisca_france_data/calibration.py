@@ -23,13 +23,21 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
+from __future__ import division
+
 import logging
+import multiprocessing
+import os
+
 import numpy
 from numpy import logical_not
 from pandas import concat, DataFrame, read_csv
-from openfisca_core.calmar import calmar
+from scipy import sparse
 from openfisca_core.columns import AgeCol, BoolCol, EnumCol
 
+from .calmar import calibrate_weights
+from .utils import get_dependency_graph, get_entity_projector
+
 log = logging.getLogger(__name__)
 
 
@@ -37,18 +45,23 @@ class Calibration(object):
     """
     An object to calibrate survey data of a SurveySimulation
     """
+    design_by_name = None
+    design_filter_by = None
     filter_by_name = None
     initial_total_population = None
+    lambda_ = None
+    lambda_keys = None
     margins_by_name = None
     parameters = {
         'use_proportions': True,
         'pondini': None,
         'method': None,  # 'linear', 'raking ratio', 'logit'
         'up': None,
-        'lo': None
+        'invlo': None
         }
     survey_scenario = None
     total_population = None
+    value_by_name = None
     weight_name = None
     initial_weight_name = None
 
@@ -56,6 +69,9 @@ class Calibration(object):
         self.filter_by_name = "champm"
         assert survey_scenario is not None
         self.survey_scenario = survey_scenario
+        self.design_by_name = dict()
+        self.parameters = dict(self.parameters)
+        self.value_by_name = dict()
 
     def set_total_population(self, total_population):
         """
@@ -78,6 +94,8 @@ class Calibration(object):
         self.survey_scenario = survey_scenario
         if survey_scenario.simulation is None:
             survey_scenario.simulation = survey_scenario.new_simulation()
+        self.design_by_name = dict()
+        self.value_by_name = dict()
         # self.entity = 'men'  # TODO: shoud not be france specific
         self.filter_by = filter_by = survey_scenario.simulation.calculate(self.filter_by_name)
         self.weight_name = weight_name = self.survey_scenario.weight_column_name_by_entity_key_plural['menages']
@@ -91,7 +109,7 @@ class Calibration(object):
         Set parameter
         """
         if parameter == 'lo':
-            self.parameters['lo'] = 1 / value
+            self.parameters['invlo'] = 1 / value
         else:
             self.parameters[parameter] = value
 
@@ -124,61 +142,139 @@ class Calibration(object):
                     margins['total_population'] = total_population
                     self.total_population = total_population
             else:
-                self.add_var2(var, margins[var], source = source)
-
+                self.set_target_margin_by_category(var, margins[var])
 
     def get_parameters(self):
         p = {}
         p['method'] = self.parameters['method']
-        p['lo'] = 1 / self.parameters['invlo']
+        invlo = self.parameters.get('invlo')
+        p['lo'] = 1 / invlo if invlo is not None else None
         p['up'] = self.parameters['up']
         p['use_proportions'] = True
 
         p['pondini'] = self.weight_name + ""
         return p
 
-    def _build_calmar_data(self):
+    def get_simple_margins_by_name(self):
         """
-        Builds the data dictionnary used as calmar input argument
+        Returns the targets by margin variable, including the total population when it is set
         """
-        # Select only filtered entities
-        assert self.initial_weight_name is not None
-        data = {self.initial_weight_name: self.initial_weight * self.filter_by}
-        for var in self.margins_by_name:
-            if var == 'total_population':
+        simple_margins_by_name = dict([
+            (variable, margins_by_type['target'])
+            for variable, margins_by_type in self.margins_by_name.iteritems()])
+
+        if self.total_population:
+            simple_margins_by_name['total_population'] = self.total_population
+        return simple_margins_by_name
+
+    def get_design(self):
+        """
+        Returns the keys (variable, category) of the columns, the design matrix and the targets of the current margins
+        """
+        return self._build_design(
+            self.get_simple_margins_by_name(),
+            use_proportions = self.get_parameters()['use_proportions'],
+            )
+
+    def _build_design(self, margins, use_proportions = True):
+        """
+        Builds the design matrix, the targets and the keys (variable, category) of its columns from margins
+        """
+        filtered_initial_weight = self.initial_weight * self.filter_by
+        total_population = margins.get('total_population')
+        keys = list()
+        columns = list()
+        targets = list()
+        if total_population is not None:
+            keys.append(('total_population', None))
+            columns.append(numpy.ones((len(filtered_initial_weight), 1)))
+            targets.append(total_population)
+        for variable, target in sorted(margins.iteritems()):
+            if variable == 'total_population':
                 continue
-            assert var in self.survey_scenario.tax_benefit_system.column_by_name.keys()
-            data[var] = self.survey_scenario.simulation.calculate(var)
-        return data
+            categories, design = self.get_margin_design(variable)
+            if categories is None:
+                keys.append((variable, None))
+                columns.append(design)
+                targets.append(target)
+                continue
+            selected = [index for index, category in enumerate(categories) if category in target]
+            if use_proportions:
+                population = total_population if total_population is not None else filtered_initial_weight.sum()
+                ratio = population / sum(target.values())
+            else:
+                ratio = 1
+            keys.extend((variable, categories[index]) for index in selected)
+            columns.append(design[:, selected])
+            targets.extend(target[categories[index]] * ratio for index in selected)
+        design = sparse.hstack([sparse.csr_matrix(column) for column in columns], format = 'csr')
+        return keys, design, numpy.array(targets, dtype = float)
+
+    def get_margin_design(self, variable):
+        """
+        Returns the categories (None for a numeric variable) and the design matrix of a margin variable
+
+        The design matrix is a sparse (CSR) matrix with one indicator column by category of a categorical variable
+        (AgeCol, BoolCol, EnumCol) and a dense single column of values otherwise. It is computed once, the simulation
+        is only used for new variables. As the categories are the values found in the filtered population, all the
+        designs are computed again when the filter changes.
+        """
+        if self.design_filter_by is not self.filter_by:
+            self.design_by_name = dict()
+            self.value_by_name = dict()
+            self.design_filter_by = self.filter_by
+        if variable not in self.design_by_name:
+            survey_scenario = self.survey_scenario
+            column_by_name = survey_scenario.tax_benefit_system.column_by_name
+            assert variable in column_by_name
+            value = survey_scenario.simulation.calculate(variable)
+            if column_by_name[variable].__class__ in [AgeCol, BoolCol, EnumCol]:
+                categories = numpy.unique(value[self.filter_by])
+                design = build_indicator_matrix(value, categories)
+            else:
+                categories = None
+                design = value.astype(numpy.float64).reshape(-1, 1)
+            self.value_by_name[variable] = value
+            self.design_by_name[variable] = (categories, design)
+        return self.design_by_name[variable]
 
     def _update_weights(self, margins, parameters = {}):
         """
-        Runs calmar, stores new weights and returns adjusted margins
+        Solves the calibration, stores new weights and returns adjusted margins
+
+        The solver starts from the Lagrange multipliers of the previous calibration when the margins are the same
+        variables and categories, so that a calibration after a small change of the targets is fast.
         """
-        data = self._build_calmar_data()
+        keys, design, targets = self._build_design(
+            margins, use_proportions = parameters.get('use_proportions', True))
+        initial_lambda = self.lambda_ if keys == self.lambda_keys else None
         assert self.initial_weight_name is not None
-        val_pondfin, lambdasol, updated_margins = calmar(
-            data, margins, parameters = parameters, pondini = self.initial_weight_name
+        weight, self.lambda_ = calibrate_weights(
+            design = design,
+            initial_weight = self.initial_weight * self.filter_by,
+            targets = targets,
+            method = parameters.get('method'),
+            lo = parameters.get('lo'),
+            up = parameters.get('up'),
+            initial_lambda = initial_lambda,
             )
+        self.lambda_keys = keys
         # Updating only afetr filtering weights
-        self.weight = val_pondfin * self.filter_by + self.weight * (logical_not(self.filter_by))
+        self.weight = weight * self.filter_by + self.weight * (logical_not(self.filter_by))
+        updated_margins = dict()
+        for (variable, category), margin in zip(keys, design.T.dot(weight)):
+            if category is None:
+                updated_margins[variable] = margin
+            else:
+                updated_margins.setdefault(variable, dict())[category] = margin
         return updated_margins
 
     def calibrate(self):
         """
         Calibrate according to margins found in frame
         """
-        margins_by_name = self.margins_by_name
         parameters = self.get_parameters()
-
-        simple_margins_by_name = dict([
-            (variable, margins_by_type['target'])
-            for variable, margins_by_type in margins_by_name.iteritems()])
-
-        if self.total_population:
-            simple_margins_by_name['total_population'] = self.total_population
-
-        self._update_weights(simple_margins_by_name, parameters = parameters)
+        self._update_weights(self.get_simple_margins_by_name(), parameters = parameters)
         self.update_margins()
 #        w = self.weight
 #        for var in margins.keys():
@@ -252,25 +348,17 @@ class Calibration(object):
 
     def set_calibrated_weights(self):
         """
-        Modify the weights to use the calibrated weights
+        Modify the weights to use the calibrated weights, for the ménages and the other entities
         """
         simulation = self.survey_scenario.simulation
         holder = simulation.get_or_new_holder(self.weight_name)
         holder.array = numpy.array(self.weight, dtype = holder.column.dtype)
-        # TODO: propagation to other weights
+        propagate_menage_weights(self.survey_scenario)
 
     def set_target_margin(self, variable, target):
-        survey_scenario = self.survey_scenario
-        simulation = survey_scenario.simulation
-        column_by_name = survey_scenario.tax_benefit_system.column_by_name
-        assert variable in column_by_name
-        column = survey_scenario.tax_benefit_system.column_by_name[variable]
-
-        filter_by = self.filter_by
-        value = simulation.calculate(variable)
+        categories, _ = self.get_margin_design(variable)
         target_by_category = None
-        if column.__class__ in [AgeCol, BoolCol, EnumCol]:
-            categories = numpy.sort(numpy.unique(value[filter_by]))
+        if categories is not None:
             target_by_category = dict(zip(categories, target))
 
         # assert len(atrget) = len
@@ -279,38 +367,221 @@ class Calibration(object):
         if variable not in self.margins_by_name:
             self.margins_by_name[variable] = dict()
         self.margins_by_name[variable]['target'] = target_by_category or target
-        self.update_margins()
+        self.update_margins(variables = [variable])
 
-    def update_margins(self):
-        for variable in self.margins_by_name:
-            survey_scenario = self.survey_scenario
-            simulation = survey_scenario.simulation
-            column_by_name = survey_scenario.tax_benefit_system.column_by_name
+    def set_target_margin_by_category(self, variable, target_by_category):
+        """
+        Sets the margin of variable from a dict of targets by category (a single category for a numeric variable)
+        """
+        categories, _ = self.get_margin_design(variable)
+        if categories is None:
+            assert len(target_by_category) == 1, "Numeric variable {} should have a single target".format(variable)
+            target = list(target_by_category.values())[0]
+        else:
+            target = dict(
+                (category, target_by_category[category]) for category in categories if category in target_by_category)
+        if not self.margins_by_name:
+            self.margins_by_name = dict()
+        self.margins_by_name.setdefault(variable, dict())['target'] = target
+        self.update_margins(variables = [variable])
 
-            assert variable in column_by_name
-            column = survey_scenario.tax_benefit_system.column_by_name[variable]
-            weight = self.weight
-            filter_by = self.filter_by
-            initial_weight = self.initial_weight
-
-            value = simulation.calculate(variable)
-            margin_items = [
-                ('actual', weight[filter_by]),
-                ('initial', initial_weight[filter_by]),
-                ]
-
-            if column.__class__ in [AgeCol, BoolCol, EnumCol]:
-                margin_items.append(('category', value[filter_by]))
-                margins_data_frame = DataFrame.from_items(margin_items)
-                margins_data_frame = margins_data_frame.groupby('category', sort = True).sum()
-                margin_by_type = margins_data_frame.to_dict()
+    def get_margins_data_frame(self):
+        """
+        Returns a DataFrame of the initial, target and actual margins by variable and category
+        """
+        rows = list()
+        for variable, margin_by_type in sorted((self.margins_by_name or dict()).iteritems()):
+            if isinstance(margin_by_type.get('target'), dict):
+                for category, target in sorted(margin_by_type['target'].iteritems()):
+                    rows.append(dict(
+                        variable = variable,
+                        category = category,
+                        initial = margin_by_type['initial'].get(category),
+                        target = target,
+                        actual = margin_by_type['actual'].get(category),
+                        ))
+            else:
+                rows.append(dict(
+                    variable = variable,
+                    category = None,
+                    initial = margin_by_type.get('initial'),
+                    target = margin_by_type.get('target'),
+                    actual = margin_by_type.get('actual'),
+                    ))
+        if self.total_population is not None:
+            rows.append(dict(
+                variable = 'total_population',
+                category = None,
+                initial = self.initial_total_population,
+                target = self.total_population,
+                actual = (self.weight * self.filter_by).sum(),
+                ))
+        return DataFrame(rows, columns = ['variable', 'category', 'initial', 'target', 'actual'])
+
+    def update_margins(self, variables = None):
+        """
+        Updates the actual and initial margins of variables (all the margin variables when None)
+        """
+        filtered_weight = self.weight * self.filter_by
+        filtered_initial_weight = self.initial_weight * self.filter_by
+        for variable in (variables or self.margins_by_name):
+            categories, design = self.get_margin_design(variable)
+            actual = design.T.dot(filtered_weight)
+            initial = design.T.dot(filtered_initial_weight)
+            if categories is not None:
+                margin_by_type = dict(
+                    actual = dict(zip(categories, actual)),
+                    initial = dict(zip(categories, initial)),
+                    )
             else:
                 margin_by_type = dict(
-                    actual = (weight[filter_by] * value[filter_by]).sum(),
-                    initial = (initial_weight[filter_by] * value[filter_by]).sum(),
+                    actual = actual[0],
+                    initial = initial[0],
                     )
             self.margins_by_name[variable].update(margin_by_type)
 
-            if self.total_population is not None:
-                 target = self.margins_by_name[variable].get('target', False)
 
+def build_indicator_matrix(value, categories):
+    """
+    Returns the sparse (CSR) matrix of the indicators of the sorted categories for the observations of value
+
+    Observations whose value is not one of the categories have an empty row.
+    """
+    codes = numpy.clip(numpy.searchsorted(categories, value), 0, len(categories) - 1)
+    rows = numpy.flatnonzero(categories[codes] == value)
+    return sparse.csr_matrix(
+        (numpy.ones(len(rows)), (rows, codes[rows])),
+        shape = (len(value), len(categories)),
+        )
+
+
+def propagate_menage_weights(survey_scenario):
+    """
+    Sets the weights of the individus, familles and foyers from the current ménage weights
+
+    Individus get the weight of their ménage, familles and foyers the weight of their head, as the weight_individus,
+    weight_familles and weight_foyers formulas do. The cached values of the variables depending on the weights are
+    deleted so that they are recomputed with the new weights.
+    """
+    simulation = survey_scenario.simulation
+    weight_name_by_entity_key_plural = survey_scenario.weight_column_name_by_entity_key_plural
+    entity_projector = get_entity_projector(simulation)
+    weight_individus = numpy.take(
+        simulation.calculate(weight_name_by_entity_key_plural['menages']),
+        entity_projector.id_by_entity['men'],
+        )
+    weight_by_name = {weight_name_by_entity_key_plural['individus']: weight_individus}
+    for entity_key_plural, entity in [('familles', 'fam'), ('foyers_fiscaux', 'foy')]:
+        head = entity_projector.head_by_entity[entity]
+        weight = numpy.zeros(entity_projector.count_by_entity[entity])
+        weight[entity_projector.id_by_entity[entity][head]] = weight_individus[head]
+        weight_by_name[weight_name_by_entity_key_plural[entity_key_plural]] = weight
+
+    for weight_name, weight in weight_by_name.iteritems():
+        holder = simulation.get_or_new_holder(weight_name)
+        holder.array = numpy.array(weight, dtype = holder.column.dtype)
+
+    invalidate_consumers(simulation, weight_name_by_entity_key_plural.values())
+
+
+def invalidate_consumers(simulation, variables):
+    """
+    Deletes the cached arrays of all the variables depending, directly or not, on variables (but not of variables)
+    """
+    dependency_graph = get_dependency_graph(simulation.tax_benefit_system)
+    visited = set(variables)
+    for variable in variables:
+        for consumer in dependency_graph.get_consumers(variable):
+            if consumer in visited:
+                continue
+            visited.add(consumer)
+            holder = simulation.holder_by_name.get(consumer)
+            if holder is not None and holder.real_formula is not None:
+                holder.delete_arrays()
+
+
+def get_calibration_job_key(job):
+    return "{}_{}_{}".format(
+        job['year'],
+        os.path.splitext(os.path.basename(job['margins_file_path']))[0],
+        (job.get('method') or 'linear').replace(' ', '_'),
+        )
+
+
+def create_survey_scenario(year):
+    from openfisca_france_data.input_data_builders import get_input_data_frame
+    from openfisca_france_data.surveys import SurveyScenario
+    survey_scenario = SurveyScenario().init_from_data_frame(
+        input_data_frame = get_input_data_frame(year),
+        year = year,
+        )
+    survey_scenario.initialize_weights()
+    survey_scenario.new_simulation()
+    return survey_scenario
+
+
+def run_calibration_job(job):
+    """
+    Runs a calibration job and returns its key, its calibrated weights and its margins data frame
+
+    A job is a dict with keys year, margins_file_path, method (default 'linear'), parameters (dict of calibration
+    parameters such as invlo and up) and survey_scenario (built from the openfisca input data of the year when
+    missing, which is needed when the job is run in another process). Returns None when the margins file has no
+    margins for the year of the job.
+    """
+    year = job['year']
+    key = get_calibration_job_key(job)
+    survey_scenario = job.get('survey_scenario') or create_survey_scenario(year)
+    calibration = Calibration(survey_scenario = survey_scenario)
+    calibration.set_survey_scenario(survey_scenario)
+    calibration.set_parameters('method', job.get('method') or 'linear')
+    for parameter, value in job.get('parameters', dict()).iteritems():
+        calibration.set_parameters(parameter, value)
+    calibration.set_margins_target_from_file(job['margins_file_path'], year, 'input')
+    if calibration.margins_by_name is None:
+        log.warning("Calibration job {} skipped: no margins for year {} in {}".format(
+            key, year, job['margins_file_path']))
+        return None
+    calibration.calibrate()
+    log.info("Calibration job {} done".format(key))
+    return key, calibration.weight, calibration.get_margins_data_frame()
+
+
+def run_calibration_jobs(jobs, processes = None, weights_file_path = None):
+    """
+    Runs calibration jobs (see run_calibration_job), in a pool of processes when processes is not None
+
+    Returns the calibrated weights by job key and a report of the initial, target and achieved margins of all the
+    jobs, the jobs without margins for their year being skipped. When weights_file_path is given, the weights are
+    stored there as a compressed numpy archive keyed by job.
+    """
+    if processes is None:
+        results = [run_calibration_job(job) for job in jobs]
+    else:
+        assert all(job.get('survey_scenario') is None for job in jobs), \
+            "Survey scenarios cannot be sent to other processes, they are built from the year of the job"
+        pool = multiprocessing.Pool(processes = processes)
+        try:
+            results = pool.map(run_calibration_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    weight_by_key = dict()
+    margins_data_frames = list()
+    for key, weight, margins_data_frame in filter(None, results):
+        weight_by_key[key] = weight
+        margins_data_frame.insert(0, 'job', key)
+        margins_data_frames.append(margins_data_frame)
+    if weights_file_path is not None:
+        numpy.savez_compressed(weights_file_path, **weight_by_key)
+    margins_data_frame = concat(margins_data_frames, ignore_index = True) if margins_data_frames else DataFrame()
+    return weight_by_key, margins_data_frame
+
+
+def load_calibrated_weights(weights_file_path):
+    """
+    Loads the calibrated weights by job key stored by run_calibration_jobs
+    """
+    with numpy.load(weights_file_path) as archive:
+        return dict((key, archive[key]) for key in archive.files)
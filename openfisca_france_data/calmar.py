@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Calibration of survey weights by Newton iterations on the dual problem (as in the SAS macro CALMAR)"""
+
+
+from __future__ import division
+
+import logging
+
+import numpy
+from scipy import sparse
+
+
+log = logging.getLogger(__name__)
+
+
+def linear(u):
+    return 1 + u
+
+
+def linear_prime(u):
+    return numpy.ones(u.shape, dtype = float)
+
+
+def raking_ratio(u):
+    return numpy.exp(u)
+
+
+def raking_ratio_prime(u):
+    return numpy.exp(u)
+
+
+def logit(u, lo, up):
+    a = (up - lo) / ((1 - lo) * (up - 1))
+    exp_au = numpy.exp(numpy.clip(a * u, -500, 500))
+    return (lo * (up - 1) + up * (1 - lo) * exp_au) / (up - 1 + (1 - lo) * exp_au)
+
+
+def logit_prime(u, lo, up):
+    a = (up - lo) / ((1 - lo) * (up - 1))
+    exp_au = numpy.exp(numpy.clip(a * u, -500, 500))
+    denominator = up - 1 + (1 - lo) * exp_au
+    # Written so as not to overflow for large values of exp_au
+    return a * (1 - lo) * (up - 1) * (up - lo) / (denominator * ((up - 1) / exp_au + (1 - lo)))
+
+
+def get_distance_functions(method = None, lo = None, up = None):
+    """
+    Returns the calibration function F and its derivative for a method ('linear', 'raking ratio' or 'logit')
+    """
+    if method is None or method == 'linear':
+        return linear, linear_prime
+    elif method == 'raking ratio':
+        return raking_ratio, raking_ratio_prime
+    elif method == 'logit':
+        assert lo is not None and up is not None, "Bounds lo and up are needed by the logit method"
+        assert 0 <= lo < 1 < up, "Bounds should verify 0 <= lo < 1 < up"
+        return (lambda u: logit(u, lo, up)), (lambda u: logit_prime(u, lo, up))
+    raise ValueError("Unknown calibration method {}".format(method))
+
+
+def weighted_cross_product(design, weight):
+    """
+    Returns the dense matrix design' diag(weight) design of a dense or sparse design matrix
+    """
+    if sparse.issparse(design):
+        return design.T.dot(sparse.diags(weight).dot(design)).toarray()
+    return design.T.dot(design * weight[:, numpy.newaxis])
+
+
+def calibrate_weights(design = None, initial_weight = None, targets = None, method = None, lo = None, up = None,
+        initial_lambda = None, tolerance = 1e-9, max_iterations = 100):
+    """
+    Computes weights initial_weight * F(design . lambda) whose weighted sums of the design columns equal targets
+
+    Parameters
+    ----------
+    design : array or sparse matrix of shape (observations, margins)
+             calibration variables (indicators of the categories of categorical margins)
+    initial_weight : array
+                     initial weights
+    targets : array
+              targets of the weighted sums of the columns of design
+    method : string, default None
+             'linear' (default), 'raking ratio' or 'logit'
+    lo, up : float, default None
+             bounds of the ratio of the calibrated weights to the initial weights used by the logit method
+    initial_lambda : array, default None
+                     starting value of the Lagrange multipliers, typically those of a previous calibration
+    tolerance : float, default 1e-9
+                maximal gap between achieved margins and targets relative to the targets
+    max_iterations : int, default 100
+                     maximal number of Newton iterations
+
+    Returns
+    -------
+    weight : array
+             calibrated weights
+    lambda_ : array
+              Lagrange multipliers, to be used as initial_lambda of a later calibration
+    """
+    assert design is not None and initial_weight is not None and targets is not None
+    F, F_prime = get_distance_functions(method, lo, up)
+    initial_weight = numpy.asarray(initial_weight, dtype = float)
+    targets = numpy.asarray(targets, dtype = float)
+    scale = numpy.maximum(numpy.abs(targets), 1)
+    if initial_lambda is None:
+        lambda_ = numpy.zeros(design.shape[1])
+    else:
+        lambda_ = numpy.array(initial_lambda, dtype = float)
+        assert lambda_.shape == (design.shape[1],)
+
+    u = design.dot(lambda_)
+    weight = initial_weight * F(u)
+    gap = (design.T.dot(weight) - targets) / scale
+    for iteration in range(max_iterations):
+        if numpy.abs(gap).max() < tolerance:
+            log.debug("Calibration converged in {} iterations".format(iteration))
+            return weight, lambda_
+        jacobian = weighted_cross_product(design, initial_weight * F_prime(u))
+        # Least squares step since the margins may be collinear (total population and categories)
+        step = numpy.linalg.lstsq(jacobian, - gap * scale, rcond = -1)[0]
+        # Damping: halve the step until the gap decreases
+        gap_norm = numpy.linalg.norm(gap)
+        step_length = 1
+        while True:
+            candidate_lambda = lambda_ + step_length * step
+            candidate_u = design.dot(candidate_lambda)
+            candidate_weight = initial_weight * F(candidate_u)
+            candidate_gap = (design.T.dot(candidate_weight) - targets) / scale
+            if numpy.linalg.norm(candidate_gap) < gap_norm:
+                break
+            step_length /= 2
+            if step_length < 1e-6:
+                log.info("Calibration stalled after {} iterations (unreachable targets?), maximal relative gap is {}"
+                    .format(iteration, numpy.abs(gap).max()))
+                return weight, lambda_
+        lambda_, u, weight, gap = candidate_lambda, candidate_u, candidate_weight, candidate_gap
+
+    log.info("Calibration did not converge after {} iterations, maximal relative gap is {}".format(
+        max_iterations, numpy.abs(gap).max()))
+    return weight, lambda_
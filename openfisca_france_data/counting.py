@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Counts of the rows of each group (household, family...) by category, in a single pass"""
+
+
+from __future__ import division
+
+import numpy
+import pandas
+
+
+def count_by_category(groups, categories, name_by_category, index = None, total = None, shares = None):
+    """
+    Returns the number of rows of each group in each category
+
+    Parameters
+    ----------
+    groups : array
+        Group (household...) of each row
+    categories : array
+        Category of each row, or (rows, slots) array of categories when a row holds several items (e.g. the fuels of
+        the first and second cars of a household)
+    name_by_category : dict
+        Name of the count column of each counted category (other categories are not counted)
+    index : Index, default None
+        Groups of the result, which get zero counts when they have no row (rows of other groups are ignored). By
+        default the sorted groups of the rows
+    total : str, default None
+        Name of the column of the number of rows of each group
+    shares : dict, default None
+        Count column of the numerator of each share column, the denominator being the total (shares of empty
+        groups are zero)
+
+    Returns
+    -------
+    DataFrame indexed by the groups with int16 counts and float32 shares
+    """
+    groups = numpy.asarray(groups)
+    categories = numpy.asarray(categories)
+    if index is None:
+        group_codes, index = pandas.factorize(groups, sort = True)
+        index = pandas.Index(index)
+    else:
+        index = pandas.Index(index)
+        group_codes = index.get_indexer(groups)
+    group_count = len(index)
+
+    counted_categories = sorted(name_by_category.keys())
+    category_values = numpy.array(counted_categories)
+    category_codes = numpy.searchsorted(category_values, categories).clip(0, len(category_values) - 1)
+    counted = category_values[category_codes] == categories
+    if categories.ndim == 2:
+        row_group_codes = numpy.repeat(group_codes, categories.shape[1])
+        category_codes = category_codes.ravel()
+        counted = counted.ravel()
+    else:
+        row_group_codes = group_codes
+    counted &= row_group_codes >= 0
+    cell_counts = numpy.bincount(
+        row_group_codes[counted] * len(category_values) + category_codes[counted],
+        minlength = group_count * len(category_values),
+        ).reshape(group_count, len(category_values))
+
+    data_frame = pandas.DataFrame(index = index)
+    if total is not None:
+        data_frame[total] = numpy.bincount(group_codes[group_codes >= 0], minlength = group_count)
+    for position, category in enumerate(counted_categories):
+        data_frame[name_by_category[category]] = cell_counts[:, position]
+    assert (data_frame.values <= numpy.iinfo(numpy.int16).max).all(), "Counts too large for int16"
+    data_frame = data_frame.astype(numpy.int16)
+    for share, count in (shares or dict()).iteritems():
+        assert total is not None, "Shares need a total"
+        denominator = data_frame[total].values
+        data_frame[share] = numpy.where(
+            denominator > 0,
+            data_frame[count].values / numpy.maximum(denominator, 1),
+            0,
+            ).astype(numpy.float32)
+    return data_frame
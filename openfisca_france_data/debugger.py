@@ -31,15 +31,11 @@ import logging
 
 
 import numpy as np
-from numpy import logical_and as and_
-from pandas import merge, concat
+from pandas import concat, DataFrame
 
 
-from openfisca_france_data.model.common import mark_weighted_percentiles as mwp
-from openfisca_survey_manager.surveys import SurveyCollection
-from openfisca_france_data.utils import simulation_results_as_data_frame
-from openfisca_france_data.erf import get_erf2of, get_of2erf
-from openfisca_plugin_aggregates.aggregates import Aggregates
+from openfisca_france_data.utils import get_dependency_graph, simulation_results_as_data_frame
+from openfisca_france_data.erf import get_erf_data_frame_by_table
 
 
 log = logging.getLogger(__name__)
@@ -49,11 +45,109 @@ def clean(parameter):
     return parameter[:-len('_holder')] if parameter.endswith('_holder') else parameter
 
 
+DIFFERENCE_SUFFIXES = ['_erf', '_of', '_abs_diff', '_rel_diff', '_ratio', '_contribution']
+
+
+def compute_household_differences(erf_menages_data_frame, of_menages_data_frame, variables = None, weight = 'wprm',
+        top = 10):
+    """
+    Compare the ERF and OpenFisca values of variables for each ménage
+
+    Parameters
+    ----------
+    erf_menages_data_frame : DataFrame
+        ERF ménages with an idmen column, the variables and the weight column
+    of_menages_data_frame : DataFrame
+        OpenFisca ménages with an idmen column and the variables (the weight is taken from the ERF when present)
+    variables : list
+        Names of the variables to compare
+    weight : str, default 'wprm'
+        Name of the weight column
+    top : int, default 10
+        Number of offending households kept by variable
+
+    Returns
+    -------
+    (differences, report, top_households_by_variable) where differences holds, for each ménage present in both
+    sources and each variable, the values (_erf, _of), the absolute (_abs_diff) and relative (_rel_diff) gaps, the
+    ratio and the share of the weighted aggregate gap (_contribution). report gives by variable the aggregates, the gap
+    and the number of differing ménages. top_households_by_variable holds the ménages with the largest weighted
+    absolute gap.
+    """
+    assert variables
+    erf_columns = ['idmen'] + [name for name in variables if name in erf_menages_data_frame.columns]
+    of_columns = ['idmen'] + [name for name in variables if name in of_menages_data_frame.columns]
+    missing_variables = set(variables).difference(set(erf_columns).intersection(set(of_columns)))
+    if missing_variables:
+        log.info('Variables {} are not available in both sources'.format(sorted(missing_variables)))
+    variables = [name for name in variables if name not in missing_variables]
+    if weight in erf_menages_data_frame.columns:
+        erf_columns.append(weight)
+    else:
+        of_columns.append(weight)
+
+    erf = erf_menages_data_frame[erf_columns].rename(columns = dict((name, name + '_erf') for name in variables))
+    openfisca = of_menages_data_frame[of_columns].rename(columns = dict((name, name + '_of') for name in variables))
+    merged = erf.merge(openfisca, on = 'idmen', how = 'inner')
+    merged.set_index('idmen', drop = False, inplace = True)
+    weights = merged[weight].values.astype(float)
+
+    report_rows = list()
+    top_households_by_variable = dict()
+    for variable in variables:
+        erf_values = merged[variable + '_erf'].values.astype(float)
+        of_values = merged[variable + '_of'].values.astype(float)
+        abs_diff = of_values - erf_values
+        nonzero_erf = erf_values != 0
+        safe_erf_values = np.where(nonzero_erf, erf_values, 1)
+        rel_diff = np.where(nonzero_erf, abs_diff / np.abs(safe_erf_values), np.nan)
+        ratio = np.where(nonzero_erf, of_values / safe_erf_values, np.nan)
+        weighted_diff = weights * abs_diff
+        total_gap = weighted_diff.sum()
+        merged[variable + '_abs_diff'] = abs_diff
+        merged[variable + '_rel_diff'] = rel_diff
+        merged[variable + '_ratio'] = ratio
+        merged[variable + '_contribution'] = weighted_diff / total_gap if total_gap != 0 else 0
+
+        erf_aggregate = (weights * erf_values).sum()
+        order = np.argsort(- np.abs(weighted_diff), kind = 'mergesort')[:top]
+        top_households_by_variable[variable] = merged.iloc[order][
+            ['idmen', weight] + [variable + suffix for suffix in DIFFERENCE_SUFFIXES]
+            ].reset_index(drop = True)
+        report_rows.append(dict(
+            variable = variable,
+            erf = erf_aggregate,
+            openfisca = erf_aggregate + total_gap,
+            gap = total_gap,
+            rel_gap = total_gap / abs(erf_aggregate) if erf_aggregate != 0 else np.nan,
+            differing_households = int((abs_diff != 0).sum()),
+            top_share = (weighted_diff[order].sum() / total_gap) if total_gap != 0 else np.nan,
+            ))
+
+    report = DataFrame(
+        report_rows,
+        columns = ['variable', 'erf', 'openfisca', 'gap', 'rel_gap', 'differing_households', 'top_share'],
+        ).set_index('variable')
+    return merged, report, top_households_by_variable
+
+
+def format_differences_report(report, top_households_by_variable = None):
+    """
+    Return a printable summary of the output of compute_household_differences
+    """
+    lines = [report.to_string()]
+    for variable, top_households in sorted((top_households_by_variable or dict()).iteritems()):
+        lines.append('')
+        lines.append('Top households for {}'.format(variable))
+        lines.append(top_households.to_string())
+    return '\n'.join(lines)
+
+
 class Debugger(object):
     def __init__(self):
         super(Debugger, self).__init__()
-        self.erf_menage = None
-        self.erf_eec_indivi = None
+        self.erf_menages_data_frame = None
+        self.erf_eec_individus_data_frame = None
         self.of_menages_data_frame = None
         self.of_individus_data_frame = None
         self.variable = None
@@ -82,21 +176,11 @@ class Debugger(object):
             self.variable = variable
 
     def show_aggregates(self):
-        from openfisca_france_data.erf.aggregates import build_erf_aggregates
+        from openfisca_france_data.aggregates import compare_aggregates
 
         assert self.survey_scenario is not None, 'simulation attribute is None'
         assert self.variable is not None, 'variable attribute is None'
-        variable = self.variable
-        openfisca_aggregates = Aggregates()
-        openfisca_aggregates.set_survey_scenario(self.survey_scenario)
-        openfisca_aggregates.compute()
-
-        column_by_name = self.column_by_name
-        temp = (build_erf_aggregates(variables=[variable], year= self.survey_scenario.year))
-        selection = openfisca_aggregates.aggr_frame["Mesure"] == column_by_name[variable].label
-        print openfisca_aggregates.aggr_frame[selection]
-        print temp
-        # TODO: clean this
+        print compare_aggregates(self.survey_scenario, variables = [self.variable]).to_string()
         return
 
     def extract(self, data_frame, entities = "men"):
@@ -109,37 +193,28 @@ class Debugger(object):
 
     def get_all_parameters(self, column_list):
         column_by_name = self.column_by_name
-        simulation = self.simulation
-        if len(column_list) == 0:
-            return []
-        else:
-            column_name = column_list[0].name
-            holder = simulation.get_or_new_holder(column_name)
-            formula = holder.real_formula
-            print column_name, holder
-            if formula is None:
-                return [column_list[0]] + self.get_all_parameters(column_list[1:])
-            else:
-                return (
-                    [column_list[0]] +
-                    self.get_all_parameters(
-                        [column_by_name[clean(parameter)] for parameter in formula.parameters]
-                        ) +
-                    self.get_all_parameters(column_list[1:]))
-
-    def build_columns_to_fetch(self):
-        column_by_name = self.column_by_name
-        parameters_column = self.get_all_parameters([column_by_name.get(x) for x in [self.variable]])
-        parameters = [x.name for x in parameters_column]
+        dependency_graph = get_dependency_graph(self.simulation.tax_benefit_system)
+        names = list()
+        seen = set()
+        for column in column_list:
+            for name in dependency_graph.get_ancestors(column.name, self.simulation) + [column.name]:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        return [column_by_name[name] for name in names]
+
+    def build_columns_to_fetch(self, variables = None):
+        dependency_graph = get_dependency_graph(self.simulation.tax_benefit_system)
         # We want to get all parameters and consumers that we're going to encounter
-        consumers = []
-        for variable in [self.variable]:
-            column = column_by_name.get(variable)
-            consumers = list(set(consumers).union(set(column.consumers)))
-        column_names = list(set(parameters).union(set(consumers)))
-        self.columns_to_fetch = column_names
-        self.variable_consumers = list(set(consumers))
-        self.variable_parameters = list(set(parameters))
+        parameters = dependency_graph.get_ancestors(self.variable, self.simulation) + [self.variable]
+        consumers = dependency_graph.get_consumers(self.variable)
+        self.columns_to_fetch = parameters + [consumer for consumer in consumers if consumer not in parameters]
+        # Other variables to compare
+        self.columns_to_fetch += [
+            variable for variable in (variables or []) if variable not in self.columns_to_fetch
+            ]
+        self.variable_consumers = list(consumers)
+        self.variable_parameters = list(parameters)
 
     def build_openfisca_data_frames(self):
         column_by_name = self.column_by_name
@@ -185,44 +260,14 @@ class Debugger(object):
 
     def build_erf_data_frames(self):
         variables = self.columns_to_fetch
-        erf_survey_collection = SurveyCollection.load(collection = "erfs")
-        erf_survey = erf_survey_collection.surveys["erfs_{}".format(year)]
-
-        erf_variables = list(set(variables + ["ident", "wprm", "quelfic", "noi"]))
-        of2erf = get_of2erf()
-        for index, variable in enumerate(erf_variables):
-            if variable in of2erf:
-                erf_variables[index] = of2erf[variable]
-        data_frame_by_table = dict(eec_indivi = None, erf_indivi = None, erf_menage = None)
-        erf_variables_by_table = dict(eec_indivi = [], erf_indivi = [], erf_menage = [])
-        table_by_erf_variable = dict(
-            [
-                (
-                    erf_variable,
-                    set(
-                        erf_survey.find_tables(variable = erf_variable)
-                        ).intersection(
-                        set(erf_variables_by_table.keys())
-                        )
-                    ) for erf_variable in erf_variables
-                ]
+        year = self.survey_scenario.year
+        data_frame_by_table = get_erf_data_frame_by_table(
+            variables = list(set(variables + ["ident", "wprm", "quelfic", "noi"])),
+            year = year,
+            tables = ['eec_indivi', 'erf_indivi', 'erf_menage'],
             )
-        for variable, tables in table_by_erf_variable.iteritems():
-            if len(tables) < 1:
-                log.info("No tables are present for variable {}".format(variable))
-                continue
-            else:
-                log.info("Variable {} is present in multiple tables : {}".format(variable, tables))
-                for table in tables:
-                    log.info("Variable {} is retrieved from table {}".format(variable, table))
-                    erf_variables_by_table[table].append(variable)
-
-        erf2of = get_erf2of()
-        for table, erf_variables in erf_variables_by_table.iteritems():
-            if erf_variables:
-                data_frame_by_table[table] = erf_survey.get_values(variables = erf_variables, table = table)
-                data_frame_by_table[table].rename(columns = erf2of, inplace = True)
-                data_frame_by_table[table].rename(columns = {'ident': 'idmen'}, inplace = True)
+        for data_frame in data_frame_by_table.itervalues():
+            data_frame.rename(columns = {'ident': 'idmen'}, inplace = True)
 
         assert not data_frame_by_table["erf_menage"].duplicated().any(), "Duplicated idmen in erf_menage"
         self.erf_menages_data_frame = data_frame_by_table["erf_menage"]
@@ -231,73 +276,55 @@ class Debugger(object):
             )
     # TODO: fichier foyer
 
-    def get_major_differences(self):
-        self.build_columns_to_fetch()
+    def build_data_frames(self, variables = None):
+        self.build_columns_to_fetch(variables = variables)
         self.build_erf_data_frames()
         self.build_openfisca_data_frames()
-        variable = self.variable
-        erf_menages_data_frame = self.erf_menages_data_frame
-        of_menages_data_frame = self.of_menages_data_frame
-        merged_menage_data_frame = merge(
-            erf_menages_data_frame[[variable, 'idmen']],
-            of_menages_data_frame[[variable, 'idmen']],
-            on = 'idmen',
-            how = 'inner',
-            suffixes = ('_erf', '_of')
-            )
-        log.info('Length of merged_menage_data_frameis {}'.format(len(merged_menage_data_frame)))
-        merged_menage_data_frame.set_index('idmen', drop = False, inplace = True)
-        table = merged_menage_data_frame[
-            and_(
-                merged_menage_data_frame[variable + '_erf'] != 0,
-                merged_menage_data_frame[variable + '_of'] != 0
-                )
-            ]
-        table[variable + "_rel_diff"] = (table[variable + '_of'] - table[variable + '_erf']) \
-            / table[variable + '_erf']  # Difference relative
-        log.info(
-            "Minimum difference between the two tables for {} is {}".format(
-                variable, str(table[variable + "_rel_diff"].min())
-                )
-            )
-        log.info(
-            "Maximum difference between the two tables for {} is {}".format(
-                variable, str(table[variable + "_rel_diff"].max())
-                )
-            )
-        table[variable + '_ratio'] = (
-            table[variable + '_of'] / table[variable + '_erf']
+
+    def has_menages_variables(self, variables):
+        return all(
+            data_frame is not None and all(variable in data_frame.columns for variable in variables)
+            for data_frame in [self.erf_menages_data_frame, self.of_menages_data_frame]
             )
-        log.info(table[variable + "_rel_diff"].describe())
-        try:
-            assert len(table[variable + "_rel_diff"]) == len(table['wprm_of']), "PINAGS"
-            dec, values = mwp(
-                table[variable + "_rel_diff"],
-                np.arange(1, 11), table['wprm_of'],
-                2,
-                return_quantiles = True
-                )
-            log.info(sorted(values))
-            dec, values = mwp(
-                table[variable + "_rel_diff"],
-                np.arange(1, 101),
-                table['wprm_erf'],
-                2,
-                return_quantiles = True
+
+    def get_major_differences(self, variables = None, top = 10, weight = 'wprm'):
+        """
+        Compare ERF and OpenFisca ménages for variables (default to the debugged variable), weighted by weight
+
+        The household differences, the report by variable and the top offending households by variable are stored in
+        the household_differences, differences_report and top_households_by_variable attributes. Returns the
+        households of the debugged variable with non zero values in both sources sorted by relative difference. The
+        data frames are built again when they lack one of the variables.
+        """
+        variable = self.variable
+        variables = [variable] + [other_variable for other_variable in (variables or []) if other_variable != variable]
+        if not self.has_menages_variables(variables):
+            # The data frames are missing or were built for another variable
+            self.build_data_frames(variables = variables[1:])
+        for source, data_frame in [('ERF', self.erf_menages_data_frame), ('OpenFisca', self.of_menages_data_frame)]:
+            missing_variables = [name for name in variables if name not in data_frame.columns]
+            assert not missing_variables, \
+                "Variables {} are missing from the {} ménages data frame".format(missing_variables, source)
+        self.household_differences, self.differences_report, self.top_households_by_variable = \
+            compute_household_differences(
+                self.erf_menages_data_frame,
+                self.of_menages_data_frame,
+                variables = variables,
+                weight = weight,
+                top = top,
                 )
-            log.info(sorted(values)[90:])
-            del dec, values
-        except:
-            log.info('Weighted percentile method did not work for {}'.format(variable + "_rel_diff"))
-            pass
-        table.sort(columns = variable + "_rel_diff", ascending = False, inplace = True)
+        log.info('Length of merged ménages data frame is {}'.format(len(self.household_differences)))
+        log.info(format_differences_report(self.differences_report, self.top_households_by_variable))
 
-        print table.to_string()
+        columns = ['idmen', weight] + [variable + suffix for suffix in DIFFERENCE_SUFFIXES]
+        table = self.household_differences[columns]
+        table = table[(table[variable + '_erf'] != 0) & (table[variable + '_of'] != 0)].copy()
+        table.sort(columns = variable + "_rel_diff", ascending = False, inplace = True)
         return table
 
     def describe_discrepancies(self, fov = 10, consumers = False, parameters = True, descending = True, to_men = False):
         variable = self.variable
-        major_differences_data_frame = self.get_major_differences()
+        major_differences_data_frame = self.get_major_differences(top = fov)
         major_differences_data_frame.sort(
             columns = self.variable + "_rel_diff",
             ascending = not descending,
@@ -348,7 +375,7 @@ class Debugger(object):
             on = 'idmen',
             )
 
-        suffixes = ["_erf", "_of", "_rel_diff", "_ratio"]
+        suffixes = ["_erf", "_of", "_abs_diff", "_rel_diff", "_ratio", "_contribution"]
         reordered_columns = [variable + suffixe for suffixe in suffixes] \
             + ["idmen", "quimen", "idfam", "quifam", "idfoy", "quifoy"]
         reordered_columns = reordered_columns + list(set(kept_columns) - set(reordered_columns))
@@ -23,7 +23,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import logging
+
+from pandas import DataFrame
+
+
+log = logging.getLogger(__name__)
+
+_erf2of = None
+_of2erf = None
+erf_variables_index_by_year = dict()
+
+
 def get_of2erf(year=None):
+    global _of2erf
+    if _of2erf is not None:
+        return dict(_of2erf)
     of2erf = dict()
     of2erf["csg"] = "csgim"  # imposable, et "csgdm", déductible
 #of2erf["csgd"] = "csgdm"
@@ -54,10 +69,100 @@ def get_of2erf(year=None):
     of2erf["alf"] = "m_alfm"
     of2erf["als"] = "m_alsm"
     of2erf["apl"] = "m_aplm"
-    return of2erf
+    _of2erf = of2erf
+    return dict(of2erf)
 
 
 def get_erf2of():
-    of2erf = get_of2erf()
-    erf2of = dict((v,k) for k, v in of2erf.iteritems())
-    return erf2of
+    global _erf2of
+    if _erf2of is None:
+        of2erf = get_of2erf()
+        _erf2of = dict((v,k) for k, v in of2erf.iteritems())
+    return dict(_erf2of)
+
+
+def get_erf_survey(year):
+    from openfisca_survey_manager.surveys import SurveyCollection
+    erfs_survey_collection = SurveyCollection.load(collection = "erfs")
+    return erfs_survey_collection.surveys["erfs_{}".format(year)]
+
+
+def build_erf_variables_index(year):
+    """
+    Builds the DataFrame of all the columns of the tables of the ERFS survey of year with their table and dtype
+
+    Columns are variable (OpenFisca name when the ERF column has an OpenFisca counterpart), erf_variable, table and
+    dtype. Tables are read one at a time through the survey, so the columns are named as by survey.get_values, and
+    only their dtypes are kept.
+    """
+    erf_survey = get_erf_survey(year)
+    erf2of = get_erf2of()
+    rows = list()
+    for table in sorted(erf_survey.tables):
+        log.info("Indexing columns of table {} of erfs {}".format(table, year))
+        dtypes = erf_survey.get_values(table = table).dtypes
+        for erf_variable, dtype in dtypes.iteritems():
+            rows.append(dict(
+                variable = erf2of.get(erf_variable, erf_variable),
+                erf_variable = erf_variable,
+                table = table,
+                dtype = str(dtype),
+                ))
+    return DataFrame(rows, columns = ['variable', 'erf_variable', 'table', 'dtype'])
+
+
+def get_erf_variables_index(year, force_rebuild = False):
+    """
+    Returns the index of the ERFS columns of year, a dict mapping OpenFisca and ERF variable names to the list of
+    (table, erf_variable, dtype) where they can be found
+
+    The index is built once by year and persisted in a temporary store.
+    """
+    if not force_rebuild and year in erf_variables_index_by_year:
+        return erf_variables_index_by_year[year]
+    from openfisca_france_data.temporary import TemporaryStore
+    store_key = "erf_variables_index_{}".format(year)
+    temporary_store = TemporaryStore.create(file_name = "erf_variables_index")
+    try:
+        if force_rebuild or store_key not in temporary_store:
+            temporary_store[store_key] = build_erf_variables_index(year)
+        index_data_frame = temporary_store[store_key]
+    finally:
+        temporary_store.close()
+
+    locations_by_variable = dict()
+    for variable, erf_variable, table, dtype in index_data_frame[['variable', 'erf_variable', 'table', 'dtype']].values:
+        location = (table, erf_variable, dtype)
+        locations_by_variable.setdefault(variable, list()).append(location)
+        if erf_variable != variable:
+            locations_by_variable.setdefault(erf_variable, list()).append(location)
+    erf_variables_index_by_year[year] = locations_by_variable
+    return locations_by_variable
+
+
+def get_erf_data_frame_by_table(variables = None, year = None, tables = None):
+    """
+    Returns a dict by table of the DataFrames of variables (OpenFisca or ERF names) found in the ERFS tables of year
+
+    Columns are renamed with OpenFisca names. Each table is read once. tables restricts the tables to search.
+    """
+    assert variables is not None and year is not None
+    locations_by_variable = get_erf_variables_index(year)
+    erf_variables_by_table = dict()
+    for variable in variables:
+        locations = locations_by_variable.get(variable)
+        if not locations:
+            log.info("No tables are present for variable {}".format(variable))
+            continue
+        for table, erf_variable, _ in locations:
+            if tables is None or table in tables:
+                erf_variables_by_table.setdefault(table, set()).add(erf_variable)
+
+    erf_survey = get_erf_survey(year)
+    erf2of = get_erf2of()
+    data_frame_by_table = dict()
+    for table, erf_variables in erf_variables_by_table.iteritems():
+        data_frame = erf_survey.get_values(variables = sorted(erf_variables), table = table)
+        data_frame.rename(columns = erf2of, inplace = True)
+        data_frame_by_table[table] = data_frame
+    return data_frame_by_table
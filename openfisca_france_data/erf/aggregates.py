@@ -27,50 +27,69 @@ import logging
 
 
 from openfisca_survey_manager.surveys import SurveyCollection
-from openfisca_france_data.erf import get_of2erf, get_erf2of
+from openfisca_france_data.aggregates import compute_weighted_aggregates
+from openfisca_france_data.erf import get_erf_variables_index, get_of2erf
+from openfisca_france_data.temporary import TemporaryStore
 import numpy as np
+from pandas import DataFrame
 
 
 log = logging.getLogger(__name__)
 
 
-def build_erf_aggregates(variables = None, year = 2006, unit = 1e6):
+def build_erf_aggregates(variables = None, year = 2006, unit = 1e6, force_recompute = False):
     """
     Fetch the relevant aggregates from erf data
+
+    Returns a DataFrame indexed by the OpenFisca names of variables of the weighted amounts (in unit), beneficiaries
+    and means of their ERF counterparts. The aggregates of all the variables having an ERF counterpart are computed
+    in one pass and cached by year in a temporary store.
+    """
+    store_key = "erf_aggregates_{}".format(year)
+    temporary_store = TemporaryStore.create(file_name = "erf_aggregates")
+    try:
+        if force_recompute or store_key not in temporary_store:
+            temporary_store[store_key] = compute_erf_aggregates(year = year)
+        aggregates = temporary_store[store_key]
+    finally:
+        temporary_store.close()
+
+    aggregates = aggregates.copy()
+    aggregates['amount'] = aggregates['amount'] / unit
+    if variables is None:
+        return aggregates
+    return aggregates.reindex(variables)
+
+
+def compute_erf_aggregates(year = 2006):
+    """
+    Computes the weighted amounts, beneficiaries and means of all the ERF ménage variables of year mapped to OpenFisca
+    ones
     """
     erfs_survey_collection = SurveyCollection.load(collection = "erfs")
     erfs_survey = erfs_survey_collection.surveys["erfs_{}".format(year)]
-
-
-    of2erf = get_of2erf()
-    erf2of = get_erf2of()
-
-    if set(variables) <= set(of2erf.keys()):
-        variables = [ of2erf[variable] for variable in variables]
-
-    if variables is not None and "wprm" not in variables:
-        variables.append("wprm")
+    variable_by_erf_variable = dict(
+        (erf_variable, variable) for variable, erf_variable in get_of2erf().iteritems() if erf_variable)
+    # Some ERF variables only exist in some years: only the columns of erf_menage of year are read
+    locations_by_variable = get_erf_variables_index(year)
+    erf_variables = sorted(
+        erf_variable
+        for erf_variable in variable_by_erf_variable
+        if any(table == "erf_menage" for table, _, _ in locations_by_variable.get(erf_variable, []))
+        )
+    missing_erf_variables = sorted(set(variable_by_erf_variable) - set(erf_variables))
+    if missing_erf_variables:
+        log.info("Variables {} are not in table erf_menage of erfs {}: their aggregates are missing".format(
+            missing_erf_variables, year))
     log.info("Fetching aggregates from erfs {} data".format(year))
-
-
-    df = erfs_survey.get_values(variables = variables, table = "erf_menage")
-
-
-    df.rename(columns = erf2of, inplace = True)
-    wprm = df["wprm"]
-    for col in df.columns:
-        try:
-            df[col] = df[col].astype(np.float64)
-        except:
-            pass
-    df = df.mul(wprm, axis = 0)
-    for col in list(set(df.columns) - set(['ident', 'wprm'])):
-        try:
-            df[col] = df[col].sum()/1e6
-        except:
-            pass
-
-    return df.ix[0:1] # Aggregate so we only need 1 row
+    data_frame = erfs_survey.get_values(variables = erf_variables + ["wprm"], table = "erf_menage")
+    values = data_frame[erf_variables].values.astype(np.float64).T
+    amount, beneficiaries, mean = compute_weighted_aggregates(values, data_frame["wprm"].values.astype(np.float64))
+    return DataFrame(
+        dict(amount = amount, beneficiaries = beneficiaries, mean = mean),
+        columns = ['amount', 'beneficiaries', 'mean'],
+        index = [variable_by_erf_variable[erf_variable] for erf_variable in erf_variables],
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Hot-deck imputation: weighted random donors within donation classes and nearest neighbour distance hot-deck (as
+the RANDwNND.hotdeck and NND.hotdeck functions of the R package StatMatch)"""
+
+
+from __future__ import division
+
+import logging
+
+import numpy
+import pandas
+from scipy.spatial import cKDTree
+
+
+log = logging.getLogger(__name__)
+
+
+def get_class_codes(recipients, donors, don_class = None):
+    """
+    Returns the integer codes of the donation classes of the recipients and of the donors
+
+    Recipients whose class has no donor get the code -1.
+    """
+    if not don_class:
+        recipient_codes = numpy.zeros(len(recipients), dtype = int) if len(donors) else - numpy.ones(len(recipients),
+            dtype = int)
+        return recipient_codes, numpy.zeros(len(donors), dtype = int)
+    codes = numpy.zeros(len(donors) + len(recipients), dtype = numpy.int64)
+    for variable in don_class:
+        variable_codes, uniques = pandas.factorize(
+            numpy.concatenate([donors[variable].values, recipients[variable].values])
+            )
+        codes = codes * (len(uniques) + 1) + variable_codes + 1
+        codes = pandas.factorize(codes)[0]
+    donor_codes = codes[:len(donors)]
+    recipient_codes = codes[len(donors):]
+    has_donor = numpy.zeros(codes.max() + 1 if len(codes) else 0, dtype = bool)
+    has_donor[donor_codes] = True
+    recipient_codes = numpy.where(has_donor[recipient_codes], recipient_codes, -1)
+    return recipient_codes, donor_codes
+
+
+def random_hotdeck(recipients, donors, don_class = None, weight = None, seed = None):
+    """
+    Draws a random donor in the donation class of each recipient
+
+    Parameters
+    ----------
+    recipients, donors : DataFrame
+        Recipients and donors, both with the don_class variables
+    don_class : list, default None
+        Variables defining the donation classes (a single class when None)
+    weight : str, default None
+        Variable of donors giving the probability of each donor to be drawn (uniform when None)
+    seed : int, default None
+        Seed of the random generator
+
+    Returns
+    -------
+    The positions in donors of the donors of each recipient (-1 when the class of the recipient has no donor)
+    """
+    random_state = numpy.random.RandomState(seed)
+    recipient_codes, donor_codes = get_class_codes(recipients, donors, don_class)
+    if weight is None:
+        donor_weights = numpy.ones(len(donors))
+    else:
+        donor_weights = donors[weight].values.astype(float)
+    assert (donor_weights >= 0).all(), "Donor weights must be non negative"
+
+    # Donors sorted by class: each class is a bucket of the cumulated weights
+    order = numpy.argsort(donor_codes, kind = 'mergesort')
+    sorted_codes = donor_codes[order]
+    cumulated_weights = numpy.cumsum(donor_weights[order])
+    class_count = donor_codes.max() + 1 if len(donors) else 0
+    first = numpy.searchsorted(sorted_codes, numpy.arange(class_count), side = 'left')
+    last = numpy.searchsorted(sorted_codes, numpy.arange(class_count), side = 'right')
+    start_weights = numpy.where(first > 0, cumulated_weights[numpy.maximum(first - 1, 0)], 0)
+    class_weights = cumulated_weights[numpy.maximum(last - 1, 0)] - start_weights
+
+    matched = recipient_codes >= 0
+    donor_positions = numpy.empty(len(recipients), dtype = int)
+    donor_positions.fill(-1)
+    codes = recipient_codes[matched]
+    draws = start_weights[codes] + random_state.uniform(size = len(codes)) * class_weights[codes]
+    sorted_positions = numpy.searchsorted(cumulated_weights, draws, side = 'right')
+    # Guard against rounding at the upper bound of a bucket
+    sorted_positions = numpy.clip(sorted_positions, first[codes], last[codes] - 1)
+    donor_positions[matched] = order[sorted_positions]
+    log_unmatched(recipient_codes)
+    return donor_positions
+
+
+def nnd_hotdeck(recipients, donors, match_vars, don_class = None, dist_fun = 'Gower', weight = None, k = 10,
+        seed = None):
+    """
+    Finds for each recipient the nearest donor of its donation class on the matching variables
+
+    Parameters
+    ----------
+    recipients, donors : DataFrame
+        Recipients and donors, both with the match_vars and don_class variables
+    match_vars : list
+        Numeric matching variables
+    don_class : list, default None
+        Variables defining the donation classes (a single class when None)
+    dist_fun : str, default 'Gower'
+        'Gower' (mean of the absolute differences divided by the ranges of the variables), 'Manhattan' or 'Euclidean'
+    weight : str, default None
+        Variable of donors giving the probability of each of the nearest donors at equal distance to be chosen
+    k : int, default 10
+        Number of nearest donors searched first for ties, doubled until all the donors at the minimal distance are found
+    seed : int, default None
+        Seed of the random generator used to break ties
+
+    Returns
+    -------
+    (donor_positions, distances) the positions in donors of the donors of each recipient (-1 when the class of the
+    recipient has no donor or when a matching variable of the recipient is missing) and the distances between the
+    recipients and their donors
+
+    Donors with a missing matching variable are never drawn.
+    """
+    assert dist_fun in ['Gower', 'Manhattan', 'Euclidean'], "Unknown distance {}".format(dist_fun)
+    assert k >= 1
+    random_state = numpy.random.RandomState(seed)
+    recipient_values = recipients[match_vars].values.astype(float)
+    donor_values = donors[match_vars].values.astype(float)
+    # Rows with missing matching values can not be compared: the KD-tree would return out of range neighbours
+    missing_recipients = numpy.isnan(recipient_values).any(axis = 1)
+    missing_donors = numpy.isnan(donor_values).any(axis = 1)
+    if missing_recipients.any():
+        log.info("{} recipients have missing matching values and are not matched".format(missing_recipients.sum()))
+    if missing_donors.any():
+        log.info("{} donors have missing matching values and are discarded".format(missing_donors.sum()))
+    recipient_codes, donor_codes = get_class_codes(recipients, donors, don_class)
+    recipient_codes[missing_recipients] = -1
+    donor_codes[missing_donors] = -1
+    if dist_fun == 'Gower':
+        all_values = numpy.vstack([recipient_values[~missing_recipients], donor_values[~missing_donors]])
+        ranges = all_values.max(axis = 0) - all_values.min(axis = 0) if len(all_values) else numpy.ones(
+            len(match_vars))
+        ranges[ranges == 0] = 1
+        recipient_values = recipient_values / (ranges * len(match_vars))
+        donor_values = donor_values / (ranges * len(match_vars))
+    p = 2 if dist_fun == 'Euclidean' else 1
+    donor_weights = None if weight is None else donors[weight].values.astype(float)
+
+    donor_positions = numpy.empty(len(recipients), dtype = int)
+    donor_positions.fill(-1)
+    distances = numpy.empty(len(recipients))
+    distances.fill(numpy.nan)
+    for code in numpy.unique(recipient_codes[recipient_codes >= 0]):
+        recipient_index = numpy.flatnonzero(recipient_codes == code)
+        donor_index = numpy.flatnonzero(donor_codes == code)
+        if len(donor_index) == 0:
+            # All the donors of the class have missing matching values
+            recipient_codes[recipient_index] = -1
+            continue
+        tree = cKDTree(donor_values[donor_index])
+        pending = recipient_index
+        class_k = min(k, len(donor_index))
+        while len(pending):
+            class_distances, neighbours = tree.query(recipient_values[pending], k = class_k, p = p)
+            if class_k == 1:
+                class_distances = class_distances[:, numpy.newaxis]
+                neighbours = neighbours[:, numpy.newaxis]
+            ties = class_distances <= class_distances[:, :1] * (1 + 1e-9) + 1e-12
+            # When the farthest neighbour found is still at the minimal distance, there may be other donors at that
+            # distance: search again more neighbours for these recipients
+            complete = ~ties[:, -1] if class_k < len(donor_index) else numpy.ones(len(pending), dtype = bool)
+            ties = ties[complete]
+            neighbours = neighbours[complete]
+            class_distances = class_distances[complete]
+            # Random choice, proportional to the donor weights, among all the donors at the minimal distance
+            keys = random_state.uniform(size = ties.shape)
+            if donor_weights is not None:
+                neighbour_weights = donor_weights[donor_index][neighbours]
+                keys = numpy.where(neighbour_weights > 0, keys ** (1 / numpy.maximum(neighbour_weights, 1e-300)), 0)
+            chosen = numpy.where(ties, keys, -1).argmax(axis = 1)
+            rows = numpy.arange(len(chosen))
+            donor_positions[pending[complete]] = donor_index[neighbours[rows, chosen]]
+            distances[pending[complete]] = class_distances[rows, chosen]
+            pending = pending[~complete]
+            class_k = min(2 * class_k, len(donor_index))
+    log_unmatched(recipient_codes)
+    return donor_positions, distances
+
+
+def widened_random_hotdeck(recipients, donors, don_classes, weight = None, seed = None):
+    """
+    Draws a random donor of each recipient in the first of the successively wider donation classes that has donors
+
+    Parameters
+    ----------
+    recipients, donors : DataFrame
+        Recipients and donors, both with the variables of all the don_classes
+    don_classes : list
+        Donation classes (lists of variables, or None for a single class) from the narrowest to the widest
+    weight : str, default None
+        Variable of donors giving the probability of each donor to be drawn (uniform when None)
+    seed : int, default None
+        Seed of the random generator
+
+    Returns
+    -------
+    The positions in donors of the donors of each recipient (-1 when no class of the recipient has a donor)
+    """
+    donor_positions = numpy.empty(len(recipients), dtype = int)
+    donor_positions.fill(-1)
+    for don_class in don_classes:
+        unmatched = numpy.flatnonzero(donor_positions < 0)
+        if len(unmatched) == 0:
+            break
+        donor_positions[unmatched] = random_hotdeck(
+            recipients.iloc[unmatched], donors, don_class = don_class, weight = weight, seed = seed)
+    return donor_positions
+
+
+def create_fused(recipients, donors, donor_positions, z_vars):
+    """
+    Returns a copy of recipients with the z_vars variables of their donors (missing when they have no donor)
+    """
+    fused = recipients.copy()
+    matched = donor_positions >= 0
+    for variable in z_vars:
+        values = donors[variable].values
+        fused_values = numpy.empty(len(recipients), dtype = float if values.dtype.kind in 'biuf' else object)
+        fused_values.fill(numpy.nan)
+        fused_values[matched] = values[donor_positions[matched]]
+        fused[variable] = fused_values
+    return fused
+
+
+def log_unmatched(recipient_codes):
+    unmatched = (recipient_codes < 0).sum()
+    if unmatched:
+        log.info("{} recipients have no donor in their donation class".format(unmatched))
@@ -25,7 +25,8 @@
 import os
 
 from numpy import array
-from pandas import ExcelFile
+
+from openfisca_france_data.assets import read_excel
 
 
 current_dir = os.path.dirname(os.path.realpath(__file__))
@@ -39,7 +40,7 @@ def build_ipp2of_variables():
     et les arguments ceux des variables OF
     '''
     def _dic_corresp(onglet):
-        names = ExcelFile(variables_corresp).parse(onglet)
+        names = read_excel(variables_corresp, onglet)
         return dict(array(names.loc[names['equivalence'].isin([1, 5, 8]), ['Var_TAXIPP', 'Var_OF']]))
 
     ipp2of_input_variables = _dic_corresp('input')
@@ -24,15 +24,16 @@
 
 
 import logging
+import multiprocessing
 import os
-import pandas
+import time
 
 from openfisca_survey_manager.survey_collections import SurveyCollection
 from openfisca_survey_manager.surveys import Survey
 from openfisca_france_data import default_config_files_directory as config_files_directory
 
 from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.utils \
-    import find_nearest_inferior
+    import assemble_data_frames, find_nearest_inferior
 
 from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.step_0_1_1_homogeneisation_donnees_depenses \
     import build_depenses_homogenisees
@@ -59,51 +60,53 @@ log = logging.getLogger(__name__)
 from openfisca_france_data.temporary import TemporaryStore
 
 
-def run_all(year_calage = 2011, year_data_list = [1995, 2000, 2005, 2011]):
-
-    temporary_store = TemporaryStore.create(file_name = "indirect_taxation_tmp")
-
-    # Quelle base de données choisir pour le calage ?
-    year_data = find_nearest_inferior(year_data_list, year_calage)
-
+def homogeneize_year_data(year_data):
+    '''
+    Homogénéise les données de l'enquête budget des familles de year_data (étapes communes à toutes les années de
+    calage)
+    '''
     # 4 étape parallèles d'homogénéisation des données sources :
     # Gestion des dépenses de consommation:
     build_depenses_homogenisees(year = year_data)
     build_imputation_loyers_proprietaires(year = year_data)
 
-    build_depenses_calees(year_calage, year_data)
-    build_menage_consumption_by_categorie_fiscale(year_calage, year_data)
-    categorie_fiscale_data_frame = temporary_store["menage_consumption_by_categorie_fiscale_{}".format(year_calage)]
-    depenses_calees_by_grosposte = temporary_store["depenses_calees_by_grosposte_{}".format(year_calage)]
-    depenses_calees = temporary_store["depenses_calees_{}".format(year_calage)]
-
     # Gestion des véhicules:
     build_homogeneisation_vehicules(year = year_data)
-    if year_calage != 1995:
-        vehicule = temporary_store['automobile_{}'.format(year_data)]
-    else:
-        vehicule = None
 
     # Gestion des variables socio démographiques:
     build_homogeneisation_caracteristiques_sociales(year = year_data)
-    menage = temporary_store['donnes_socio_demog_{}'.format(year_data)]
 
     # Gestion des variables revenus:
     build_homogeneisation_revenus_menages(year = year_data)
+
+
+def build_survey(year_calage, year_data):
+    '''
+    Cale les données homogénéisées de year_data sur year_calage et les sauve dans le survey
+    openfisca_indirect_taxation_data_{year_calage}, qui est renvoyé (sans être ajouté à la collection)
+    '''
+    build_depenses_calees(year_calage, year_data)
+    build_menage_consumption_by_categorie_fiscale(year_calage, year_data)
     build_revenus_cales(year_calage, year_data)
-    revenus = temporary_store["revenus_cales_{}".format(year_calage)]
 
-    temporary_store.close()
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp", mode = 'r') as temporary_store:
+        categorie_fiscale_data_frame = temporary_store[
+            "menage_consumption_by_categorie_fiscale_{}".format(year_calage)
+            ]
+        depenses_calees_by_grosposte = temporary_store["depenses_calees_by_grosposte_{}".format(year_calage)]
+        depenses_calees = temporary_store["depenses_calees_{}".format(year_calage)]
+        if year_data != 1995:
+            vehicule = temporary_store['automobile_{}'.format(year_data)]
+        else:
+            vehicule = None
+        menage = temporary_store['donnes_socio_demog_{}'.format(year_data)]
+        revenus = temporary_store["revenus_cales_{}".format(year_calage)]
 
     # DataFrame résultant de ces 4 étapes
-    data_frame = pandas.concat(
-        [revenus, vehicule, categorie_fiscale_data_frame, menage, depenses_calees, depenses_calees_by_grosposte], axis = 1)
-
-    if year_data != 1995:
-        data_frame.veh_tot = data_frame.veh_tot.fillna(0)
-        data_frame.veh_essence = data_frame.veh_essence.fillna(0)
-        data_frame.veh_diesel = data_frame.veh_diesel.fillna(0)
-        data_frame.pourcentage_vehicule_essence = data_frame.pourcentage_vehicule_essence.fillna(0)
+    data_frame = assemble_data_frames(
+        [revenus, vehicule, categorie_fiscale_data_frame, menage, depenses_calees, depenses_calees_by_grosposte]
+        )
+    del revenus, vehicule, categorie_fiscale_data_frame, menage, depenses_calees, depenses_calees_by_grosposte
 
     data_frame.index.name = "ident_men"
     # TODO: Homogénéiser: soit faire en sorte que ident_men existe pour toutes les années
@@ -113,12 +116,6 @@ def run_all(year_calage = 2011, year_data_list = [1995, 2000, 2005, 2011]):
     except ValueError, e:
         print "ignoring reset_index because \n" + str(e)
 
-    # Remove duplicated colums causing bug with HDFStore
-    # according to https://github.com/pydata/pandas/issues/6240
-    # using solution form stackoverflow
-    # http://stackoverflow.com/questions/16938441/how-to-remove-duplicate-columns-from-a-dataframe-using-python-pandas
-    data_frame = data_frame.T.groupby(level = 0).first().T
-
     # Saving the data_frame
     openfisca_survey_collection = SurveyCollection.load(
         collection = 'openfisca_indirect_taxation', config_files_directory = config_files_directory)
@@ -132,21 +129,62 @@ def run_all(year_calage = 2011, year_data_list = [1995, 2000, 2005, 2011]):
         hdf5_file_path = hdf5_file_path,
         )
     survey.insert_table(name = table, data_frame = data_frame)
-    openfisca_survey_collection.surveys.append(survey)
+    return survey
+
+
+def build_survey_job(job):
+    year_calage, year_data = job
+    start = time.time()
+    survey = build_survey(year_calage, year_data)
+    log.info("Base construite pour l'année {} à partir de l'enquête bdf {} en {:.0f}s".format(
+        year_calage, year_data, time.time() - start))
+    return survey
+
+
+def run_all_years(years_calage, year_data_list = [1995, 2000, 2005, 2011], processes = None):
+    '''
+    Construit les bases de toutes les années de calage years_calage
+
+    Chaque enquête budget des familles n'est homogénéisée qu'une fois, séquentiellement, puis les calages des années
+    qui l'utilisent sont faits, dans un pool de processes quand processes n'est pas None. Seuls les calculs des calages
+    tournent en parallèle : les lectures du temporary store partagent son verrou, mais chaque écriture le prend
+    exclusivement et attend les autres sessions, et chaque étape ne l'ouvre que le temps de lire ses données et
+    d'écrire ses résultats. Une erreur dans un calage libère le verrou et est relevée par pool.map. Un survey est sauvé
+    par année de calage.
+    '''
+    year_data_by_year_calage = dict(
+        (year_calage, find_nearest_inferior(year_data_list, year_calage)) for year_calage in years_calage
+        )
+    for year_data in sorted(set(year_data_by_year_calage.values())):
+        homogeneize_year_data(year_data)
+
+    jobs = sorted(year_data_by_year_calage.iteritems())
+    if processes is None:
+        surveys = [build_survey_job(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes = processes)
+        try:
+            surveys = pool.map(build_survey_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    openfisca_survey_collection = SurveyCollection.load(
+        collection = 'openfisca_indirect_taxation', config_files_directory = config_files_directory)
+    for survey in surveys:
+        openfisca_survey_collection.surveys.append(survey)
     openfisca_survey_collection.dump()
 
 
+def run_all(year_calage = 2011, year_data_list = [1995, 2000, 2005, 2011]):
+    run_all_years([year_calage], year_data_list)
+
+
 if __name__ == '__main__':
-    import time
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
     year_calage = 2011
     year_data_list = [1995, 2000, 2005, 2011]
     run_all(year_calage, year_data_list)
-    #
-    #
-    #    for year_calage in [2000, 2001, 2002, 2003, 2004]:
-    #        start = time.time()
-    #        run_all(year_calage, year_data_list)
-    #        log.info("{}".format(time.time() - start))
-    #        print "Base construite pour l'année {} à partir de l'enquête bdf {}".format(
-    #            year_calage, find_nearest_inferior(year_data_list, year_calage)
-    #            )
+    # Bases de toutes les années de calage de 2000 à 2011:
+    #    run_all_years(range(2000, 2012), year_data_list, processes = 4)
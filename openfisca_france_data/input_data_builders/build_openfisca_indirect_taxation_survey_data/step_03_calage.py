@@ -29,27 +29,26 @@ import logging
 
 from ConfigParser import SafeConfigParser
 
+import numpy
 import pandas
 
 log = logging.getLogger(__name__)
 
 from openfisca_france_data import default_config_files_directory as config_files_directory
+from openfisca_france_data.assets import read_excel
 from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.step_0_1_1_homogeneisation_donnees_depenses \
-    import normalize_coicop
+    import select_gros_postes
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.utils import (
+    aggregate_columns, get_aggregation_matrix)
 
 from openfisca_france_data.temporary import TemporaryStore
-temporary_store = TemporaryStore.create(file_name = "indirect_taxation_tmp")
 
 
 def calage_viellissement_depenses(year_data, year_calage, depenses, masses):
-    depenses_calees = pandas.DataFrame()
-    coicop_list = set(depenses.columns)
-    # print coicop_list
-    coicop_list.remove('pondmen')
-    for column in coicop_list:
-        coicop = normalize_coicop(column)
-        grosposte = int(coicop[0:2])
-#        print column, coicop, grosposte
+    '''
+    Applique à chaque colonne de dépenses les ratios de calage et de vieillissement de son gros poste.
+    Les postes 99 (impôts, taxes, loyers...) ne sont pas conservés.
+    '''
 # RAPPEL : 12 postes CN et COICOP
 #    01 Produits alimentaires et boissons non alcoolisées
 #    02 Boissons alcoolisées et tabac
@@ -63,14 +62,30 @@ def calage_viellissement_depenses(year_data, year_calage, depenses, masses):
 #    10 Education
 #    11 Hotels, cafés, restaurants
 #    12 Biens et services divers
-        if grosposte != 99:
-           # print 'grosposte: ', grosposte
-           # print masses
-            ratio_bdf_cn = masses.at[grosposte, 'ratio_bdf{}_cn{}'.format(year_data, year_data)]
-            ratio_cn_cn = masses.at[grosposte, 'ratio_cn{}_cn{}'.format(year_data, year_calage)]
-            depenses_calees[column] = depenses[column] * ratio_bdf_cn * ratio_cn_cn
-#            print 'Pour le grosposte {}, le ratio de calage de la base bdf {} sur la cn est {}, le ratio de calage sur la cn pour l\'annee {} est {}'.format(grosposte, year_data, ratio_bdf_cn, year_calage,ratio_cn_cn)
-    return depenses_calees
+    coicop_list = [column for column in depenses.columns if column != 'pondmen']
+    matrix, grospostes = get_aggregation_matrix(
+        'grosposte_by_coicop_bdf_{}'.format(year_data),
+        coicop_list,
+        select_gros_postes,
+        )
+    ratio_by_grosposte = (
+        masses['ratio_bdf{}_cn{}'.format(year_data, year_data)] * masses['ratio_cn{}_cn{}'.format(year_data, year_calage)]
+        )
+    kept_grospostes = numpy.array([grosposte != 99 for grosposte in grospostes], dtype = float)
+    missing_grospostes = [
+        grosposte for grosposte in grospostes if grosposte != 99 and grosposte not in ratio_by_grosposte.index
+        ]
+    assert not missing_grospostes, "Missing calage ratios for grospostes {}".format(missing_grospostes)
+    ratio_by_grosposte = ratio_by_grosposte.reindex(grospostes).fillna(0).values
+    # Ratio et indicatrice de conservation de chaque colonne
+    ratios = matrix.dot(ratio_by_grosposte)
+    kept = matrix.dot(kept_grospostes).astype(bool)
+    coicop_list = [coicop for coicop, keep in zip(coicop_list, kept) if keep]
+    return pandas.DataFrame(
+        depenses[coicop_list].values * ratios[kept],
+        index = depenses.index,
+        columns = coicop_list,
+        )
 
 
 def calcul_ratios_calage(year_data, year_calage, data_bdf, data_cn):
@@ -100,20 +115,14 @@ def get_bdf_data_frames(year_data):
     Fonction qui récupère les dépenses de budget des familles
     et les agrège par poste (en tenant compte des poids respectifs des ménages)
     '''
-    depenses_by_grosposte = temporary_store.extract('depenses_by_grosposte_{}'.format(year_data))
-    grospostes_list = set(depenses_by_grosposte.columns)
-    grospostes_list.remove('pondmen')
-
-    dict_bdf_weighted_sum_by_grosposte = {}
-    for grosposte in grospostes_list:
-        depenses_by_grosposte['{}pond'.format(grosposte)] = (
-            depenses_by_grosposte[grosposte] * depenses_by_grosposte['pondmen']
-            )
-        dict_bdf_weighted_sum_by_grosposte[grosposte] = depenses_by_grosposte['{}pond'.format(grosposte)].sum()
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp", mode = 'r') as temporary_store:
+        depenses_by_grosposte = temporary_store.extract('depenses_by_grosposte_{}'.format(year_data))
+    grospostes_list = [grosposte for grosposte in depenses_by_grosposte.columns if grosposte != 'pondmen']
+    weighted_sums = depenses_by_grosposte[grospostes_list].values.T.dot(depenses_by_grosposte['pondmen'].values)
     df_bdf_weighted_sum_by_grosposte = pandas.DataFrame(
         pandas.Series(
-            data = dict_bdf_weighted_sum_by_grosposte,
-            index = dict_bdf_weighted_sum_by_grosposte.keys()
+            data = weighted_sums,
+            index = grospostes_list,
             )
         )
     return df_bdf_weighted_sum_by_grosposte
@@ -134,7 +143,7 @@ def get_cn_data_frames(year_data = None, year_calage = None):
         )
 
     parametres_fiscalite_file_path = os.path.join(directory_path, "Parametres fiscalite indirecte.xls")
-    masses_cn_data_frame = pandas.read_excel(parametres_fiscalite_file_path, sheetname = "consommation_CN")
+    masses_cn_data_frame = read_excel(parametres_fiscalite_file_path, sheetname = "consommation_CN")
     if year_data != year_calage:
         masses_cn_12postes_data_frame = masses_cn_data_frame[['Code', year_data, year_calage]]
     else:
@@ -182,28 +191,16 @@ def build_depenses_calees(year_calage, year_data):
         )
 
     # Application des ratios de calage
-    depenses = temporary_store['depenses_bdf_{}'.format(year_data)]
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp", mode = 'r') as temporary_store:
+        depenses = temporary_store['depenses_bdf_{}'.format(year_data)]
     depenses_calees = calage_viellissement_depenses(year_data, year_calage, depenses, masses)
-    temporary_store['depenses_calees_{}'.format(year_calage)] = depenses_calees
-
-    ###
-    def select_gros_postes(coicop):
-        try:
-            coicop = unicode(coicop)
-        except:
-            coicop = coicop
-        normalized_coicop = normalize_coicop(coicop)
-        grosposte = normalized_coicop[0:2]
-        return int(grosposte)
-
-    grospostes = [
-        select_gros_postes(coicop)
-        for coicop in depenses_calees.columns
-        ]
-    tuples_gros_poste = zip(depenses_calees.columns, grospostes)
-    depenses_calees.columns = pandas.MultiIndex.from_tuples(tuples_gros_poste, names=['coicop', 'grosposte'])
 
-    depenses_calees_by_grosposte = depenses_calees.groupby(level = 1, axis = 1).sum()
+    matrix, grospostes = get_aggregation_matrix(
+        'grosposte_by_coicop_calees_{}'.format(year_calage),
+        depenses_calees.columns,
+        select_gros_postes,
+        )
+    depenses_calees_by_grosposte = aggregate_columns(depenses_calees, matrix, grospostes)
 
     column_groposte = [
         'coicop12_{}'.format(column)
@@ -211,8 +208,10 @@ def build_depenses_calees(year_calage, year_data):
         ]
     depenses_calees_by_grosposte.columns = column_groposte
 
-    # Sauvegarde de la base en coicop agrégée calée
-    temporary_store['depenses_calees_by_grosposte_{}'.format(year_calage)] = depenses_calees_by_grosposte
+    # Sauvegarde de la base calée et de la base en coicop agrégée calée
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+        temporary_store['depenses_calees_{}'.format(year_calage)] = depenses_calees
+        temporary_store['depenses_calees_by_grosposte_{}'.format(year_calage)] = depenses_calees_by_grosposte
 
 
 def build_revenus_cales(year_calage, year_data):
@@ -229,7 +228,7 @@ def build_revenus_cales(year_calage, year_data):
         )
 
     parametres_fiscalite_file_path = os.path.join(directory_path, "Parametres fiscalite indirecte.xls")
-    masses_cn_revenus_data_frame = pandas.read_excel(parametres_fiscalite_file_path, sheetname = "revenus_CN")
+    masses_cn_revenus_data_frame = read_excel(parametres_fiscalite_file_path, sheetname = "revenus_CN")
 
 # ne pas oublier d'enlever l'accent à "loyers imputés" dans le document excel Parametres fiscalité indirecte
 
@@ -244,8 +243,8 @@ def build_revenus_cales(year_calage, year_data):
 
     masses_cn_revenus_data_frame = masses_cn_revenus_data_frame[masses_cn_revenus_data_frame.year == year_calage]
 
-    revenus = temporary_store['revenus_{}'.format(year_data)]
-
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp", mode = 'r') as temporary_store:
+        revenus = temporary_store['revenus_{}'.format(year_data)]
 
     weighted_sum_revenus = (revenus.pondmen * revenus.rev_disponible).sum()
 
@@ -267,7 +266,8 @@ def build_revenus_cales(year_calage, year_data):
     revenus_cales.loyer_impute = revenus_cales.loyer_impute * revenus_cales['ratio_loyer_impute']
     revenus_cales.rev_disp_loyerimput = revenus_cales.rev_disponible + revenus_cales.loyer_impute
 
-    temporary_store['revenus_cales_{}'.format(year_calage)] = revenus_cales
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+        temporary_store['revenus_cales_{}'.format(year_calage)] = revenus_cales
 
 
 
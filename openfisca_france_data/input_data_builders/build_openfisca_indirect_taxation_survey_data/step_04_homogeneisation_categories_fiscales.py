@@ -28,22 +28,21 @@ import os
 
 
 import logging
-import pandas
 from ConfigParser import SafeConfigParser
 
 from openfisca_france_data import default_config_files_directory as config_files_directory
+from openfisca_france_data.assets import read_excel
 from openfisca_france_data.temporary import TemporaryStore
 
 from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.step_0_1_1_homogeneisation_donnees_depenses \
     import normalize_coicop
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.utils import (
+    aggregate_columns, get_aggregation_matrix)
 
 
 log = logging.getLogger(__name__)
 
 
-temporary_store = TemporaryStore.create(file_name = "indirect_taxation_tmp")
-
-
 def build_menage_consumption_by_categorie_fiscale(year_calage = None, year_data = None):
     """Build menage consumption by categorie fiscale dataframe """
 
@@ -55,7 +54,8 @@ def build_menage_consumption_by_categorie_fiscale(year_calage = None, year_data
         get_transfert_data_frames(year = year_data)
 
     # Load data
-    coicop_data_frame = temporary_store.extract('depenses_calees_{}'.format(year_calage))
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp", mode = 'r') as temporary_store:
+        coicop_data_frame = temporary_store.extract('depenses_calees_{}'.format(year_calage))
 
     # Grouping by categorie_fiscale
     selected_parametres_fiscalite_data_frame = \
@@ -79,17 +79,14 @@ def build_menage_consumption_by_categorie_fiscale(year_calage = None, year_data
         assert type(categorie_fiscale_by_coicop[key]) == int
 
     # print categorie_fiscale_by_coicop
-    categorie_fiscale_labels = [
-        categorie_fiscale_by_coicop.get(coicop)
-        for coicop in coicop_data_frame.columns
-        ]
     #TODO: gérer les catégorie fiscales "None" = dépenses énergétiques (4) & tabac (2)
-#    print categorie_fiscale_labels
-    tuples = zip(categorie_fiscale_labels, coicop_data_frame.columns)
-    coicop_data_frame.columns = pandas.MultiIndex.from_tuples(tuples, names=['categoriefiscale', 'coicop'])
-    # print coicop_data_frame.columns
-
-    categorie_fiscale_data_frame = coicop_data_frame.groupby(level = 0, axis = 1).sum()
+    matrix, categories_fiscales = get_aggregation_matrix(
+        'categorie_fiscale_by_coicop_{}_{}'.format(year_data, year_calage),
+        coicop_data_frame.columns,
+        categorie_fiscale_by_coicop.get,
+        correspondance = categorie_fiscale_by_coicop,
+        )
+    categorie_fiscale_data_frame = aggregate_columns(coicop_data_frame, matrix, categories_fiscales)
     rename_columns = dict(
         [(number, "categorie_fiscale_{}".format(number)) for number in categorie_fiscale_data_frame.columns]
         )
@@ -99,7 +96,8 @@ def build_menage_consumption_by_categorie_fiscale(year_calage = None, year_data
         )
     categorie_fiscale_data_frame['role_menage'] = 0
 #    categorie_fiscale_data_frame.reset_index(inplace = True)
-    temporary_store["menage_consumption_by_categorie_fiscale_{}".format(year_calage)] = categorie_fiscale_data_frame
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+        temporary_store["menage_consumption_by_categorie_fiscale_{}".format(year_calage)] = categorie_fiscale_data_frame
 
 
 def get_transfert_data_frames(year = None):
@@ -113,8 +111,8 @@ def get_transfert_data_frames(year = None):
         )
     matrice_passage_file_path = os.path.join(directory_path, "Matrice passage {}-COICOP.xls".format(year))
     parametres_fiscalite_file_path = os.path.join(directory_path, "Parametres fiscalite indirecte.xls")
-    matrice_passage_data_frame = pandas.read_excel(matrice_passage_file_path)
-    parametres_fiscalite_data_frame = pandas.read_excel(parametres_fiscalite_file_path, sheetname = "categoriefiscale")
+    matrice_passage_data_frame = read_excel(matrice_passage_file_path)
+    parametres_fiscalite_data_frame = read_excel(parametres_fiscalite_file_path, sheetname = "categoriefiscale")
     # print parametres_fiscalite_data_frame
     selected_parametres_fiscalite_data_frame = \
         parametres_fiscalite_data_frame[parametres_fiscalite_data_frame.annee == year]
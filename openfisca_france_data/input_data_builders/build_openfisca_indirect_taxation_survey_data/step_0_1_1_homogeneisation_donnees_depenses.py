@@ -26,13 +26,15 @@
 import os
 import logging
 import numpy
-import pandas
 from ConfigParser import SafeConfigParser
 
 
 from openfisca_france_data.temporary import TemporaryStore
 from openfisca_france_data import default_config_files_directory as config_files_directory
+from openfisca_france_data.assets import read_excel
 from openfisca_survey_manager.survey_collections import SurveyCollection
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.utils import (
+    aggregate_columns, get_aggregation_matrix)
 
 
 log = logging.getLogger(__name__)
@@ -40,153 +42,151 @@ log = logging.getLogger(__name__)
 
 def build_depenses_homogenisees(year = None):
     """Build menage consumption by categorie fiscale dataframe """
-    temporary_store = TemporaryStore.create(file_name = "indirect_taxation_tmp")
-    assert year is not None
-    # Load data
-    bdf_survey_collection = SurveyCollection.load(
-        collection = 'budget_des_familles', config_files_directory = config_files_directory
-        )
-    survey = bdf_survey_collection.get_survey('budget_des_familles_{}'.format(year))
-
-
-#		* HOMOGENEISATION DES BASES DE DONNEES DE DEPENSES
-
-# pour 1995
-    if year == 1995:
-        socioscm = survey.get_values(table = "socioscm")
-        poids = socioscm[['mena', 'ponderrd', 'exdep', 'exrev']]
-        # cette étape de ne garder que les données dont on est sûr de la qualité et de la véracité
-        # exdep = 1 si les données sont bien remplies pour les dépenses du ménage
-        # exrev = 1 si les données sont bien remplies pour les revenus du ménage
-        poids = poids[(poids.exdep == 1) & (poids.exrev == 1)]
-        del poids['exdep'], poids['exrev']
-        poids.rename(
-            columns = {
-                'mena': 'ident_men',
-                'ponderrd': 'pondmen',
-                },
-            inplace = True
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+        assert year is not None
+        # Load data
+        bdf_survey_collection = SurveyCollection.load(
+            collection = 'budget_des_familles', config_files_directory = config_files_directory
             )
+        survey = bdf_survey_collection.get_survey('budget_des_familles_{}'.format(year))
+
+
+    #		* HOMOGENEISATION DES BASES DE DONNEES DE DEPENSES
+
+    # pour 1995
+        if year == 1995:
+            socioscm = survey.get_values(table = "socioscm")
+            poids = socioscm[['mena', 'ponderrd', 'exdep', 'exrev']]
+            # cette étape de ne garder que les données dont on est sûr de la qualité et de la véracité
+            # exdep = 1 si les données sont bien remplies pour les dépenses du ménage
+            # exrev = 1 si les données sont bien remplies pour les revenus du ménage
+            poids = poids[(poids.exdep == 1) & (poids.exrev == 1)]
+            del poids['exdep'], poids['exrev']
+            poids.rename(
+                columns = {
+                    'mena': 'ident_men',
+                    'ponderrd': 'pondmen',
+                    },
+                inplace = True
+                )
+            poids.set_index('ident_men', inplace = True)
+
+            conso = survey.get_values(table = "depnom")
+            conso = conso[["valeur", "montant", "mena", "nomen5"]]
+            conso = conso.groupby(["mena", "nomen5"]).sum()
+            conso = conso.reset_index()
+            conso.rename(
+                columns = {
+                    'mena': 'ident_men',
+                    'nomen5': 'poste{}'.format(year),
+                    'valeur': 'depense',
+                    'montant': 'depense_avt_imput',
+                    },
+                inplace = True
+                )
+
+            # Passage à l'euro
+            conso.depense = conso.depense / 6.55957
+            conso.depense_avt_imput = conso.depense_avt_imput / 6.55957
+            conso_small=conso[[u'ident_men', u'poste1995', u'depense']]
+
+            conso_unstacked = conso_small.set_index(['ident_men', 'poste1995']).unstack('poste1995')
+            conso_unstacked = conso_unstacked.fillna(0)
+
+            levels = conso_unstacked.columns.levels[1]
+            labels = conso_unstacked.columns.labels[1]
+            conso_unstacked.columns = levels[labels]
+            conso_unstacked.rename(index = {0: 'ident_men'}, inplace = True)
+            conso = conso_unstacked.merge(poids, left_index = True, right_index = True)
+            conso = conso.reset_index()
+
+        if year == 2000:
+            conso = survey.get_values(table = "consomen")
+            conso.rename(
+                columns = {
+                    'ident': 'ident_men',
+                    'pondmen': 'pondmen',
+                    },
+                inplace = True,
+                )
+            for variable in ['ctotale', 'c99', 'c99999'] + \
+                            ["c0{}".format(i) for i in range(1, 10)] + \
+                            ["c{}".format(i) for i in range(10, 14)]:
+                del conso[variable]
+
+        if year == 2005:
+            conso = survey.get_values(table = "c05d")
+
+        if year == 2011:
+            try:
+              conso = survey.get_values(table = "C05")
+            except:
+              conso = survey.get_values(table = "c05")
+            conso.rename(
+                columns = {
+                    'ident_me': 'ident_men',
+                    },
+                inplace = True,
+                )
+            del conso['ctot']
+
+        # Grouping by coicop
+
+        poids = conso[['ident_men', 'pondmen']].copy()
         poids.set_index('ident_men', inplace = True)
-
-        conso = survey.get_values(table = "depnom")
-        conso = conso[["valeur", "montant", "mena", "nomen5"]]
-        conso = conso.groupby(["mena", "nomen5"]).sum()
-        conso = conso.reset_index()
-        conso.rename(
-            columns = {
-                'mena': 'ident_men',
-                'nomen5': 'poste{}'.format(year),
-                'valeur': 'depense',
-                'montant': 'depense_avt_imput',
-                },
-            inplace = True
+        conso.drop('pondmen', axis = 1, inplace = True)
+        conso.set_index('ident_men', inplace = True)
+
+        matrice_passage_data_frame, selected_parametres_fiscalite_data_frame = get_transfert_data_frames(year)
+
+        coicop_poste_bdf = matrice_passage_data_frame[['poste{}'.format(year), 'posteCOICOP']]
+        coicop_poste_bdf.set_index('poste{}'.format(year), inplace = True)
+        coicop_by_poste_bdf = coicop_poste_bdf.to_dict()['posteCOICOP']
+        del coicop_poste_bdf
+
+        def reformat_consumption_column_coicop(coicop):
+            try:
+                return int(coicop.replace('c', '').lstrip('0'))
+            except:
+                return numpy.NaN
+         # cette étape permet d'harmoniser les df pour 1995 qui ne se présentent pas de la même façon que pour les trois autres années
+        if year == 1995:
+            def get_coicop(poste_bdf):
+                return normalize_coicop(coicop_by_poste_bdf.get(poste_bdf))
+        else:
+            def get_coicop(poste_bdf):
+                return normalize_coicop(coicop_by_poste_bdf.get(reformat_consumption_column_coicop(poste_bdf)))
+        matrix, coicop_labels = get_aggregation_matrix(
+            'coicop_by_poste_{}'.format(year),
+            conso.columns,
+            get_coicop,
+            correspondance = coicop_by_poste_bdf,
             )
+        coicop_data_frame = aggregate_columns(conso, matrix, coicop_labels)
+
+        depenses = coicop_data_frame.merge(poids, left_index = True, right_index = True)
+        temporary_store['depenses_{}'.format(year)] = depenses
 
-        # Passage à l'euro
-        conso.depense = conso.depense / 6.55957
-        conso.depense_avt_imput = conso.depense_avt_imput / 6.55957
-        conso_small=conso[[u'ident_men', u'poste1995', u'depense']]
-
-        conso_unstacked = conso_small.set_index(['ident_men', 'poste1995']).unstack('poste1995')
-        conso_unstacked = conso_unstacked.fillna(0)
-
-        levels = conso_unstacked.columns.levels[1]
-        labels = conso_unstacked.columns.labels[1]
-        conso_unstacked.columns = levels[labels]
-        conso_unstacked.rename(index = {0: 'ident_men'}, inplace = True)
-        conso = conso_unstacked.merge(poids, left_index = True, right_index = True)
-        conso = conso.reset_index()
-
-    if year == 2000:
-        conso = survey.get_values(table = "consomen")
-        conso.rename(
-            columns = {
-                'ident': 'ident_men',
-                'pondmen': 'pondmen',
-                },
-            inplace = True,
+        # Création de gros postes, les 12 postes sur lesquels le calage se fera
+        matrix, grospostes = get_aggregation_matrix(
+            'grosposte_by_coicop_{}'.format(year),
+            coicop_data_frame.columns,
+            select_gros_postes,
             )
-        for variable in ['ctotale', 'c99', 'c99999'] + \
-                        ["c0{}".format(i) for i in range(1, 10)] + \
-                        ["c{}".format(i) for i in range(10, 14)]:
-            del conso[variable]
+        depenses_by_grosposte = aggregate_columns(coicop_data_frame, matrix, grospostes)
+        depenses_by_grosposte = depenses_by_grosposte.merge(poids, left_index = True, right_index = True)
 
-    if year == 2005:
-        conso = survey.get_values(table = "c05d")
+        temporary_store['depenses_by_grosposte_{}'.format(year)] = depenses_by_grosposte
 
-    if year == 2011:
-        try:
-          conso = survey.get_values(table = "C05")
-        except:
-          conso = survey.get_values(table = "c05")
-        conso.rename(
-            columns = {
-                'ident_me': 'ident_men',
-                },
-            inplace = True,
-            )
-        del conso['ctot']
-
-    # Grouping by coicop
-
-    poids = conso[['ident_men', 'pondmen']].copy()
-    poids.set_index('ident_men', inplace = True)
-    conso.drop('pondmen', axis = 1, inplace = True)
-    conso.set_index('ident_men', inplace = True)
-
-    matrice_passage_data_frame, selected_parametres_fiscalite_data_frame = get_transfert_data_frames(year)
-
-    coicop_poste_bdf = matrice_passage_data_frame[['poste{}'.format(year), 'posteCOICOP']]
-    coicop_poste_bdf.set_index('poste{}'.format(year), inplace = True)
-    coicop_by_poste_bdf = coicop_poste_bdf.to_dict()['posteCOICOP']
-    del coicop_poste_bdf
-
-    def reformat_consumption_column_coicop(coicop):
-        try:
-            return int(coicop.replace('c', '').lstrip('0'))
-        except:
-            return numpy.NaN
-     # cette étape permet d'harmoniser les df pour 1995 qui ne se présentent pas de la même façon que pour les trois autres années
-    if year == 1995:
-        coicop_labels = [
-            normalize_coicop(coicop_by_poste_bdf.get(poste_bdf))
-            for poste_bdf in conso.columns
-            ]
-    else:
-        coicop_labels = [
-            normalize_coicop(coicop_by_poste_bdf.get(reformat_consumption_column_coicop(poste_bdf)))
-            for poste_bdf in conso.columns
-            ]
-    tuples = zip(coicop_labels, conso.columns)
-    conso.columns = pandas.MultiIndex.from_tuples(tuples, names=['coicop', 'poste{}'.format(year)])
-    coicop_data_frame = conso.groupby(level = 0, axis = 1).sum()
-
-    depenses = coicop_data_frame.merge(poids, left_index = True, right_index = True)
-    temporary_store['depenses_{}'.format(year)] = depenses
-
-    # Création de gros postes, les 12 postes sur lesquels le calage se fera
-    def select_gros_postes(coicop):
-        try:
-            coicop = unicode(coicop)
-        except:
-            coicop = coicop
-        normalized_coicop = normalize_coicop(coicop)
-        grosposte = normalized_coicop[0:2]
-        return int(grosposte)
-
-    grospostes = [
-        select_gros_postes(coicop)
-        for coicop in coicop_data_frame.columns
-        ]
-    tuples_gros_poste = zip(coicop_data_frame.columns, grospostes)
-    coicop_data_frame.columns = pandas.MultiIndex.from_tuples(tuples_gros_poste, names=['coicop', 'grosposte'])
-
-    depenses_by_grosposte = coicop_data_frame.groupby(level = 1, axis = 1).sum()
-    depenses_by_grosposte = depenses_by_grosposte.merge(poids, left_index = True, right_index = True)
-
-    temporary_store['depenses_by_grosposte_{}'.format(year)] = depenses_by_grosposte
-    temporary_store.close()
+
+def select_gros_postes(coicop):
+    try:
+        coicop = unicode(coicop)
+    except:
+        coicop = coicop
+    normalized_coicop = normalize_coicop(coicop)
+    grosposte = normalized_coicop[0:2]
+    return int(grosposte)
 
 
 def normalize_coicop(code):
@@ -243,10 +243,10 @@ def get_transfert_data_frames(year = None):
     # TODO: faire un fichier équivalent pour 2010
     matrice_passage_file_path = os.path.join(directory_path, "Matrice passage {}-COICOP.xls".format(year))
     parametres_fiscalite_file_path = os.path.join(directory_path, "Parametres fiscalite indirecte.xls")
-    matrice_passage_data_frame = pandas.read_excel(matrice_passage_file_path)
+    matrice_passage_data_frame = read_excel(matrice_passage_file_path)
     if year == 2011:
         matrice_passage_data_frame['poste2011'] = matrice_passage_data_frame['poste2011'].apply(lambda x: int(x.replace('c', '').lstrip('0')))
-    parametres_fiscalite_data_frame = pandas.read_excel(parametres_fiscalite_file_path, sheetname = "categoriefiscale")
+    parametres_fiscalite_data_frame = read_excel(parametres_fiscalite_file_path, sheetname = "categoriefiscale")
     selected_parametres_fiscalite_data_frame = \
         parametres_fiscalite_data_frame[parametres_fiscalite_data_frame.annee == year]
     return matrice_passage_data_frame, selected_parametres_fiscalite_data_frame
@@ -25,6 +25,7 @@
 
 
 import logging
+import numpy
 
 
 from openfisca_survey_manager.survey_collections import SurveyCollection
@@ -32,12 +33,10 @@ from openfisca_survey_manager.survey_collections import SurveyCollection
 log = logging.getLogger(__name__)
 
 from openfisca_france_data import default_config_files_directory as config_files_directory
+from openfisca_france_data.counting import count_by_category
 from openfisca_france_data.temporary import TemporaryStore
 
 
-temporary_store = TemporaryStore.create(file_name = "indirect_taxation_tmp")
-
-
 #**************************************************************************************************************************
 #* Etape n° 0-2 : HOMOGENEISATION DES DONNEES SUR LES VEHICULES
 #**************************************************************************************************************************
@@ -51,57 +50,62 @@ def build_homogeneisation_vehicules(year = None):
     """Compute vehicule numbers by type"""
 
     assert year is not None
-    # Load data
-    bdf_survey_collection = SurveyCollection.load(
-        collection = 'budget_des_familles', config_files_directory = config_files_directory)
-    survey = bdf_survey_collection.get_survey('budget_des_familles_{}'.format(year))
-
-    if year == 1995:
-        vehicule = None
-
-#	* L'enquête BdF 1995 ne contient pas d'information sur le type de carburant utilisé par les véhicules.
-
-    if year == 2000:
-        vehicule = survey.get_values(table = "depmen")
-        kept_variables = ['ident', 'carbu01', 'carbu02']
-        vehicule = vehicule[kept_variables]
-        vehicule.rename(columns = {'ident': 'ident_men'}, inplace = True)
-        vehicule.rename(columns = {'carbu01': 'carbu1'}, inplace = True)
-        vehicule.rename(columns = {'carbu02': 'carbu2'}, inplace = True)
-        vehicule["veh_tot"] = 1
-        vehicule["veh_essence"] = 1*(vehicule['carbu1'] == 1) + 1*(vehicule['carbu2'] == 1)
-        vehicule["veh_diesel"] = 1*(vehicule['carbu1'] == 2) + 1*(vehicule['carbu2'] == 2)
-
-    if year == 2005:
-        vehicule = survey.get_values(table = "automobile")
-        kept_variables = ['ident_men', 'carbu']
-        vehicule = vehicule[kept_variables]
-        vehicule["veh_tot"] = 1
-        vehicule["veh_essence"] = (vehicule['carbu'] == 1)
-        vehicule["veh_diesel"] = (vehicule['carbu'] == 2)
-
-    if year == 2011:
-        try:
-          vehicule = survey.get_values(table = "AUTOMOBILE")
-        except:
-          vehicule = survey.get_values(table = "automobile")
-        kept_variables = ['ident_me', 'carbu']
-        vehicule = vehicule[kept_variables]
-        vehicule.rename(columns = {'ident_me': 'ident_men'}, inplace = True)
-        vehicule["veh_tot"] = 1
-        vehicule["veh_essence"] = (vehicule['carbu'] == 1)
-        vehicule["veh_diesel"] = (vehicule['carbu'] == 2)
-
-    # Compute the number of cars by category
-    if year != 1995:
-        vehicule = vehicule.groupby(by = 'ident_men')["veh_tot", "veh_essence", "veh_diesel"].sum()
-        vehicule["pourcentage_vehicule_essence"] = 0
-        vehicule.pourcentage_vehicule_essence[vehicule.veh_tot != 0] = vehicule.veh_essence / vehicule.veh_tot
-
-        # Save in temporary store
-        temporary_store['automobile_{}'.format(year)] = vehicule
-
-    temporary_store.close()
+    with TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+        # Load data
+        bdf_survey_collection = SurveyCollection.load(
+            collection = 'budget_des_familles', config_files_directory = config_files_directory)
+        survey = bdf_survey_collection.get_survey('budget_des_familles_{}'.format(year))
+
+        if year == 1995:
+            vehicule = None
+
+    #	* L'enquête BdF 1995 ne contient pas d'information sur le type de carburant utilisé par les véhicules.
+
+        if year == 2000:
+            vehicule = survey.get_values(table = "depmen")
+            kept_variables = ['ident', 'carbu01', 'carbu02']
+            vehicule = vehicule[kept_variables]
+            vehicule.rename(columns = {'ident': 'ident_men'}, inplace = True)
+            menages = vehicule.ident_men.unique()
+            # Un enregistrement par ménage, avec le carburant de ses deux premiers véhicules
+            carburants = vehicule[['carbu01', 'carbu02']].values
+
+        if year == 2005:
+            vehicule = survey.get_values(table = "automobile")
+            kept_variables = ['ident_men', 'carbu']
+            vehicule = vehicule[kept_variables]
+            menages = survey.get_values(table = "depmen", variables = ['ident_men']).ident_men.unique()
+            carburants = vehicule.carbu.values
+
+        if year == 2011:
+            try:
+              vehicule = survey.get_values(table = "AUTOMOBILE")
+            except:
+              vehicule = survey.get_values(table = "automobile")
+            kept_variables = ['ident_me', 'carbu']
+            vehicule = vehicule[kept_variables]
+            vehicule.rename(columns = {'ident_me': 'ident_men'}, inplace = True)
+            try:
+              menages = survey.get_values(table = "DEPMEN", variables = ['ident_me']).ident_me.unique()
+            except:
+              menages = survey.get_values(table = "depmen", variables = ['ident_me']).ident_me.unique()
+            carburants = vehicule.carbu.values
+
+        # Compute the number of cars by category for every household (zero when it has no car)
+        if year != 1995:
+            vehicule = count_by_category(
+                vehicule.ident_men.values,
+                carburants,
+                {1: 'veh_essence', 2: 'veh_diesel'},
+                index = numpy.union1d(menages, vehicule.ident_men.values),
+                total = 'veh_tot',
+                shares = {'pourcentage_vehicule_essence': 'veh_essence'},
+                )
+            vehicule.index.name = 'ident_men'
+
+            # Save in temporary store
+            temporary_store['automobile_{}'.format(year)] = vehicule
+
 
 if __name__ == '__main__':
     import sys
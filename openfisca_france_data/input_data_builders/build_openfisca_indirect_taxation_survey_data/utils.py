@@ -24,14 +24,173 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import hashlib
+import logging
+
+import numpy
+import pandas
+from scipy import sparse
+
+from openfisca_france_data.temporary import TemporaryStore
+
+
+log = logging.getLogger(__name__)
+
+aggregation_matrix_by_name = dict()
+
+
+def build_aggregation_matrix(group_by_column):
+    '''
+    Construit la matrice creuse (colonnes x groupes) de 0 et de 1 qui agrège les colonnes par groupe.
+    Les colonnes dont le groupe est None ne sont pas retenues. Les groupes sont triés.
+    '''
+    groups = sorted(set(group for group in group_by_column if group is not None))
+    code_by_group = dict((group, code) for code, group in enumerate(groups))
+    rows = [row for row, group in enumerate(group_by_column) if group is not None]
+    codes = [code_by_group[group_by_column[row]] for row in rows]
+    matrix = sparse.csr_matrix(
+        (numpy.ones(len(rows)), (rows, codes)),
+        shape = (len(group_by_column), len(groups)),
+        )
+    return matrix, groups
+
+
+def get_aggregation_matrix(name, columns, get_group, correspondance = None):
+    '''
+    Renvoie la matrice d'agrégation des colonnes selon get_group et la liste des groupes.
+    La matrice est compilée une seule fois et conservée sur disque sous le nom name. Elle est recompilée quand les
+    colonnes ou la table de correspondance (dictionnaire dont dépend get_group) changent.
+    '''
+    columns = list(columns)
+    digest = hashlib.md5(
+        repr([unicode(column) for column in columns]) +
+        repr(sorted((correspondance or dict()).items()))
+        ).hexdigest()
+    cached = aggregation_matrix_by_name.get(name)
+    if cached is not None and cached[0] == digest:
+        return cached[1], cached[2]
+
+    with TemporaryStore.create(file_name = "indirect_taxation_aggregation_matrices") as temporary_store:
+        digest_key = "{}/digest".format(name)
+        if digest_key in temporary_store and temporary_store[digest_key][0] == digest:
+            entries = temporary_store["{}/entries".format(name)]
+            groups = list(temporary_store["{}/groups".format(name)])
+            matrix = sparse.csr_matrix(
+                (numpy.ones(len(entries)), (entries.row.values, entries.code.values)),
+                shape = (len(columns), len(groups)),
+                )
+        else:
+            log.info("Compiling aggregation matrix {}".format(name))
+            matrix, groups = build_aggregation_matrix([get_group(column) for column in columns])
+            coo_matrix = matrix.tocoo()
+            temporary_store["{}/entries".format(name)] = pandas.DataFrame(dict(
+                row = coo_matrix.row,
+                code = coo_matrix.col,
+                ))
+            temporary_store["{}/groups".format(name)] = pandas.Series(groups)
+            temporary_store[digest_key] = pandas.Series([digest])
+    aggregation_matrix_by_name[name] = (digest, matrix, groups)
+    return matrix, groups
+
+
+def aggregate_columns(data_frame, matrix, groups):
+    '''
+    Somme les colonnes de data_frame par groupe avec la matrice d'agrégation (les valeurs manquantes comptent pour 0)
+    '''
+    values = numpy.nan_to_num(data_frame.values.astype(float))
+    return pandas.DataFrame(
+        matrix.T.dot(values.T).T,
+        index = data_frame.index,
+        columns = groups,
+        )
+
+
+def assemble_data_frames(data_frames):
+    '''
+    Assemble colonne par colonne des DataFrames (les None sont ignorés) alignés sur l'union de leurs index.
+    Quand un nom de colonne apparaît plusieurs fois, la première occurrence est gardée et ses valeurs manquantes sont
+    complétées par les occurrences suivantes (comme le faisait data_frame.T.groupby(level = 0).first().T, mais sans
+    transposer ni passer en dtype object).
+    '''
+    data_frames = [data_frame for data_frame in data_frames if data_frame is not None]
+    assert data_frames
+    index = data_frames[0].index
+    for data_frame in data_frames[1:]:
+        if not data_frame.index.equals(index):
+            index = index.union(data_frame.index)
+    length = len(index)
+
+    sources_by_name = dict()
+    names = list()
+    for data_frame in data_frames:
+        indexer = None if data_frame.index.equals(index) else index.get_indexer(data_frame.index)
+        for position, name in enumerate(data_frame.columns):
+            if name not in sources_by_name:
+                sources_by_name[name] = list()
+                names.append(name)
+            sources_by_name[name].append((data_frame, position, indexer))
+
+    def align(data_frame, position, indexer):
+        values = data_frame.iloc[:, position].values
+        if indexer is None:
+            return values
+        if values.dtype.kind in 'biuf':
+            # Les valeurs manquantes imposent un dtype flottant
+            aligned = numpy.empty(length, dtype = numpy.result_type(values.dtype, numpy.float32))
+        else:
+            aligned = numpy.empty(length, dtype = object)
+        aligned.fill(numpy.nan)
+        aligned[indexer] = values
+        return aligned
+
+    columns = dict()
+    for name in names:
+        sources = sources_by_name[name]
+        values = align(*sources[0])
+        for source in sources[1:]:
+            missing = pandas.isnull(values)
+            if not missing.any():
+                break
+            other_values = align(*source)
+            if values.dtype.kind in 'biuf' and other_values.dtype.kind in 'biuf':
+                values = values.astype(numpy.result_type(values.dtype, other_values.dtype))
+            elif values.dtype != other_values.dtype:
+                values = values.astype(object)
+            else:
+                values = values.copy()
+            values[missing] = other_values[missing]
+        columns[name] = values
+    return pandas.DataFrame(columns, index = index, columns = names)
+
+
 def collapsesum(data_frame, by = None, var = None):
     '''
-    Pour une variable, fonction qui calcule la moyenne pondérée au sein de chaque groupe.
+    Pour une variable, fonction qui calcule la somme pondérée (par pondmen) au sein de chaque groupe.
     '''
     assert by is not None
     assert var is not None
-    grouped = data_frame.groupby([by])
-    return grouped.apply(lambda x: weighted_sum(groupe = x, var =var))
+    return weighted_group_sum(data_frame[by], data_frame[var], data_frame['pondmen'])
+
+
+def rank_within_groups(groups, start = 0):
+    '''
+    Numérote les lignes au sein de chaque groupe dans leur ordre d'apparition, à partir de start
+    '''
+    groups = pandas.Series(numpy.asarray(groups))
+    return groups.groupby(groups.values).cumcount().values + start
+
+
+def weighted_group_sum(groups, values, weights):
+    '''
+    Renvoie la série, indexée par les groupes triés, des sommes de values pondérées par weights au sein de chaque
+    groupe (les lignes dont le groupe est manquant sont ignorées)
+    '''
+    codes, uniques = pandas.factorize(numpy.asarray(groups), sort = True)
+    # Les valeurs manquantes comptent pour 0, comme avec groupby().sum()
+    weighted_values = numpy.nan_to_num(numpy.asarray(values, dtype = float) * numpy.asarray(weights, dtype = float))
+    kept = codes >= 0
+    sums = numpy.bincount(codes[kept], weights = weighted_values[kept], minlength = len(uniques))
+    return pandas.Series(sums, index = uniques)
 
 
 def find_nearest_inferior(years, year):
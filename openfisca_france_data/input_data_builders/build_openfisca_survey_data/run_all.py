@@ -50,7 +50,7 @@ def run_all(year = None, filename = "test", check = False):
     assert year is not None
     pre_processing.create_indivim_menage_en_mois(year = year)
     pre_processing.create_enfants_a_naitre(year = year)
-    # imputation_loyer.imputation_loyer(year = year)
+    imputation_loyer.imputation_loyer(year = year)
     fip.create_fip(year = year)
     famille.famille(year = year)
     foyer.sif(year = year)
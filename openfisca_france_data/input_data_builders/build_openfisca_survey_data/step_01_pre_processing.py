@@ -45,209 +45,209 @@ def create_indivim_menage_en_mois(year = None):
     """
     Création des tables ménages et individus concaténée (merged)
     """
-    temporary_store = TemporaryStore.create(file_name = "erfs")
-    assert year is not None
-    # load data
-    erfs_survey_collection = SurveyCollection.load(
-        collection = 'erfs', config_files_directory = config_files_directory)
-
-    replace = create_replace(year)
-    survey = erfs_survey_collection.get_survey('erfs_{}'.format(year))
-    erfmen = survey.get_values(table = replace["erf_menage"])
-    eecmen = survey.get_values(table = replace["eec_menage"])
-    erfind = survey.get_values(table = replace["erf_indivi"])
-    eecind = survey.get_values(table = replace["eec_indivi"])
-
-    # travail sur la cohérence entre les bases
-    noappar_m = eecmen[~(eecmen.ident.isin(erfmen.ident.values))].copy()
-
-    noappar_i = eecmen[~(eecind.ident.isin(erfind.ident.values))].copy()
-    noappar_i = noappar_i.drop_duplicates(subset = 'ident', take_last = True)
-    # TODO: vérifier qu'il n'y a théoriquement pas de doublon
-
-    difference = set(noappar_i.ident).symmetric_difference(noappar_m.ident)
-    intersection = set(noappar_i.ident) & set(noappar_m.ident)
-    log.info("There are {} differences and {} intersections".format(len(difference), len(intersection)))
-    del noappar_i, noappar_m, difference, intersection
-    gc.collect()
-
-    # fusion enquete emploi et source fiscale
-    menage_en_mois = erfmen.merge(eecmen)
-    indivim = eecind.merge(erfind, on = ['noindiv', 'ident', 'noi'], how = "inner")
-
-    # optimisation des types? Controle de l'existence en passant
-    # TODO: minimal dtype
-    # TODO: this should be done somewhere else
-    var_list = ([
-        'acteu',
-        'agepr',
-        'cohab',
-        'contra',
-        'encadr',
-        'forter',
-        'lien',
-        'mrec',
-        'naia',
-        'noicon',
-        'noimer',
-        'noiper',
-        'prosa',
-        'retrai',
-        'rstg',
-        'statut',
-        'stc',
-        'titc',
-        'txtppb',
-        ])
-
-    for var in var_list:
-        assert indivim[var].dtype == numpy.dtype('int')
-
-    ########################
-    # création de variables#
-    ########################
-
-#   actrec : activité recodée comme preconisé par l'INSEE p84 du guide utilisateur
-    indivim["actrec"] = numpy.nan
-    # Attention : Q: pas de 6 ?!! A : Non pas de 6, la variable recodée de l'INSEE (voit p84 du guide methodo), ici \
-    # la même nomenclatue à été adopée
-
-    # 3: contrat a durée déterminée
-    indivim['actrec'][indivim.acteu == 1] = 3
-    # 8 : femme (homme) au foyer, autre inactif
-    indivim['actrec'][indivim.acteu == 3] = 8
-    # 1 : actif occupé non salarié
-    filter1 = (indivim.acteu == 1) & (indivim.stc.isin([1, 3]))  # actifs occupés non salariés à son compte ou pour un
-    indivim["actrec"][filter1] = 1                                # membre de sa famille
-    # 2 : salarié pour une durée non limitée
-    filter2 = (indivim.acteu == 1) & (((indivim.stc == 2) & (indivim.contra == 1)) | (indivim.titc == 2))
-    indivim['actrec'][filter2] = 2
-    # 4 : au chomage
-    filter4 = (indivim.acteu == 2) | ((indivim.acteu == 3) & (indivim.mrec == 1))
-    indivim['actrec'][filter4] = 4
-    # 5 : élève étudiant , stagiaire non rémunéré
-    filter5 = (indivim.acteu == 3) & ((indivim.forter == 2) | (indivim.rstg == 1))
-    indivim['actrec'][filter5] = 5
-    # 7 : retraité, préretraité, retiré des affaires unchecked
-    filter7 = (indivim.acteu == 3) & ((indivim.retrai == 1) | (indivim.retrai == 2))
-    indivim['actrec'][filter7] = 7
-    # 9 : probablement enfants de - de 16 ans TODO: check that fact in database and questionnaire
-    indivim['actrec'][indivim.acteu == 0] = 9
-
-    indivim.actrec = indivim.actrec.astype("int8")
-    assert_dtype(indivim.actrec, "int8")
-    assert indivim.actrec.isin(range(1, 10)).all(), 'actrec values are outside the interval [1, 9]'
-
-#   TODO : compare the result with results provided by Insee
-#   tu99
-    if year == 2009:
-        erfind['tu99'] = None  # TODO: why ?
-
-    # Locataire
-    menage_en_mois["locataire"] = menage_en_mois.so.isin([3, 4, 5])
-    assert_dtype(menage_en_mois.locataire, "bool")
-
-    transfert = indivim.loc[indivim.lpr == 1, ['ident', 'ddipl']].copy()
-    menage_en_mois = menage_en_mois.merge(transfert)
-
-    # Correction
-    def _manually_remove_errors():
-        '''
-        This method is here because some oddities can make it through the controls throughout the procedure
-        It is here to remove all these individual errors that compromise the process.
-        '''
-        if year == 2006:
-            indivim.lien[indivim.noindiv == 603018905] = 2
-            indivim.noimer[indivim.noindiv == 603018905] = 1
-            log.info("{}".format(indivim[indivim.noindiv == 603018905].to_string()))
-
-    _manually_remove_errors()
-
-    temporary_store['menage_en_mois_{}'.format(year)] = menage_en_mois
-    del eecmen, erfmen, menage_en_mois, transfert
-    gc.collect()
-    temporary_store['indivim_{}'.format(year)] = indivim
-    del erfind, eecind
-    gc.collect()
-    temporary_store.close()
+    with TemporaryStore.create(file_name = "erfs") as temporary_store:
+        assert year is not None
+        # load data
+        erfs_survey_collection = SurveyCollection.load(
+            collection = 'erfs', config_files_directory = config_files_directory)
+
+        replace = create_replace(year)
+        survey = erfs_survey_collection.get_survey('erfs_{}'.format(year))
+        erfmen = survey.get_values(table = replace["erf_menage"])
+        eecmen = survey.get_values(table = replace["eec_menage"])
+        erfind = survey.get_values(table = replace["erf_indivi"])
+        eecind = survey.get_values(table = replace["eec_indivi"])
+
+        # travail sur la cohérence entre les bases
+        noappar_m = eecmen[~(eecmen.ident.isin(erfmen.ident.values))].copy()
+
+        noappar_i = eecmen[~(eecind.ident.isin(erfind.ident.values))].copy()
+        noappar_i = noappar_i.drop_duplicates(subset = 'ident', take_last = True)
+        # TODO: vérifier qu'il n'y a théoriquement pas de doublon
+
+        difference = set(noappar_i.ident).symmetric_difference(noappar_m.ident)
+        intersection = set(noappar_i.ident) & set(noappar_m.ident)
+        log.info("There are {} differences and {} intersections".format(len(difference), len(intersection)))
+        del noappar_i, noappar_m, difference, intersection
+        gc.collect()
+
+        # fusion enquete emploi et source fiscale
+        menage_en_mois = erfmen.merge(eecmen)
+        indivim = eecind.merge(erfind, on = ['noindiv', 'ident', 'noi'], how = "inner")
+
+        # optimisation des types? Controle de l'existence en passant
+        # TODO: minimal dtype
+        # TODO: this should be done somewhere else
+        var_list = ([
+            'acteu',
+            'agepr',
+            'cohab',
+            'contra',
+            'encadr',
+            'forter',
+            'lien',
+            'mrec',
+            'naia',
+            'noicon',
+            'noimer',
+            'noiper',
+            'prosa',
+            'retrai',
+            'rstg',
+            'statut',
+            'stc',
+            'titc',
+            'txtppb',
+            ])
+
+        for var in var_list:
+            assert indivim[var].dtype == numpy.dtype('int')
+
+        ########################
+        # création de variables#
+        ########################
+
+    #   actrec : activité recodée comme preconisé par l'INSEE p84 du guide utilisateur
+        indivim["actrec"] = numpy.nan
+        # Attention : Q: pas de 6 ?!! A : Non pas de 6, la variable recodée de l'INSEE (voit p84 du guide methodo),
+        # ici la même nomenclatue à été adopée
+
+        # 3: contrat a durée déterminée
+        indivim['actrec'][indivim.acteu == 1] = 3
+        # 8 : femme (homme) au foyer, autre inactif
+        indivim['actrec'][indivim.acteu == 3] = 8
+        # 1 : actif occupé non salarié
+        # actifs occupés non salariés à son compte ou pour un membre de sa famille
+        filter1 = (indivim.acteu == 1) & (indivim.stc.isin([1, 3]))
+        indivim["actrec"][filter1] = 1
+        # 2 : salarié pour une durée non limitée
+        filter2 = (indivim.acteu == 1) & (((indivim.stc == 2) & (indivim.contra == 1)) | (indivim.titc == 2))
+        indivim['actrec'][filter2] = 2
+        # 4 : au chomage
+        filter4 = (indivim.acteu == 2) | ((indivim.acteu == 3) & (indivim.mrec == 1))
+        indivim['actrec'][filter4] = 4
+        # 5 : élève étudiant , stagiaire non rémunéré
+        filter5 = (indivim.acteu == 3) & ((indivim.forter == 2) | (indivim.rstg == 1))
+        indivim['actrec'][filter5] = 5
+        # 7 : retraité, préretraité, retiré des affaires unchecked
+        filter7 = (indivim.acteu == 3) & ((indivim.retrai == 1) | (indivim.retrai == 2))
+        indivim['actrec'][filter7] = 7
+        # 9 : probablement enfants de - de 16 ans TODO: check that fact in database and questionnaire
+        indivim['actrec'][indivim.acteu == 0] = 9
+
+        indivim.actrec = indivim.actrec.astype("int8")
+        assert_dtype(indivim.actrec, "int8")
+        assert indivim.actrec.isin(range(1, 10)).all(), 'actrec values are outside the interval [1, 9]'
+
+    #   TODO : compare the result with results provided by Insee
+    #   tu99
+        if year == 2009:
+            erfind['tu99'] = None  # TODO: why ?
+
+        # Locataire
+        menage_en_mois["locataire"] = menage_en_mois.so.isin([3, 4, 5])
+        assert_dtype(menage_en_mois.locataire, "bool")
+
+        transfert = indivim.loc[indivim.lpr == 1, ['ident', 'ddipl']].copy()
+        menage_en_mois = menage_en_mois.merge(transfert)
+
+        # Correction
+        def _manually_remove_errors():
+            '''
+            This method is here because some oddities can make it through the controls throughout the procedure
+            It is here to remove all these individual errors that compromise the process.
+            '''
+            if year == 2006:
+                indivim.lien[indivim.noindiv == 603018905] = 2
+                indivim.noimer[indivim.noindiv == 603018905] = 1
+                log.info("{}".format(indivim[indivim.noindiv == 603018905].to_string()))
+
+        _manually_remove_errors()
+
+        temporary_store['menage_en_mois_{}'.format(year)] = menage_en_mois
+        del eecmen, erfmen, menage_en_mois, transfert
+        gc.collect()
+        temporary_store['indivim_{}'.format(year)] = indivim
+        del erfind, eecind
+        gc.collect()
 
 
 def create_enfants_a_naitre(year = None):
     '''
     '''
     assert year is not None
-    temporary_store = TemporaryStore.create(file_name = "erfs")
-
-    erfs_survey_collection = SurveyCollection.load(
-        collection = 'erfs', config_files_directory = config_files_directory)
-    survey = erfs_survey_collection.get_survey('erfs_{}'.format(year))
-    # Enfant à naître (NN pour nouveaux nés)
-    individual_vars = [
-        'acteu',
-        'agepr',
-        'cohab',
-        'contra',
-        'forter',
-        'ident',
-        'lien',
-        'lpr',
-        'mrec',
-        'naia',
-        'naim',
-        'noi',
-        'noicon',
-        'noimer',
-        'noindiv',
-        'noiper',
-        'retrai',
-        'rga',
-        'rstg',
-        'sexe',
-        'stc',
-        'titc',
-        ]
-    replace = create_replace(year)
-    eeccmp1 = survey.get_values(table = replace["eec_cmp_1"], variables = individual_vars)
-    eeccmp2 = survey.get_values(table = replace["eec_cmp_2"], variables = individual_vars)
-    eeccmp3 = survey.get_values(table = replace["eec_cmp_3"], variables = individual_vars)
-    tmp = eeccmp1.merge(eeccmp2, how = "outer")
-    enfants_a_naitre = tmp.merge(eeccmp3, how = "outer")
-
-    # optimisation des types? Controle de l'existence en passant
-    # pourquoi pas des int quand c'est possible
-    # TODO: minimal dtype TODO: shoudln't be here
-    for var in individual_vars:
-        assert_dtype(enfants_a_naitre[var], 'float')
-    del eeccmp1, eeccmp2, eeccmp3, individual_vars, tmp  #TODO: Adrien: me fait planter python
-    gc.collect()
-
-    # création de variables
-    enfants_a_naitre['declar1'] = ''
-    enfants_a_naitre['noidec'] = 0
-    enfants_a_naitre['ztsai'] = 0
-    enfants_a_naitre['year'] = year
-    enfants_a_naitre.year = enfants_a_naitre.year.astype("float32")  # TODO: should be an integer but NaN are present
-    enfants_a_naitre['agepf'] = enfants_a_naitre.year - enfants_a_naitre.naia
-    enfants_a_naitre['agepf'][enfants_a_naitre.naim >= 7] -= 1
-    enfants_a_naitre['actrec'] = 9
-    enfants_a_naitre['quelfic'] = 'ENF_NN'
-    enfants_a_naitre['persfip'] = ""
-
-    # TODO: deal with agepf
-    for series_name in ['actrec', 'noidec', 'ztsai']:
-        assert_dtype(enfants_a_naitre[series_name], "int")
-
-    # selection
-    enfants_a_naitre = enfants_a_naitre[
-        (
-            (enfants_a_naitre.naia == enfants_a_naitre.year) & (enfants_a_naitre.naim >= 10)
-            ) | (
-                (enfants_a_naitre.naia == enfants_a_naitre.year + 1) & (enfants_a_naitre.naim <= 5)
-                )
-        ].copy()
-
-    temporary_store["enfants_a_naitre_{}".format(year)] = enfants_a_naitre
-    temporary_store.close()
+    with TemporaryStore.create(file_name = "erfs") as temporary_store:
+
+        erfs_survey_collection = SurveyCollection.load(
+            collection = 'erfs', config_files_directory = config_files_directory)
+        survey = erfs_survey_collection.get_survey('erfs_{}'.format(year))
+        # Enfant à naître (NN pour nouveaux nés)
+        individual_vars = [
+            'acteu',
+            'agepr',
+            'cohab',
+            'contra',
+            'forter',
+            'ident',
+            'lien',
+            'lpr',
+            'mrec',
+            'naia',
+            'naim',
+            'noi',
+            'noicon',
+            'noimer',
+            'noindiv',
+            'noiper',
+            'retrai',
+            'rga',
+            'rstg',
+            'sexe',
+            'stc',
+            'titc',
+            ]
+        replace = create_replace(year)
+        eeccmp1 = survey.get_values(table = replace["eec_cmp_1"], variables = individual_vars)
+        eeccmp2 = survey.get_values(table = replace["eec_cmp_2"], variables = individual_vars)
+        eeccmp3 = survey.get_values(table = replace["eec_cmp_3"], variables = individual_vars)
+        tmp = eeccmp1.merge(eeccmp2, how = "outer")
+        enfants_a_naitre = tmp.merge(eeccmp3, how = "outer")
+
+        # optimisation des types? Controle de l'existence en passant
+        # pourquoi pas des int quand c'est possible
+        # TODO: minimal dtype TODO: shoudln't be here
+        for var in individual_vars:
+            assert_dtype(enfants_a_naitre[var], 'float')
+        del eeccmp1, eeccmp2, eeccmp3, individual_vars, tmp  #TODO: Adrien: me fait planter python
+        gc.collect()
+
+        # création de variables
+        enfants_a_naitre['declar1'] = ''
+        enfants_a_naitre['noidec'] = 0
+        enfants_a_naitre['ztsai'] = 0
+        enfants_a_naitre['year'] = year
+        # TODO: should be an integer but NaN are present
+        enfants_a_naitre.year = enfants_a_naitre.year.astype("float32")
+        enfants_a_naitre['agepf'] = enfants_a_naitre.year - enfants_a_naitre.naia
+        enfants_a_naitre['agepf'][enfants_a_naitre.naim >= 7] -= 1
+        enfants_a_naitre['actrec'] = 9
+        enfants_a_naitre['quelfic'] = 'ENF_NN'
+        enfants_a_naitre['persfip'] = ""
+
+        # TODO: deal with agepf
+        for series_name in ['actrec', 'noidec', 'ztsai']:
+            assert_dtype(enfants_a_naitre[series_name], "int")
+
+        # selection
+        enfants_a_naitre = enfants_a_naitre[
+            (
+                (enfants_a_naitre.naia == enfants_a_naitre.year) & (enfants_a_naitre.naim >= 10)
+                ) | (
+                    (enfants_a_naitre.naia == enfants_a_naitre.year + 1) & (enfants_a_naitre.naim <= 5)
+                    )
+            ].copy()
+
+        temporary_store["enfants_a_naitre_{}".format(year)] = enfants_a_naitre
     gc.collect()
 
 
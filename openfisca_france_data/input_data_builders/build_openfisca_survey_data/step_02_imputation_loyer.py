@@ -24,12 +24,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-# This step requires to have R installed with StatMatch library
-# You'll also need rpy2 2.3x available at
-# https://bitbucket.org/lgautier/rpy2/src/511312d70346f3f66c989e35443b2823e9b56d56?at=version_2.3.x
-# (the version on python website is not compatible, working correctly for the debian's testing version)
-
-
 from __future__ import division
 
 
@@ -37,79 +31,37 @@ import gc
 import logging
 import numpy
 
-# problem with rpy last version is not working
-try:
-    from rpy2.robjects.packages import importr
-    import rpy2.robjects.pandas2ri  # use rpy2 2.3x from : https://bitbucket.org/lgautier/rpy2/src/511312d70346f3f66c989e35443b2823e9b56d56?at=version_2.3.x
-    import rpy2.robjects.vectors as vectors
-except ImportError:
-    importr = None
-    pandas2ri = None
-    vectors = None
-
-from openfisca_france_data import default_config_files_directory as config_files_directory
-from openfisca_france_data.input_data_builders.build_openfisca_survey_data.base import create_replace
+from openfisca_france_data.binning import bin_values
+from openfisca_france_data.hotdeck import create_fused, nnd_hotdeck
 from openfisca_france_data.input_data_builders.build_openfisca_survey_data.utils import assert_variable_in_range, count_NA
 from openfisca_france_data.temporary import TemporaryStore
-from openfisca_survey_manager.statshelpers import mark_weighted_percentiles
 from openfisca_survey_manager.survey_collections import SurveyCollection
 
 
 log = logging.getLogger(__name__)
-STATMATCH_LIB_LOCATION = "/home/benjello/R/x86_64-pc-linux-gnu-library/3.1/StatMatch/"
+HOTDECK_SEED = 2006
 
 
 def create_comparable_erf_data_frame(year):
     '''
     Imputation des loyers
     '''
-    temporary_store = TemporaryStore.create(file_name = "erfs")
-    assert year is not None
-    # Préparation des variables qui serviront à l'imputation
-    replace = create_replace(year)
-    menm_vars = [
-        "aai1",
-        "agpr",
-        "cstotpr",
-        "ident",
-        "nat28pr",
-        "nb_uci",
-        "nbenfc",
-        "nbpiec",
-        "pol99",
-        "reg",
-        "so",
-        "spr",
-        "tau99"
-        "tu99",
-        "typmen5",
-        "wprm",
-        "zperm",
-        "zracm",
-        "zragm",
-        "zricm",
-        "zrncm",
-        "ztsam",
-        ]
-
-    if year == 2008:  # Tau99 not present
-        menm_vars = menm_vars.pop('tau99')
-
-    indm_vars = ["dip11", 'ident', "lpr", "noi"]
-    # Travail sur la base ERF
-    # Preparing ERF menages tables
-    erfmenm = temporary_store.select('menage_en_mois_{}'.format(year))
-
-    erfmenm['revtot'] = (
-        erfmenm.ztsam + erfmenm.zperm + erfmenm.zragm + erfmenm.zricm + erfmenm.zrncm + erfmenm.zracm
-        )
-    # Niveau de vie de la personne de référence
-    erfmenm['nvpr'] = erfmenm.revtot.astype(numpy.float64) / erfmenm.nb_uci.astype("float")
-    erfmenm.nvpr[erfmenm.nvpr < 0] = 0
-    erfmenm['logt'] = erfmenm.so
-
-    # Preparing ERF individuals table
-    erfindm = temporary_store['indivim_{}'.format(year)]
+    with TemporaryStore.create(file_name = "erfs") as temporary_store:
+        assert year is not None
+        # Travail sur la base ERF
+        # Preparing ERF menages tables
+        erfmenm = temporary_store.select('menage_en_mois_{}'.format(year))
+
+        erfmenm['revtot'] = (
+            erfmenm.ztsam + erfmenm.zperm + erfmenm.zragm + erfmenm.zricm + erfmenm.zrncm + erfmenm.zracm
+            )
+        # Niveau de vie de la personne de référence
+        erfmenm['nvpr'] = erfmenm.revtot.astype(numpy.float64) / erfmenm.nb_uci.astype("float")
+        erfmenm.nvpr[erfmenm.nvpr < 0] = 0
+        erfmenm['logt'] = erfmenm.so
+
+        # Preparing ERF individuals table
+        erfindm = temporary_store['indivim_{}'.format(year)]
 
     # TODO: clean this later
     erfindm['dip11'] = 0
@@ -121,30 +73,9 @@ def create_comparable_erf_data_frame(year):
     erf = erfmenm.merge(erfindm, on ='ident', how='inner')
     erf = erf.drop_duplicates('ident')
 
-    dec, values = mark_weighted_percentiles(
-        erf.nvpr.values,
-        numpy.arange(1, 11),
-        erf.wprm.values,
-        2,
-        return_quantiles = True
-        )
-    values.sort()
-    erf['deci'] = (
-        1 +
-        (erf.nvpr > values[1]) +
-        (erf.nvpr > values[2]) +
-        (erf.nvpr > values[3]) +
-        (erf.nvpr > values[4]) +
-        (erf.nvpr > values[5]) +
-        (erf.nvpr > values[6]) +
-        (erf.nvpr > values[7]) +
-        (erf.nvpr > values[8]) +
-        (erf.nvpr > values[9])
-        )
+    erf['deci'] = bin_values(erf.nvpr.values, weights = erf.wprm.values, quantiles = 10)
     assert_variable_in_range('deci', [1, 11], erf)
     count_NA('deci', erf)
-    del dec, values
-    gc.collect()
 
     # TODO: faire le lien avec men_vars,
     # il manque "pol99","reg","tau99" et ici on a en plus logt, 'nvpr','revtot','dip11','deci'
@@ -192,9 +123,7 @@ def create_comparable_erf_data_frame(year):
 
     erf['agpr'] = erf['agpr'].astype('int64')
     # TODO: moche, pourquoi créer deux variables quand une suffit ?
-    erf['magtr'] = 3
-    erf.magtr[erf.agpr < 65] = 2
-    erf.magtr[erf.agpr < 40] = 1
+    erf['magtr'] = bin_values(erf.agpr.values, [40, 65], right = False)
     count_NA('magtr', erf)
     assert erf.magtr.isin(range(1, 5)).all()
 
@@ -217,8 +146,7 @@ def create_comparable_erf_data_frame(year):
     # assert erf.mtybd.isin(range(1,8)).all() # bug,
 
     # TODO : 3 logements ont 0 pièces !!
-    erf.hnph2[erf.hnph2 < 1] = 1
-    erf.hnph2[erf.hnph2 >= 6] = 6
+    erf['hnph2'] = erf.hnph2.clip(1, 6)
     count_NA('hnph2', erf)
     assert erf.hnph2.isin(range(1,7)).all()
 
@@ -323,23 +251,20 @@ def create_comparable_logement_data_frame(year):
         "sec1",
         ]
 
-    if year == 2003:
+    # Enquête logement la plus proche de l'année de l'ERFS : 2003 jusqu'en 2005, 2006 ensuite
+    year_lgt = 2003 if year < 2006 else 2006
+    if year_lgt == 2003:
         logement_menage_variables.extend(["hnph2", "ident", "lmlm", "mnatior", "typse"])
         logement_adresse_variables.extend(["iaat", "ident", "tu99"])
-    if year < 2010 and year > 2005:
+    if year_lgt == 2006:
         logement_menage_variables.extend(["idlog", "mnatio"])
         logement_adresse_variables.extend(["idlog"])  # pas de typse en 2006
         logement_logement_variables = ["hnph2", "iaat", "idlog", "lmlm", "tu99"]  # pas de typse en 2006
 
     # Travail sur la table logement
     # Table menage
-    if year == 2003:
-        year_lgt = 2003
-    if year > 2005 and year < 2010:
-        year_lgt = 2006
-
     logement_survey_collection = SurveyCollection.load(collection='logement')
-    logement_survey = logement_survey_collection.surveys['logement_{}'.format(year)]
+    logement_survey = logement_survey_collection.surveys['logement_{}'.format(year_lgt)]
 
     log.info("Preparing logement menage table")
 #     Lgtmen = load_temp(name = "indivim",year = year) # Je rajoute une étape bidon
@@ -355,30 +280,8 @@ def create_comparable_logement_data_frame(year):
     Lgtmen['nvpr'] = 10.0 * Lgtmen['revtot'] / Lgtmen['muc1']
 
     count_NA('qex', Lgtmen)
-    dec, values = mark_weighted_percentiles(
-        Lgtmen['nvpr'].values,
-        numpy.arange(1, 11),
-        Lgtmen['qex'].values,
-        2,
-        return_quantiles = True,
-        )
-    values.sort()
-    Lgtmen['deci'] = (
-        1 +
-        (Lgtmen.nvpr > values[1]) +
-        (Lgtmen.nvpr > values[2]) +
-        (Lgtmen.nvpr > values[3]) +
-        (Lgtmen.nvpr > values[4]) +
-        (Lgtmen.nvpr > values[5]) +
-        (Lgtmen.nvpr > values[6]) +
-        (Lgtmen.nvpr > values[7]) +
-        (Lgtmen.nvpr > values[8]) +
-        (Lgtmen.nvpr > values[9])
-        )
-
-    del dec, values
+    Lgtmen['deci'] = bin_values(Lgtmen['nvpr'].values, weights = Lgtmen['qex'].values, quantiles = 10)
     assert Lgtmen['deci'].isin(range(1, 11)).all(), "Logement decile are out of range'"
-    gc.collect()
 
     if year_lgt == 2006:
         log.info('Preparing logement logement table')
@@ -414,8 +317,7 @@ def create_comparable_logement_data_frame(year):
     log.info(u"Fusion des tables logement et ménage de l'enquête logement")
     Logement = Lgtmen.merge(Lgtadr, on = 'ident', how = 'inner')
 
-    Logement.hnph2[Logement['hnph2'] >= 6] = 6
-    Logement.hnph2[Logement['hnph2'] < 1] = 1
+    Logement['hnph2'] = Logement['hnph2'].clip(1, 6)
     count_NA('hnph2', Logement)
     assert Logement['hnph2'].notnull().any(), "Some hnph2 are null"
 #     Logement=(Logement[Logement['hnph2'].notnull()]) # Mis en comment car 0 NA pour hnph2
@@ -530,49 +432,36 @@ def imputation_loyer(year):
 
     erf['mcs8'] = erf['mcs8'].astype(int)
 
-#    NOT WORKING ANYMORE AARGH
-#    rpy2.robjects.pandas2ri.activate()  # Permet à rpy2 de convertir les dataframes   padas2ri doesn't exist anymore in rpy2
-#    try:
-#        sm = importr("StatMatch")  # Launch R you need to have StatMatch installed in R
-#    except:
-#        sm = importr("StatMatch", lib_loc = STATMATCH_LIB_LOCATION)
-#
-#    out_nnd = sm.NND_hotdeck(data_rec = erf,
-#                             data_don = Logt,
-#                             match_vars = vectors.StrVector(matchvars),
-#                             don_class = vectors.StrVector(classes),
-#                             dist_fun = "Gower",
-#                             )
-#
-#    fill_erf_nnd = sm.create_fused(
-#        data_rec = erf,
-#        data_don = Logt,
-#        mtc_ids = out_nnd[0], <- THE PROBLEM IS HERE
-#        z_vars = vectors.StrVector(["lmlm"]),
-#        )
-#    del allvars, matchvars, classes, out_nnd
-#    gc.collect()
-#    fill_erf_nnd = com.convert_robj(fill_erf_nnd)
-#    fill_erf_nnd = DataFrame(fill_erf_nnd)
-
-    from til.data.utils.matching import Matching
-
-
+    # Statistical matching by nearest neighbour distance hot deck (as StatMatch's NND.hotdeck): each ERF household
+    # receives the rent of the nearest Logement household of its class on the matching variables
+    donor_positions, distances = nnd_hotdeck(
+        erf,
+        Logt,
+        match_vars = sorted(matchvars),
+        don_class = classes,
+        dist_fun = "Gower",
+        seed = HOTDECK_SEED,
+        )
+    fill_erf_nnd = create_fused(erf, Logt, donor_positions, ["lmlm"])
+    del allvars, matchvars, classes, donor_positions, distances
+    gc.collect()
 
     fill_erf_nnd.rename(columns={'lmlm': 'loym'}, inplace = True)
 
     loy_imput = fill_erf_nnd[['ident', 'loym']]
 
-    erfmenm = load_temp(name = "menage_en_mois", year = year)
+    with TemporaryStore.create(file_name = "erfs") as temporary_store:
+        erfmenm = temporary_store['menage_en_mois_{}'.format(year)]
+
+        for var in ["loym", "loym_x", "loym_y", "loym_z"]:
+            if var in erfmenm:
+                del erfmenm[var]
+                log.info("{} have been deleted".format(var))
 
-    for var in ["loym", "loym_x", "loym_y", "loym_z"]:
-        if var in erfmenm:
-            del erfmenm[var]
-            log.info("{} have been deleted".format(var))
+        erfmenm = erfmenm.merge(loy_imput, on='ident', how='left')
+        assert 'loym' in erfmenm.columns, u"La variable loym n'est pas présente dans erfmenm"
+        temporary_store['menage_en_mois_{}'.format(year)] = erfmenm
 
-    erfmenm = erfmenm.merge(loy_imput, on='ident', how='left')
-    assert 'loym' in erfmenm.columns, u"La variable loym n'est pas présente dans erfmenm"
-    save_temp(erfmenm, name = "menage_en_mois", year=year)
 
 if __name__ == '__main__':
     import sys
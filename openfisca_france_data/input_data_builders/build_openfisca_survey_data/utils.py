@@ -27,6 +27,8 @@ import logging
 import numpy
 from pandas import Series
 
+from openfisca_france_data.counting import count_by_category
+
 
 log = logging.getLogger(__name__)
 
@@ -182,14 +184,18 @@ def check_structure(dataframe):
         assert not dataframe[role].isnull().any(), "there are NaN in qui{}".format(entity)
         max_entity = dataframe[role].max().astype("int")
 
+        count_by_position = count_by_category(
+            dataframe[entity_id].values,
+            dataframe[role].values,
+            dict((position, position) for position in range(0, max_entity + 1)),
+            )
         for position in range(0, max_entity + 1):
-            test = dataframe[[role, entity_id]].groupby(by = entity_id).agg(lambda x: (x == position).sum())
             if position == 0:
-                errors = (test[role] != 1).sum()
+                errors = (count_by_position[position] != 1).sum()
                 if errors > 0:
                     log.error("There are {} errors for the head of {}".format(errors, entity))
             else:
-                errors = (test[role] > 1).sum()
+                errors = (count_by_position[position] > 1).sum()
                 if errors > 0:
                     log.error("There are {} duplicated qui{} = {}".format(errors, entity, position))
 
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Replicate weights (bootstrap or jackknife) to estimate the sampling variance of survey aggregates"""
+
+
+from __future__ import division
+
+import logging
+
+import numpy
+from pandas import DataFrame
+from scipy.stats import norm
+
+from .calmar import calibrate_weights
+from .utils import get_entity_projector
+
+
+log = logging.getLogger(__name__)
+
+
+def build_bootstrap_factors(count, replicates = 100, strata = None, seed = None):
+    """
+    Returns the (count, replicates) array of the rescaled bootstrap (Rao-Wu) factors of count households
+
+    In each stratum of n households, n - 1 households are drawn with replacement and the factor of a household is
+    its number of draws times n / (n - 1). Households alone in their stratum keep a factor of 1.
+    """
+    random_state = numpy.random.RandomState(seed)
+    factors = numpy.ones((count, replicates), dtype = numpy.float32)
+    for indices in get_indices_by_stratum(count, strata):
+        stratum_count = len(indices)
+        if stratum_count < 2:
+            continue
+        draws = random_state.randint(0, stratum_count, size = (replicates, stratum_count - 1))
+        draws += numpy.arange(replicates)[:, numpy.newaxis] * stratum_count
+        multiplicities = numpy.bincount(draws.ravel(), minlength = replicates * stratum_count).reshape(
+            replicates, stratum_count)
+        factors[indices, :] = multiplicities.T * stratum_count / (stratum_count - 1)
+    return factors
+
+
+def build_jackknife_factors(count, replicates = 100, strata = None, seed = None):
+    """
+    Returns the (count, replicates) array of the delete-a-group jackknife (JK1) factors of count households
+
+    Households are randomly split into replicates groups, systematically within strata so that each group spans all
+    the strata. Replicate g drops group g and multiplies the other weights by replicates / (replicates - 1).
+    """
+    assert replicates >= 2
+    random_state = numpy.random.RandomState(seed)
+    order = numpy.concatenate([
+        random_state.permutation(indices) for indices in get_indices_by_stratum(count, strata)])
+    group = numpy.empty(count, dtype = int)
+    group[order] = numpy.arange(count) % replicates
+    factors = numpy.empty((count, replicates), dtype = numpy.float32)
+    factors[:] = replicates / (replicates - 1)
+    factors[numpy.arange(count), group] = 0
+    return factors
+
+
+def get_indices_by_stratum(count, strata = None):
+    if strata is None:
+        return [numpy.arange(count)]
+    strata = numpy.asarray(strata)
+    assert len(strata) == count
+    return [numpy.flatnonzero(strata == stratum) for stratum in numpy.unique(strata)]
+
+
+class ReplicateWeights(object):
+    """
+    Replicate weights of the households held as one (households, replicates) array of factors of the weights
+    """
+    factors = None
+    method = None
+
+    def __init__(self, factors = None, method = None):
+        assert method in ['bootstrap', 'jackknife']
+        self.factors = factors
+        self.method = method
+
+    @classmethod
+    def create(cls, count, method = 'bootstrap', replicates = 100, strata = None, seed = None):
+        if method == 'bootstrap':
+            factors = build_bootstrap_factors(count, replicates = replicates, strata = strata, seed = seed)
+        else:
+            factors = build_jackknife_factors(count, replicates = replicates, strata = strata, seed = seed)
+        return cls(factors = factors, method = method)
+
+    def get_replicate_weights(self, weight, calibration = None):
+        """
+        Returns the (households, replicates) replicate weights, calibrated again on the margins of calibration if given
+        """
+        replicate_weights = weight[:, numpy.newaxis] * self.factors
+        if calibration is None:
+            return replicate_weights
+        keys, design, targets = calibration.get_design()
+        parameters = calibration.get_parameters()
+        filter_by = calibration.filter_by
+        initial_lambda = calibration.lambda_ if keys == calibration.lambda_keys else None
+        for replicate in range(replicate_weights.shape[1]):
+            replicate_weights[:, replicate], _ = calibrate_weights(
+                design = design,
+                initial_weight = replicate_weights[:, replicate] * filter_by,
+                targets = targets,
+                method = parameters.get('method'),
+                lo = parameters.get('lo'),
+                up = parameters.get('up'),
+                initial_lambda = initial_lambda,
+                )
+            replicate_weights[:, replicate] += (weight * numpy.logical_not(filter_by))
+        return replicate_weights
+
+    def get_variance(self, estimate, replicate_estimates):
+        deviations = replicate_estimates - estimate[:, numpy.newaxis]
+        replicates = replicate_estimates.shape[1]
+        if self.method == 'bootstrap':
+            return (deviations ** 2).sum(axis = 1) / replicates
+        return (deviations ** 2).sum(axis = 1) * (replicates - 1) / replicates
+
+    def compute_aggregates(self, values, weight, names = None, confidence = .95, calibration = None):
+        """
+        Computes the weighted totals of the rows of values and their confidence intervals
+
+        Parameters
+        ----------
+        values : array of shape (variables, households)
+                 household level values of the aggregated variables
+        weight : array
+                 household weights
+        names : list of strings, default None
+                names of the variables
+        confidence : float, default .95
+                     level of the confidence intervals (normal approximation)
+        calibration : Calibration, default None
+                      when given, each replicate is calibrated again on its margins
+        """
+        values = numpy.atleast_2d(values)
+        estimate = values.dot(weight)
+        # All the aggregates for all the replicates in one matrix product
+        replicate_estimates = values.dot(self.get_replicate_weights(weight, calibration = calibration))
+        standard_error = numpy.sqrt(self.get_variance(estimate, replicate_estimates))
+        margin = norm.ppf(.5 + confidence / 2) * standard_error
+        return DataFrame(
+            dict(
+                amount = estimate,
+                standard_error = standard_error,
+                lower_bound = estimate - margin,
+                upper_bound = estimate + margin,
+                ),
+            columns = ['amount', 'standard_error', 'lower_bound', 'upper_bound'],
+            index = names,
+            )
+
+
+def compute_aggregates_confidence_intervals(survey_scenario = None, variables = None, method = 'bootstrap',
+        replicates = 100, strata = None, seed = None, confidence = .95, calibration = None):
+    """
+    Computes the aggregates of variables (AGGREGATES_DEFAULT_VARS by default) with their confidence intervals
+
+    Variables of all entities are summed by ménage so that households are the sampling units of the replicates.
+    strata is an optional array of the strata of the ménages.
+    """
+    if variables is None:
+        from . import AGGREGATES_DEFAULT_VARS
+        variables = AGGREGATES_DEFAULT_VARS
+    simulation = survey_scenario.simulation
+    entity_projector = get_entity_projector(simulation)
+    values = numpy.vstack([entity_projector.sum_by_entity(variable, 'men') for variable in variables])
+    weight = simulation.calculate(survey_scenario.weight_column_name_by_entity_key_plural['menages'])
+    replicate_weights = ReplicateWeights.create(
+        len(weight), method = method, replicates = replicates, strata = strata, seed = seed)
+    return replicate_weights.compute_aggregates(
+        values, weight, names = variables, confidence = confidence, calibration = calibration)
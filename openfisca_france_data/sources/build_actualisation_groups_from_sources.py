@@ -23,13 +23,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from pandas import  HDFStore, ExcelFile
+from pandas import  HDFStore
+from openfisca_france_data.assets import read_excel
 
 def build_actualisation_group_vars_h5():
     h5_name = "../actualisation_groups.h5"
     store = HDFStore(h5_name)
-    xls = ExcelFile('actualisation_groups.xls')
-    df = xls.parse('data', na_values=['NA'])
+    xls_path = 'actualisation_groups.xls'
+    df = read_excel(xls_path, 'data', na_values=['NA'])
     store['vars'] = df
     print df.to_string()
     print store
@@ -45,8 +46,8 @@ def build_actualisation_group_vars_h5():
 def build_actualisation_group_names_h5():
     h5_name = "../actualisation_groups.h5"
     store = HDFStore(h5_name)
-    xls = ExcelFile('actualisation_groups.xls')
-    df = xls.parse('defs', na_values=['NA'])
+    xls_path = 'actualisation_groups.xls'
+    df = read_excel(xls_path, 'defs', na_values=['NA'])
     store['names'] = df
     print df.to_string()
     store.close()
@@ -54,11 +55,11 @@ def build_actualisation_group_names_h5():
 def build_actualisation_group_amounts_h5():
     h5_name = "../actualisation_groups.h5"
     store = HDFStore(h5_name)
-    xls = ExcelFile('actualisation_groups.xls')
-    df_a = xls.parse('amounts', na_values=['NA'])
+    xls_path = 'actualisation_groups.xls'
+    df_a = read_excel(xls_path, 'amounts', na_values=['NA'])
     df_a = df_a.set_index(['case'], drop= True)
-    df_b = xls.parse('benef', na_values=['NA'])
-    df_c = xls.parse('corresp', na_values=['NA'])
+    df_b = read_excel(xls_path, 'benef', na_values=['NA'])
+    df_c = read_excel(xls_path, 'corresp', na_values=['NA'])
     store['amounts'] = df_a
     store['benef']   = df_b
     store['corresp'] = df_c
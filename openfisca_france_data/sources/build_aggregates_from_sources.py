@@ -23,7 +23,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from pandas import  HDFStore, ExcelFile, concat, DataFrame
+from pandas import  HDFStore, concat, DataFrame
+from openfisca_france_data.assets import read_excel
 import os
 from openfisca_core.simulations import SurveySimulation
 from src.plugins.survey.aggregates import Aggregates
@@ -39,11 +40,11 @@ def build_totals():
 
     first = True
     for xlsfile in files:
-        xls = ExcelFile(xlsfile + '.xlsx')
-        print xls.path_or_buf
-        df_a = xls.parse('amounts', na_values=['NA'])
+        xls_path = xlsfile + '.xlsx'
+        print xls_path
+        df_a = read_excel(xls_path, 'amounts', na_values=['NA'])
         try:
-            df_b   = xls.parse('benef', na_values=['NA'])
+            df_b   = read_excel(xls_path, 'benef', na_values=['NA'])
         except:
             df_b = DataFrame()
 
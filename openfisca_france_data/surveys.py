@@ -23,18 +23,37 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
+from __future__ import division
+
 import logging
+import multiprocessing
 import numpy as np
+from pandas import concat, DataFrame, Series
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 
 from openfisca_core import periods, simulations
 import openfisca_france_data
-from openfisca_france_data.input_data_builders.build_openfisca_survey_data.utils import id_formatter
+from openfisca_france_data.model.common import mark_weighted_percentiles
 from openfisca_survey_manager.scenarios import AbstractSurveyScenario
 
 log = logging.getLogger(__name__)
 
 
+ID_VARIABLES = ['idfam', 'idfoy', 'idmen']
+ROLE_BY_ID_VARIABLE = dict(idfam = 'quifam', idfoy = 'quifoy', idmen = 'quimen')
+ID_VARIABLE_BY_ENTITY_KEY_PLURAL = dict(familles = 'idfam', foyers_fiscaux = 'idfoy', menages = 'idmen')
+# Ménage variables depending on quantiles of the whole population and the variables needed to recompute them
+QUANTILE_VARIABLES_DEPENDENCIES = dict(
+    decile = ['nivvie'],
+    decile_net = ['nivvie_net'],
+    pauvre40 = ['nivvie'],
+    pauvre50 = ['nivvie'],
+    pauvre60 = ['nivvie'],
+    )
+
+
 class SurveyScenario(AbstractSurveyScenario):
     def init_from_data_frame(self, input_data_frame = None, tax_benefit_system = None, used_as_input_variables = None,
             year = None):
@@ -50,34 +69,52 @@ class SurveyScenario(AbstractSurveyScenario):
             year = year)
         return self
 
-    def cleanup_input_data_frame(data_frame, filter_entity = None, filter_index = None, simulation = None):
-        person_index = dict()
-        id_variables = [
-            entity.index_for_person_variable_name for entity in simulation.entity_by_key_singular.values()
-            if not entity.is_persons_entity]
+    def cleanup_input_data_frame(self, data_frame, filter_entity = None, filter_index = None):
+        """
+        Restrict data_frame to the entities of filter_entity whose ids are in filter_index
 
+        Every person sharing a famille, a foyer or a ménage with a selected person is kept so that the resulting
+        data frame remains a coherent set of entities. Entity ids are renumbered.
+        """
+        assert filter_entity is not None and filter_index is not None
         if filter_entity.is_persons_entity:
-            selection = data_frame.index.isin(filter_index)
-            person_index[filter_entity.key_plural] = data_frame.index[selection].copy()
+            idmen = data_frame['idmen'][data_frame.index.isin(filter_index)].unique()
         else:
-            selection = data_frame[filter_entity.index_for_person_variable_name].isin(filter_index)
-            id_variables.remove(filter_entity.index_for_person_variable_name)
-            person_index[filter_entity.key_plural] = data_frame.index[selection].copy()
+            id_variable = filter_entity.index_for_person_variable_name
+            idmen = data_frame['idmen'][data_frame[id_variable].isin(filter_index)].unique()
+        return select_input_data_frame(data_frame, idmen = idmen)
 
-        final_selection_index = person_index[filter_entity.index_for_person_variable_name]  # initialisation
+    def sample(self, fraction = None, idmen = None, strata = None, seed = None, rescale_weights = True):
+        """
+        Restrict the scenario to a coherent sample of households
 
-        for entities in simulation.entity_by_key_singular.values():
-            if entity.index_for_person_variable_name in id_variables:
-                other_entity_index = \
-                    data_frame[entity.index_for_person_variable_name][person_index[filter_entity.key_plural]].unique()
-                person_index[entity.key_plural] = \
-                    data_frame.index[data_frame[entity.index_for_person_variable_name].isin(other_entity_index)].copy()
-                final_selection_index += person_index[entity.key_plural]
-
-        data_frame = data_frame.iloc[final_selection_index].copy().reset_index()
-        for entity in simulation.entity_by_key_singular.values():
-            data_frame = id_formatter(data_frame, entity.index_for_person_variable_name)
-        return data_frame
+        Parameters
+        ----------
+        fraction : float, default None
+                   share of the households to draw at random (within each stratum when strata is given)
+        idmen : array-like, default None
+                ids of the households to keep, used instead of a random draw
+        strata : string or Series, default None
+                 name of a ménage level column of the input data frame or Series indexed by idmen (decile, region)
+        seed : int, default None
+               seed of the random draw
+        rescale_weights : bool, default True
+                          whether to rescale the ménage weights by the inverse of the sampling rate of their stratum
+        """
+        assert self.input_data_frame is not None
+        self.input_data_frame = sample_input_data_frame(
+            self.input_data_frame,
+            fraction = fraction,
+            idmen = idmen,
+            strata = strata,
+            seed = seed,
+            weight_column_name = self.weight_column_name_by_entity_key_plural.get('menages') or 'wprm',
+            rescale_weights = rescale_weights,
+            )
+        self.simulation = None
+        if getattr(self, 'reference_simulation', None) is not None:
+            self.reference_simulation = None
+        return self
 
     def initialize_weights(self):
         self.weight_column_name_by_entity_key_plural['menages'] = 'wprm'
@@ -149,3 +186,342 @@ def new_simulation_from_array_dict(array_dict = None, debug = False, debug_all =
         holder.array = np.array(array, dtype = holder.column.dtype)
 
     return simulation
+
+
+def get_coherent_households(data_frame, idmen):
+    """
+    Extend the households idmen with every household sharing a famille or a foyer with one of them
+
+    Returns the sorted array of the ids of the households to keep.
+    """
+    selected_idmen = np.unique(np.asarray(idmen))
+    while True:
+        selection = data_frame['idmen'].isin(selected_idmen).values
+        for id_variable in ['idfam', 'idfoy']:
+            selection = selection | data_frame[id_variable].isin(data_frame[id_variable].values[selection]).values
+        extended_idmen = np.unique(data_frame['idmen'].values[selection])
+        if len(extended_idmen) == len(selected_idmen):
+            return extended_idmen
+        selected_idmen = extended_idmen
+
+
+def renumber_entities_ids(data_frame):
+    """
+    Renumber entity ids from 0 in the order of appearance of the heads of the entities (qui == 0)
+    """
+    for id_variable in ID_VARIABLES:
+        heads = data_frame[ROLE_BY_ID_VARIABLE[id_variable]].values == 0
+        head_ids = data_frame[id_variable].values[heads]
+        assert len(np.unique(head_ids)) == len(head_ids), "Entities {} with several heads".format(id_variable)
+        new_id_by_id = Series(np.arange(len(head_ids)), index = head_ids)
+        new_ids = new_id_by_id.reindex(data_frame[id_variable].values)
+        assert not new_ids.isnull().any(), "Entities {} without head".format(id_variable)
+        data_frame[id_variable] = new_ids.values.astype(int)
+    return data_frame
+
+
+def select_input_data_frame(data_frame, idmen = None):
+    """
+    Extract the persons of the households idmen (and of the households linked to them by a famille or a foyer)
+
+    The entity ids of the extracted data frame are renumbered so that it can be used as a scenario input.
+    """
+    assert idmen is not None
+    coherent_idmen = get_coherent_households(data_frame, idmen)
+    selection = data_frame['idmen'].isin(coherent_idmen).values
+    selected_data_frame = data_frame.loc[selection].copy().reset_index(drop = True)
+    return renumber_entities_ids(selected_data_frame)
+
+
+def draw_households(data_frame, fraction = None, strata = None, seed = None):
+    """
+    Draw a simple random sample of households, stratified when strata is not None
+
+    Returns the array of the ids of the drawn households.
+    """
+    assert fraction is not None and 0 < fraction <= 1
+    heads = data_frame['quimen'].values == 0
+    idmen = data_frame['idmen'].values[heads]
+    strata_by_idmen = get_strata_by_idmen(data_frame, strata)
+    random_state = np.random.RandomState(seed)
+    drawn_idmen = list()
+    for stratum_idmen in idmen_by_stratum(idmen, strata_by_idmen):
+        size = max(1, int(round(fraction * len(stratum_idmen))))
+        drawn_idmen.append(random_state.choice(stratum_idmen, size = size, replace = False))
+    return np.sort(np.concatenate(drawn_idmen))
+
+
+def get_strata_by_idmen(data_frame, strata = None):
+    if strata is None:
+        return None
+    if isinstance(strata, Series):
+        return strata
+    heads = data_frame['quimen'].values == 0
+    return Series(data_frame[strata].values[heads], index = data_frame['idmen'].values[heads])
+
+
+def idmen_by_stratum(idmen, strata_by_idmen = None):
+    if strata_by_idmen is None:
+        return [idmen]
+    household_strata = strata_by_idmen.reindex(idmen).values
+    assert not Series(household_strata).isnull().any(), "Some households have no stratum"
+    return [idmen[household_strata == stratum] for stratum in np.unique(household_strata)]
+
+
+def sample_input_data_frame(data_frame, fraction = None, idmen = None, strata = None, seed = None,
+        weight_column_name = 'wprm', rescale_weights = True):
+    """
+    Extract a coherent sample of households from data_frame
+
+    Households are either drawn at random (stratified by strata when given) or given by idmen. Whole familles and
+    foyers are kept. When rescale_weights is True, the weights of the kept households are multiplied by the ratio of
+    the number of households of their stratum to the number of kept households of this stratum.
+    """
+    assert (fraction is None) != (idmen is None), "Provide either fraction or idmen"
+    if idmen is None:
+        idmen = draw_households(data_frame, fraction = fraction, strata = strata, seed = seed)
+    sampled_data_frame = select_input_data_frame(data_frame, idmen = idmen)
+    if not rescale_weights:
+        return sampled_data_frame
+
+    heads = data_frame['quimen'].values == 0
+    all_idmen = data_frame['idmen'].values[heads]
+    kept_idmen = get_coherent_households(data_frame, idmen)
+    strata_by_idmen = get_strata_by_idmen(data_frame, strata)
+    ratio_by_idmen = Series(1.0, index = kept_idmen)
+    for stratum_idmen in idmen_by_stratum(all_idmen, strata_by_idmen):
+        kept_stratum_idmen = np.intersect1d(stratum_idmen, kept_idmen)
+        if len(kept_stratum_idmen) == 0:
+            log.info("No household kept in a stratum of {} households".format(len(stratum_idmen)))
+            continue
+        ratio_by_idmen.loc[kept_stratum_idmen] = len(stratum_idmen) / len(kept_stratum_idmen)
+
+    original_idmen = data_frame['idmen'].values[data_frame['idmen'].isin(kept_idmen).values]
+    sampled_data_frame[weight_column_name] = \
+        sampled_data_frame[weight_column_name].values * ratio_by_idmen.reindex(original_idmen).values
+    return sampled_data_frame
+
+
+def partition_households(data_frame, chunk_count = None):
+    """
+    Split the households of data_frame into chunk_count groups of whole familles and foyers
+
+    Households linked by a famille or a foyer are always put in the same group. Groups are balanced by number of
+    persons. Returns a list of arrays of idmen.
+    """
+    assert chunk_count is not None and chunk_count >= 1
+    idmen_codes, idmen = factorize(data_frame['idmen'].values)
+    idfam_codes, _ = factorize(data_frame['idfam'].values)
+    idfoy_codes, _ = factorize(data_frame['idfoy'].values)
+    # Graph whose nodes are ménages, then familles, then foyers and whose edges are persons
+    menages_count = len(idmen)
+    familles_count = idfam_codes.max() + 1
+    nodes_count = menages_count + familles_count + idfoy_codes.max() + 1
+    rows = np.concatenate([idmen_codes, idmen_codes])
+    columns = np.concatenate([menages_count + idfam_codes, menages_count + familles_count + idfoy_codes])
+    graph = coo_matrix((np.ones(len(rows), dtype = np.int8), (rows, columns)), shape = (nodes_count, nodes_count))
+    _, labels = connected_components(graph, directed = False)
+    component_by_menage = labels[:menages_count]
+    persons_by_component = np.bincount(labels[idmen_codes])
+
+    # Greedy balancing: biggest components first, each one in the currently smallest chunk
+    chunk_by_component = np.zeros(len(persons_by_component), dtype = int)
+    persons_by_chunk = np.zeros(chunk_count, dtype = int)
+    for component in np.argsort(persons_by_component)[::-1]:
+        if persons_by_component[component] == 0:
+            continue
+        chunk = persons_by_chunk.argmin()
+        chunk_by_component[component] = chunk
+        persons_by_chunk[chunk] += persons_by_component[component]
+    chunk_by_menage = chunk_by_component[component_by_menage]
+    return [
+        idmen[chunk_by_menage == chunk_index]
+        for chunk_index in range(chunk_count)
+        if persons_by_chunk[chunk_index] > 0
+        ]
+
+
+def factorize(values):
+    uniques, codes = np.unique(values, return_inverse = True)
+    return codes, uniques
+
+
+def run_chunk(arguments):
+    """
+    Simulate a chunk of households and return the computed variables as a dict of data frames by entity key plural
+
+    Data frames are indexed by the ids of the entities in the original input data frame (its index for individus).
+    Designed to be mapped over chunks by a multiprocessing.Pool, hence its single argument.
+    """
+    chunk_data_frame, variables, year, used_as_input_variables = arguments
+    original_ids_by_id_variable = dict(
+        (id_variable, chunk_data_frame[id_variable].values[chunk_data_frame[role_variable].values == 0])
+        for id_variable, role_variable in ROLE_BY_ID_VARIABLE.iteritems()
+        )
+    original_index = chunk_data_frame.index.values
+    chunk_data_frame = renumber_entities_ids(chunk_data_frame.reset_index(drop = True))
+
+    survey_scenario = SurveyScenario().init_from_data_frame(
+        input_data_frame = chunk_data_frame,
+        used_as_input_variables = used_as_input_variables,
+        year = year,
+        )
+    survey_scenario.initialize_weights()
+    simulation = survey_scenario.new_simulation()
+
+    array_by_name_by_entity_key_plural = dict()
+    for variable in variables:
+        entity_key_plural = simulation.get_or_new_holder(variable).entity.key_plural
+        array_by_name_by_entity_key_plural.setdefault(entity_key_plural, dict())[variable] = \
+            simulation.calculate(variable)
+
+    data_frame_by_entity_key_plural = dict()
+    for entity_key_plural, array_by_name in array_by_name_by_entity_key_plural.iteritems():
+        weight_variable = survey_scenario.weight_column_name_by_entity_key_plural[entity_key_plural]
+        if weight_variable not in array_by_name:
+            array_by_name[weight_variable] = simulation.calculate(weight_variable)
+        if entity_key_plural == 'individus':
+            index = original_index
+        else:
+            index = original_ids_by_id_variable[ID_VARIABLE_BY_ENTITY_KEY_PLURAL[entity_key_plural]]
+        data_frame_by_entity_key_plural[entity_key_plural] = DataFrame(array_by_name, index = index)
+    return data_frame_by_entity_key_plural
+
+
+def get_chunk_variables(variables):
+    chunk_variables = list(variables)
+    if set(variables).intersection(QUANTILE_VARIABLES_DEPENDENCIES):
+        for variable in variables:
+            chunk_variables.extend(QUANTILE_VARIABLES_DEPENDENCIES.get(variable, []))
+        chunk_variables.extend(['champm', 'wprm'])
+    return list(set(chunk_variables))
+
+
+def iter_chunk_results(input_data_frame = None, variables = None, year = None, chunk_count = None, processes = None,
+        used_as_input_variables = None):
+    """
+    Run one independent simulation by chunk of whole households and yield their results as soon as available
+
+    Each yielded item is a dict of data frames by entity key plural (see run_chunk). Chunks are run in processes
+    parallel processes, or sequentially in the current process when processes is None.
+
+    Quantile based variables (see QUANTILE_VARIABLES_DEPENDENCIES) are computed within each chunk and are therefore
+    wrong: use compute_data_frame_by_entity_by_chunk which recomputes them on the whole population.
+    """
+    assert input_data_frame is not None and variables is not None and year is not None
+    chunks_arguments = (
+        (input_data_frame.loc[input_data_frame['idmen'].isin(idmen).values], variables, year, used_as_input_variables)
+        for idmen in partition_households(input_data_frame, chunk_count = chunk_count or processes or 1)
+        )
+    if processes is None:
+        for chunk_arguments in chunks_arguments:
+            yield run_chunk(chunk_arguments)
+        return
+    pool = multiprocessing.Pool(processes = processes)
+    try:
+        for data_frame_by_entity_key_plural in pool.imap_unordered(run_chunk, chunks_arguments):
+            yield data_frame_by_entity_key_plural
+    finally:
+        pool.close()
+        pool.join()
+
+
+def compute_data_frame_by_entity_by_chunk(input_data_frame = None, variables = None, year = None,
+        chunk_count = None, processes = None, used_as_input_variables = None):
+    """
+    Compute variables by chunks of households and merge the results in one data frame by entity key plural
+    """
+    chunk_variables = get_chunk_variables(variables)
+    data_frames_by_entity_key_plural = dict()
+    for data_frame_by_entity_key_plural in iter_chunk_results(
+            input_data_frame = input_data_frame,
+            variables = chunk_variables,
+            year = year,
+            chunk_count = chunk_count,
+            processes = processes,
+            used_as_input_variables = used_as_input_variables,
+            ):
+        for entity_key_plural, data_frame in data_frame_by_entity_key_plural.iteritems():
+            data_frames_by_entity_key_plural.setdefault(entity_key_plural, list()).append(data_frame)
+
+    data_frame_by_entity_key_plural = dict(
+        (entity_key_plural, concat(data_frames).sort_index())
+        for entity_key_plural, data_frames in data_frames_by_entity_key_plural.iteritems()
+        )
+    if 'menages' in data_frame_by_entity_key_plural:
+        recompute_quantile_variables(data_frame_by_entity_key_plural['menages'])
+    return data_frame_by_entity_key_plural
+
+
+def compute_aggregates_by_chunk(input_data_frame = None, variables = None, year = None, chunk_count = None,
+        processes = None, used_as_input_variables = None):
+    """
+    Compute the weighted totals and weighted counts of beneficiaries of variables by chunks of households
+
+    Totals of the chunks are summed as soon as they are available, which is exact since they are additive. Quantile
+    based variables are recomputed on the whole population before being aggregated.
+    """
+    quantile_variables = [variable for variable in variables if variable in QUANTILE_VARIABLES_DEPENDENCIES]
+    chunk_variables = get_chunk_variables(variables)
+    weight_variables = ['wprm', 'weight_familles', 'weight_foyers', 'weight_individus']
+    amount_by_variable = dict((variable, 0) for variable in variables)
+    beneficiaries_by_variable = dict((variable, 0) for variable in variables)
+    quantile_data_frames = list()
+    for data_frame_by_entity_key_plural in iter_chunk_results(
+            input_data_frame = input_data_frame,
+            variables = chunk_variables,
+            year = year,
+            chunk_count = chunk_count,
+            processes = processes,
+            used_as_input_variables = used_as_input_variables,
+            ):
+        for entity_key_plural, data_frame in data_frame_by_entity_key_plural.iteritems():
+            weight = data_frame[[
+                column for column in data_frame.columns if column in weight_variables
+                ][0]].values
+            for variable in data_frame.columns:
+                if variable not in amount_by_variable or variable in quantile_variables:
+                    continue
+                values = data_frame[variable].values
+                amount_by_variable[variable] += (values * weight).sum()
+                beneficiaries_by_variable[variable] += ((values != 0) * weight).sum()
+        if quantile_variables:
+            quantile_data_frames.append(data_frame_by_entity_key_plural['menages'])
+
+    if quantile_variables:
+        menages_data_frame = recompute_quantile_variables(concat(quantile_data_frames))
+        weight = menages_data_frame['wprm'].values
+        for variable in quantile_variables:
+            values = menages_data_frame[variable].values
+            amount_by_variable[variable] = (values * weight).sum()
+            beneficiaries_by_variable[variable] = ((values != 0) * weight).sum()
+
+    return DataFrame(
+        dict(amount = Series(amount_by_variable), beneficiaries = Series(beneficiaries_by_variable)),
+        index = variables,
+        )
+
+
+def recompute_quantile_variables(menages_data_frame):
+    """
+    Recompute in place the quantile based ménage variables of menages_data_frame on the whole population
+
+    Mimics the formulas of openfisca_france_data.model.common.
+    """
+    quantile_variables = [
+        variable for variable in menages_data_frame.columns if variable in QUANTILE_VARIABLES_DEPENDENCIES]
+    if not quantile_variables:
+        return menages_data_frame
+    champm = menages_data_frame['champm'].values
+    wprm = menages_data_frame['wprm'].values
+    for variable in quantile_variables:
+        standard_of_living = menages_data_frame[QUANTILE_VARIABLES_DEPENDENCIES[variable][0]].values
+        if variable.startswith('decile'):
+            decile = mark_weighted_percentiles(standard_of_living, np.arange(1, 11), wprm * champm, 2)
+            menages_data_frame[variable] = decile * champm
+        else:
+            _, values = mark_weighted_percentiles(
+                standard_of_living, np.arange(1, 3), wprm * champm, 2, return_quantiles = True)
+            threshold = int(variable[len('pauvre'):]) / 100 * values[1]
+            menages_data_frame[variable] = (standard_of_living <= threshold) * champm
+    return menages_data_frame
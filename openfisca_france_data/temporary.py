@@ -29,29 +29,137 @@ import logging
 from ConfigParser import SafeConfigParser
 from pandas import HDFStore
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 log = logging.getLogger(__name__)
 
 from . import default_config_files_directory
 
 
+def get_tmp_directory(config_files_directory = default_config_files_directory):
+    parser = SafeConfigParser()
+    config_local_ini = os.path.join(config_files_directory, 'config_local.ini')
+    config_ini = os.path.join(config_files_directory, 'config.ini')
+    _ = parser.read([config_ini, config_local_ini])
+    return parser.get('data', 'tmp_directory')
+
+
+# Locks held by this process, by store file path: [lock file, number of reading sessions, number of writing sessions,
+# whether the lock is exclusive]
+lock_by_path = dict()
+
+
+def acquire_lock(file_path, exclusive = False):
+    """
+    Lock file_path for reading (shared lock) or writing (exclusive lock) using a .lock file next to it
+
+    Sessions of the same process share the lock. It is taken exclusively when the first session is a writing one and
+    kept so until all the sessions of the process are closed: flock does not convert locks atomically, so a shared lock
+    is never upgraded (a writing session can not start while reading sessions of the same process are open) and an
+    exclusive lock is never downgraded.
+    """
+    lock = lock_by_path.get(file_path)
+    if lock is None:
+        lock_file = open("{}.lock".format(file_path), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        lock = lock_by_path[file_path] = [lock_file, 0, 0, exclusive]
+    else:
+        assert not exclusive or lock[3], \
+            "Can not write to {} while reading sessions of this process are open: close them first".format(file_path)
+    lock[2 if exclusive else 1] += 1
+
+
+def release_lock(file_path, exclusive = False):
+    """
+    Release a session lock taken by acquire_lock, releasing the file lock when no session of the process remains
+    """
+    lock = lock_by_path.get(file_path)
+    if lock is None:
+        return
+    lock[2 if exclusive else 1] -= 1
+    if lock[1] + lock[2] == 0:
+        del lock_by_path[file_path]
+        # Closing the lock file releases the lock
+        lock[0].close()
+
+
 class TemporaryStore(HDFStore):
+    """
+    HDFStore of the temporary data, locked while open
+
+    Read-only sessions (mode 'r') take a shared lock, so that many processes can read the store at the same time.
+    Write sessions (modes 'a', 'r+' and 'w') take an exclusive lock and wait for the running sessions to end. The file
+    is opened, and the lock taken, at the first access (or when entering a with statement) and they are released on
+    close. Within a process, a write session can only start when no read session of the same file is open.
+    """
+    def __init__(self, path, mode = 'a', lazy = True, **kwargs):
+        self._lazy = lazy
+        self._pending_open_kwargs = None
+        self._locked = False
+        self._lock_exclusive = False
+        super(TemporaryStore, self).__init__(path, mode = mode, **kwargs)
 
     @classmethod
-    def create(cls, config_files_directory = default_config_files_directory, file_name = None, file_path = None):
+    def create(cls, config_files_directory = default_config_files_directory, file_name = None, file_path = None,
+            mode = 'a', lazy = True):
         if file_path is None:
-            parser = SafeConfigParser()
-            config_local_ini = os.path.join(config_files_directory, 'config_local.ini')
-            config_ini = os.path.join(config_files_directory, 'config.ini')
-            _ = parser.read([config_ini, config_local_ini])
-            tmp_directory = parser.get('data', 'tmp_directory')
+            tmp_directory = get_tmp_directory(config_files_directory)
             if file_name is not None:
                 if not file_name.endswith('.h5'):
                     file_name = "{}.h5".format(file_name)
                 file_path = os.path.join(tmp_directory, file_name)
             else:
                 file_path = os.path.join(tmp_directory, 'temp.h5')
-            self = cls(file_path)
-            return self
+        return cls(file_path, mode = mode, lazy = lazy)
+
+    def open(self, mode = 'a', **kwargs):
+        if self._lazy:
+            # Defer the opening to the first access
+            self._lazy = False
+            self._mode = mode
+            self._pending_open_kwargs = kwargs
+            return
+        self._pending_open_kwargs = None
+        if self.is_open:
+            self.close()
+        # Release any lock still held and take it again in the requested mode
+        self._unlock()
+        acquire_lock(os.path.abspath(self._path), exclusive = mode != 'r')
+        self._locked = True
+        self._lock_exclusive = mode != 'r'
+        try:
+            super(TemporaryStore, self).open(mode = mode, **kwargs)
+        except Exception:
+            self._unlock()
+            raise
+
+    def _check_if_open(self):
+        if self._pending_open_kwargs is not None:
+            self.open(mode = self._mode, **self._pending_open_kwargs)
+        super(TemporaryStore, self)._check_if_open()
+
+    def _unlock(self):
+        if self._locked:
+            release_lock(os.path.abspath(self._path), exclusive = self._lock_exclusive)
+            self._locked = False
+
+    def close(self):
+        self._pending_open_kwargs = None
+        try:
+            super(TemporaryStore, self).close()
+        finally:
+            self._unlock()
+
+    def __enter__(self):
+        self._check_if_open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def extract(self, name = None, variables = None):
         assert name is not None
@@ -60,8 +168,6 @@ class TemporaryStore(HDFStore):
             return data_frame
         else:
             return data_frame[variables].copy()
-        self.close()
-        return data_frame
 
     def show(self):
         log.info("{}".format(self))
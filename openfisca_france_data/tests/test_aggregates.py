@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+import pandas
+
+
+from openfisca_france_data.aggregates import (build_aggregates_comparison, compute_openfisca_aggregates,
+    compute_weighted_aggregates)
+
+
+class FakeEntity(object):
+    def __init__(self, key_plural):
+        self.key_plural = key_plural
+
+
+class FakeHolder(object):
+    def __init__(self, entity):
+        self.entity = entity
+
+
+class FakeSimulation(object):
+    def __init__(self, array_by_variable, entity_key_plural_by_variable):
+        self.array_by_variable = array_by_variable
+        self.entity_key_plural_by_variable = entity_key_plural_by_variable
+
+    def calculate(self, variable):
+        return self.array_by_variable[variable]
+
+    def get_or_new_holder(self, variable):
+        return FakeHolder(FakeEntity(self.entity_key_plural_by_variable[variable]))
+
+
+class FakeSurveyScenario(object):
+    weight_column_name_by_entity_key_plural = dict(individus = 'weight_individus', menages = 'wprm')
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+
+def build_survey_scenario():
+    simulation = FakeSimulation(
+        dict(
+            salaire = numpy.array([1000., 0, 2000., 500.]),
+            weight_individus = numpy.array([1., 2., 3., 4.]),
+            af = numpy.array([0., 120.]),
+            loyer = numpy.array([300., 400.]),
+            wprm = numpy.array([10., 20.]),
+            ),
+        dict(salaire = 'individus', af = 'menages', loyer = 'menages'),
+        )
+    return FakeSurveyScenario(simulation)
+
+
+def test_compute_weighted_aggregates():
+    values = numpy.array([[1., 0, 3., -2.], [0, 0, 0, 0]])
+    weight = numpy.array([1., 2., 3., 4.])
+    amount, beneficiaries, mean = compute_weighted_aggregates(values, weight)
+    assert numpy.allclose(amount, [(values[0] * weight).sum(), 0])
+    assert numpy.allclose(beneficiaries, [8, 0])
+    assert numpy.allclose(mean, [(values[0] * weight).sum() / 8, 0])
+    # A single variable
+    amount, beneficiaries, mean = compute_weighted_aggregates(values[0], weight)
+    assert amount.shape == (1,)
+    assert numpy.allclose(amount, (values[0] * weight).sum())
+
+
+def test_compute_openfisca_aggregates():
+    survey_scenario = build_survey_scenario()
+    aggregates = compute_openfisca_aggregates(survey_scenario, variables = ['loyer', 'salaire', 'af'], unit = 1e3)
+    assert list(aggregates.index) == ['loyer', 'salaire', 'af']
+    assert list(aggregates.entity) == ['menages', 'individus', 'menages']
+    assert numpy.allclose(aggregates.amount, [11, 9, 2.4])
+    assert numpy.allclose(aggregates.beneficiaries, [30, 8, 20])
+    assert numpy.allclose(aggregates['mean'], [11000 / 30, 9000 / 8, 120])
+
+
+def test_build_aggregates_comparison():
+    survey_scenario = build_survey_scenario()
+    openfisca_aggregates = compute_openfisca_aggregates(survey_scenario, variables = ['af', 'loyer'])
+    erf_aggregates = pandas.DataFrame(
+        dict(amount = [.003], beneficiaries = [25.], mean = [120.]),
+        index = ['af'],
+        ).reindex(['af', 'loyer'])
+    comparison = build_aggregates_comparison(openfisca_aggregates, erf_aggregates)
+    assert list(comparison.index) == ['af', 'loyer']
+    assert numpy.allclose(comparison.amount_of, [.0024, .011])
+    assert numpy.isclose(comparison.amount_erf['af'], .003)
+    assert numpy.isclose(comparison.beneficiaries_erf['af'], 25)
+    assert numpy.isclose(comparison.difference['af'], -.0006)
+    assert numpy.isclose(comparison.relative_difference['af'], -.2)
+    # Variables without ERF aggregate have missing differences
+    assert comparison.loc['loyer', ['amount_erf', 'difference', 'relative_difference']].isnull().all()
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_compute_weighted_aggregates()
+    test_compute_openfisca_aggregates()
+    test_build_aggregates_comparison()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+
+from pandas import DataFrame
+
+
+from openfisca_france_data import assets
+
+
+class FakeExcelFile(object):
+    """Excel file whose sheets are DataFrames of the parse count, the path and the sheet name"""
+    parsed_sheets = list()
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def parse(self, sheetname, **kwargs):
+        FakeExcelFile.parsed_sheets.append((self.file_path, sheetname))
+        return DataFrame(dict(
+            parse_count = [len(FakeExcelFile.parsed_sheets)],
+            file_path = [self.file_path],
+            sheetname = [sheetname],
+            ))
+
+
+class TestReadExcel(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'asset.xls')
+        with open(self.file_path, 'w') as asset_file:
+            asset_file.write('excel')
+        self.excel_file = assets.ExcelFile
+        self.get_tmp_directory = assets.get_tmp_directory
+        assets.ExcelFile = FakeExcelFile
+        assets.get_tmp_directory = lambda: self.directory
+        assets.data_frame_by_key.clear()
+        del FakeExcelFile.parsed_sheets[:]
+
+    setup_method = setup
+
+    def teardown(self):
+        assets.ExcelFile = self.excel_file
+        assets.get_tmp_directory = self.get_tmp_directory
+        assets.data_frame_by_key.clear()
+        shutil.rmtree(self.directory)
+
+    teardown_method = teardown
+
+    def test_cache_hit(self):
+        data_frame = assets.read_excel(self.file_path, sheetname = 'sheet')
+        assert data_frame.parse_count[0] == 1
+        assert data_frame.sheetname[0] == 'sheet'
+        # Memory cache
+        assert (assets.read_excel(self.file_path, sheetname = 'sheet') == data_frame).all().all()
+        # Disk cache, as in a new process
+        assets.data_frame_by_key.clear()
+        assert (assets.read_excel(self.file_path, sheetname = 'sheet') == data_frame).all().all()
+        assert len(FakeExcelFile.parsed_sheets) == 1
+        assert len(os.listdir(os.path.join(self.directory, 'excel_assets'))) == 1
+        # Another sheet or other parse arguments are parsed
+        assert assets.read_excel(self.file_path, sheetname = 'other_sheet').parse_count[0] == 2
+        assert assets.read_excel(self.file_path, sheetname = 'sheet', skiprows = 1).parse_count[0] == 3
+
+    def test_reparse_after_modification(self):
+        assert assets.read_excel(self.file_path, sheetname = 'sheet').parse_count[0] == 1
+        modification_time = os.path.getmtime(self.file_path) + 10
+        os.utime(self.file_path, (modification_time, modification_time))
+        assert assets.read_excel(self.file_path, sheetname = 'sheet').parse_count[0] == 2
+        assets.data_frame_by_key.clear()
+        assert assets.read_excel(self.file_path, sheetname = 'sheet').parse_count[0] == 2
+        assert len(FakeExcelFile.parsed_sheets) == 2
+
+    def test_independent_copy(self):
+        data_frame = assets.read_excel(self.file_path, sheetname = 'sheet')
+        data_frame['parse_count'] = 100
+        data_frame['new_column'] = 1
+        data_frame = assets.read_excel(self.file_path, sheetname = 'sheet')
+        assert data_frame.parse_count[0] == 1
+        assert 'new_column' not in data_frame.columns
+
+    def test_without_tmp_directory(self):
+        def get_tmp_directory():
+            raise IOError('No configuration')
+        assets.get_tmp_directory = get_tmp_directory
+        assert assets.read_excel(self.file_path, sheetname = 'sheet').parse_count[0] == 1
+        assert assets.read_excel(self.file_path, sheetname = 'sheet').parse_count[0] == 1
+        assert not os.path.exists(os.path.join(self.directory, 'excel_assets'))
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    for test_name in sorted(dir(TestReadExcel)):
+        if test_name.startswith('test_'):
+            test = TestReadExcel()
+            test.setup()
+            try:
+                getattr(test, test_name)()
+            finally:
+                test.teardown()
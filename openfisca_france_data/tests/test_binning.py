@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+
+
+from openfisca_france_data.binning import bin_values, weighted_quantiles
+
+
+def test_bin_values():
+    random_state = numpy.random.RandomState(1)
+    surface = random_state.uniform(0, 200, 1000)
+    surface[::10] = numpy.nan
+    cuts = [15, 30, 40, 60, 80, 100, 150]
+    categories = bin_values(surface, cuts)
+    assert categories.dtype == numpy.int8
+    assert (categories == 1 + sum((surface > cut) for cut in cuts)).all()
+    age = random_state.randint(18, 99, 1000)
+    assert (bin_values(age, [40, 65], right = False) == 1 + (age >= 40) + (age >= 65)).all()
+
+
+def test_weighted_deciles():
+    random_state = numpy.random.RandomState(1)
+    values = random_state.lognormal(8, 1, 10000)
+    # Doubling the weight of a value is the same as duplicating it
+    weights = numpy.ones(10000)
+    weights[:5000] = 2
+    duplicated_values = numpy.concatenate([values, values[:5000]])
+    deciles, cuts = bin_values(values, weights = weights, quantiles = 10, return_cuts = True)
+    assert numpy.allclose(cuts, weighted_quantiles(duplicated_values, numpy.ones(15000), numpy.arange(1, 10) / 10),
+        rtol = 1e-2)
+    assert numpy.allclose(numpy.bincount(deciles, weights = weights)[1:], 1500, rtol = 1e-2)
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_bin_values()
+    test_weighted_deciles()
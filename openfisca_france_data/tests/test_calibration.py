@@ -24,9 +24,15 @@
 
 import pkg_resources
 import os
+import shutil
+import tempfile
 
+import numpy
+from openfisca_core.columns import BoolCol, EnumCol, FloatCol
 
-from openfisca_france_data.calibration import Calibration
+
+from openfisca_france_data.calibration import (build_indicator_matrix, Calibration, load_calibrated_weights,
+    propagate_menage_weights, run_calibration_jobs)
 from openfisca_france_data.input_data_builders import get_input_data_frame
 from openfisca_france_data.surveys import SurveyScenario
 
@@ -34,6 +40,151 @@ from openfisca_france_data.surveys import SurveyScenario
 openfisca_france_data_location = pkg_resources.get_distribution('openfisca-france-data').location
 
 
+def build_column(column_class, entity, dtype, consumers = None):
+    column = column_class()
+    column.entity = entity
+    column.dtype = dtype
+    column.consumers = consumers
+    return column
+
+
+class FakeTaxBenefitSystem(object):
+    def __init__(self, column_by_name):
+        self.column_by_name = column_by_name
+
+
+class FakeHolder(object):
+    def __init__(self, column, array, real_formula = None):
+        self.column = column
+        self.array = array
+        self.real_formula = real_formula
+
+    def delete_arrays(self):
+        self.array = None
+
+
+class FakeSimulation(object):
+    def __init__(self, array_by_name, tax_benefit_system, formula_variables):
+        self.tax_benefit_system = tax_benefit_system
+        self.holder_by_name = dict(
+            (name, FakeHolder(
+                tax_benefit_system.column_by_name.get(name),
+                array,
+                real_formula = name if name in formula_variables else None,
+                ))
+            for name, array in array_by_name.iteritems()
+            )
+        self.calculated_variables = list()
+
+    def calculate(self, variable):
+        self.calculated_variables.append(variable)
+        return self.holder_by_name[variable].array
+
+    def get_or_new_holder(self, variable):
+        return self.holder_by_name[variable]
+
+
+class FakeSurveyScenario(object):
+    """Survey of random ménages of 1 to 4 individuals, with a famille by ménage and a second foyer in big ménages"""
+    weight_column_name_by_entity_key_plural = dict(
+        familles = 'weight_familles',
+        foyers_fiscaux = 'weight_foyers',
+        individus = 'weight_individus',
+        menages = 'wprm',
+        )
+
+    def __init__(self, menages_count = 200, seed = 1):
+        random_state = numpy.random.RandomState(seed)
+        sizes = random_state.randint(1, 5, menages_count)
+        idmen = numpy.repeat(numpy.arange(menages_count), sizes)
+        position = numpy.arange(len(idmen)) - numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+        foyers, first_members, idfoy = numpy.unique(idmen * 2 + (position >= 2), return_index = True,
+            return_inverse = True)
+        quifoy = numpy.ones(len(idmen), dtype = int)
+        quifoy[first_members] = 0
+        # Individuals are not sorted by ménage
+        order = random_state.permutation(len(idmen))
+        array_by_name = dict(
+            idmen = idmen[order],
+            quimen = numpy.minimum(position, 2)[order],
+            idfam = idmen[order],
+            quifam = numpy.minimum(position, 2)[order],
+            idfoy = idfoy[order],
+            quifoy = quifoy[order],
+            champm = random_state.uniform(size = menages_count) > .1,
+            typmen = random_state.randint(1, 5, menages_count),
+            revenu = random_state.lognormal(10, .5, menages_count),
+            wprm = random_state.uniform(50, 150, menages_count),
+            weight_familles = numpy.zeros(menages_count),
+            weight_foyers = numpy.zeros(len(foyers)),
+            weight_individus = numpy.zeros(len(idmen)),
+            revenu_pondere = numpy.zeros(menages_count),
+            )
+        self.tax_benefit_system = FakeTaxBenefitSystem(dict(
+            champm = build_column(BoolCol, 'men', numpy.bool_),
+            typmen = build_column(EnumCol, 'men', numpy.int16),
+            revenu = build_column(FloatCol, 'men', numpy.float32),
+            wprm = build_column(FloatCol, 'men', numpy.float32, consumers = ['revenu_pondere']),
+            weight_familles = build_column(FloatCol, 'fam', numpy.float32),
+            weight_foyers = build_column(FloatCol, 'foy', numpy.float32),
+            weight_individus = build_column(FloatCol, 'ind', numpy.float32),
+            revenu_pondere = build_column(FloatCol, 'men', numpy.float32),
+            ))
+        self.simulation = FakeSimulation(array_by_name, self.tax_benefit_system,
+            formula_variables = ['revenu_pondere'])
+
+
+def create_calibration(survey_scenario):
+    calibration = Calibration(survey_scenario = survey_scenario)
+    calibration.set_survey_scenario(survey_scenario)
+    calibration.set_parameters('method', 'linear')
+    return calibration
+
+
+def test_margin_design_cache():
+    survey_scenario = FakeSurveyScenario()
+    simulation = survey_scenario.simulation
+    calibration = create_calibration(survey_scenario)
+    categories, design = calibration.get_margin_design('typmen')
+    assert list(categories) == [1, 2, 3, 4]
+    assert calibration.get_margin_design('typmen')[1] is design
+    assert simulation.calculated_variables.count('typmen') == 1
+    categories, revenu_design = calibration.get_margin_design('revenu')
+    assert categories is None and revenu_design.shape == (200, 1)
+
+    # New margins of the same variables use the cached designs
+    typmen = simulation.holder_by_name['typmen'].array
+    for target_by_category in [{1: 5000., 2: 6000.}, {3: 4000., 4: 5500.}]:
+        filtered_weight = calibration.weight * calibration.filter_by
+        calibration.margins_by_name = None
+        calibration.set_target_margin_by_category('typmen', target_by_category)
+        calibration.set_target_margin_by_category('revenu', {0: 4e8})
+        keys, margins_design, targets = calibration.get_design()
+        assert keys == [('revenu', None)] + [('typmen', category) for category in sorted(target_by_category)]
+        assert margins_design.shape == (200, 3)
+        for category, margin in calibration.margins_by_name['typmen']['actual'].iteritems():
+            assert numpy.isclose(margin, filtered_weight[typmen == category].sum())
+        calibration.calibrate()
+        weight = calibration.weight * calibration.filter_by
+        assert numpy.allclose(margins_design.T.dot(weight), targets)
+        # The targets are proportions of the population
+        for category, target in target_by_category.iteritems():
+            assert numpy.isclose(weight[typmen == category].sum(),
+                target * calibration.initial_total_population / sum(target_by_category.values()))
+    assert simulation.calculated_variables.count('typmen') == 1
+    assert simulation.calculated_variables.count('revenu') == 1
+
+    # A new filter gives new categories
+    calibration.filter_by = simulation.holder_by_name['champm'].array & (typmen != 4)
+    categories, design = calibration.get_margin_design('typmen')
+    assert list(categories) == [1, 2, 3]
+    assert design.shape == (200, 3)
+    assert (design.toarray()[typmen == 4] == 0).all()
+    # Setting the survey scenario again reads the filter from the simulation
+    calibration.set_survey_scenario(survey_scenario)
+    assert list(calibration.get_margin_design('typmen')[0]) == [1, 2, 3, 4]
+
+
 def test_calibration():
     year = 2006
     input_data_frame = get_input_data_frame(year)
@@ -61,9 +212,123 @@ def test_calibration():
     calibration.set_parameters('method', 'logit')
     calibration.calibrate()
 
+def test_build_indicator_matrix():
+    random_state = numpy.random.RandomState(2)
+    for value, categories in [
+            (random_state.randint(0, 300, 5000), numpy.unique(random_state.randint(0, 300, 200))),
+            (numpy.array([3, 1, 2, 3, 7, 0]), numpy.array([1, 3])),
+            (numpy.array([True, False, True]), numpy.array([False, True])),
+            (numpy.array([2., 5., 2.]), numpy.array([2.])),
+            ]:
+        indicator_matrix = build_indicator_matrix(value, categories)
+        assert indicator_matrix.format == 'csr'
+        assert indicator_matrix.shape == (len(value), len(categories))
+        # Dense indicators as computed before the sparse matrices
+        dense = (value[:, numpy.newaxis] == categories[numpy.newaxis, :]).astype(numpy.float64)
+        assert (indicator_matrix.toarray() == dense).all()
+        weight = random_state.uniform(size = len(value))
+        assert numpy.allclose(indicator_matrix.T.dot(weight), dense.T.dot(weight))
+
+
+def test_run_calibration_jobs():
+    survey_scenario = FakeSurveyScenario()
+    arrays = dict((name, holder.array) for name, holder in survey_scenario.simulation.holder_by_name.iteritems())
+    filtered_weight = arrays['wprm'] * arrays['champm']
+    total_population = filtered_weight.sum() * 1.05
+    revenu_target = (arrays['revenu'] * filtered_weight).sum() * 1.08
+    directory = tempfile.mkdtemp()
+    try:
+        margins_file_path = os.path.join(directory, 'margins.csv')
+        with open(margins_file_path, 'w') as margins_file:
+            margins_file.write('\n'.join([
+                'variable,category,2006',
+                'total_population,0,{}'.format(total_population),
+                'revenu,0,{}'.format(revenu_target),
+                'typmen,1,0.3',
+                'typmen,2,0.2',
+                'typmen,3,0.25',
+                'typmen,4,0.25',
+                ]))
+        jobs = [
+            dict(year = 2006, margins_file_path = margins_file_path, survey_scenario = survey_scenario),
+            dict(year = 2006, margins_file_path = margins_file_path, method = 'logit',
+                parameters = dict(lo = .5, up = 2), survey_scenario = FakeSurveyScenario()),
+            # No margins for 2007 in the file: the job is skipped
+            dict(year = 2007, margins_file_path = margins_file_path, survey_scenario = FakeSurveyScenario()),
+            ]
+        weights_file_path = os.path.join(directory, 'weights.npz')
+        weight_by_key, margins_data_frame = run_calibration_jobs(jobs, weights_file_path = weights_file_path)
+        assert sorted(weight_by_key) == ['2006_margins_linear', '2006_margins_logit']
+        for key, weight in weight_by_key.iteritems():
+            weight = weight * arrays['champm']
+            assert numpy.isclose(weight.sum(), total_population)
+            assert numpy.isclose((weight * arrays['revenu']).sum(), revenu_target)
+            assert numpy.isclose(weight[arrays['typmen'] == 1].sum(), total_population * .3)
+        # lo is stored as invlo and used as the lower bound of the logit method
+        ratio = weight_by_key['2006_margins_logit'][arrays['champm']] / arrays['wprm'][arrays['champm']]
+        assert ratio.min() >= .5 - 1e-9 and ratio.max() <= 2 + 1e-9
+        assert ratio.min() < .9
+        linear_ratio = weight_by_key['2006_margins_linear'][arrays['champm']] / arrays['wprm'][arrays['champm']]
+        assert linear_ratio.min() < ratio.min()
+
+        assert list(margins_data_frame.columns) == ['job', 'variable', 'category', 'initial', 'target', 'actual']
+        assert sorted(margins_data_frame.job.unique()) == ['2006_margins_linear', '2006_margins_logit']
+        assert len(margins_data_frame) == 2 * 6
+        # The typmen targets are proportions of the total population
+        is_typmen = (margins_data_frame.variable == 'typmen').values
+        target = margins_data_frame.target.values.astype(float)
+        assert numpy.allclose(margins_data_frame.actual.values.astype(float),
+            numpy.where(is_typmen, target * total_population, target))
+
+        loaded_weight_by_key = load_calibrated_weights(weights_file_path)
+        assert sorted(loaded_weight_by_key) == sorted(weight_by_key)
+        for key, weight in weight_by_key.iteritems():
+            assert (loaded_weight_by_key[key] == weight).all()
+
+        # Only skipped jobs
+        weight_by_key, margins_data_frame = run_calibration_jobs(jobs[2:])
+        assert weight_by_key == dict()
+        assert margins_data_frame.empty
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_propagate_menage_weights():
+    survey_scenario = FakeSurveyScenario()
+    holder_by_name = survey_scenario.simulation.holder_by_name
+    holder_by_name['wprm'].array = numpy.arange(200, dtype = numpy.float32) + 1
+    propagate_menage_weights(survey_scenario)
+    idmen = holder_by_name['idmen'].array
+    wprm = holder_by_name['wprm'].array
+    assert (holder_by_name['weight_individus'].array == wprm[idmen]).all()
+    # Every member of a famille or a foyer has the weight of their ménage
+    assert (holder_by_name['weight_familles'].array[holder_by_name['idfam'].array] == wprm[idmen]).all()
+    assert (holder_by_name['weight_foyers'].array[holder_by_name['idfoy'].array] == wprm[idmen]).all()
+    assert len(holder_by_name['weight_foyers'].array) > 200
+    for weight_name in ['weight_familles', 'weight_foyers', 'weight_individus']:
+        assert holder_by_name[weight_name].array.dtype == numpy.float32
+    # The variables computed from the weights are computed again
+    assert holder_by_name['revenu_pondere'].array is None
+
+    # Calibrated weights
+    calibration = create_calibration(survey_scenario)
+    calibration.set_target_margin_by_category('typmen', {1: 1., 2: 2., 3: 3., 4: 4.})
+    calibration.calibrate()
+    calibration.set_calibrated_weights()
+    wprm = holder_by_name['wprm'].array
+    assert numpy.allclose(wprm, calibration.weight)
+    assert (holder_by_name['weight_individus'].array == wprm[idmen]).all()
+    assert (holder_by_name['weight_familles'].array[holder_by_name['idfam'].array] == wprm[idmen]).all()
+    assert (holder_by_name['weight_foyers'].array[holder_by_name['idfoy'].array] == wprm[idmen]).all()
+
+
 if __name__ == '__main__':
     import logging
     log = logging.getLogger(__name__)
     import sys
     logging.basicConfig(level = logging.INFO, stream = sys.stdout)
     test_calibration()
+    test_margin_design_cache()
+    test_build_indicator_matrix()
+    test_run_calibration_jobs()
+    test_propagate_menage_weights()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+from scipy import sparse
+
+
+from openfisca_france_data.calmar import calibrate_weights
+
+
+def create_calibration_problem():
+    random_state = numpy.random.RandomState(1)
+    count = 1000
+    category = random_state.randint(0, 5, count)
+    income = random_state.lognormal(10, 1, count)
+    design = numpy.column_stack([numpy.ones(count)] + [category == index for index in range(5)] + [income])
+    initial_weight = random_state.uniform(50, 150, count)
+    targets = design.T.dot(initial_weight) * random_state.uniform(.95, 1.05, design.shape[1])
+    targets[1:6] *= targets[0] / targets[1:6].sum()
+    return design, initial_weight, targets
+
+
+def test_calibrate_weights():
+    design, initial_weight, targets = create_calibration_problem()
+    for method, lo, up in [('linear', None, None), ('raking ratio', None, None), ('logit', .5, 2)]:
+        weight, lambda_ = calibrate_weights(design, initial_weight, targets, method = method, lo = lo, up = up)
+        assert numpy.allclose(design.T.dot(weight), targets, rtol = 1e-8)
+        if method == 'logit':
+            assert (weight / initial_weight >= .5).all() and (weight / initial_weight <= 2).all()
+        sparse_weight, _ = calibrate_weights(
+            sparse.csr_matrix(design), initial_weight, targets, method = method, lo = lo, up = up)
+        assert numpy.allclose(weight, sparse_weight)
+
+
+def test_calibrate_weights_warm_start():
+    design, initial_weight, targets = create_calibration_problem()
+    weight, lambda_ = calibrate_weights(design, initial_weight, targets, method = 'raking ratio')
+    targets[-1] *= 1.001
+    warm_weight, _ = calibrate_weights(
+        design, initial_weight, targets, method = 'raking ratio', initial_lambda = lambda_, max_iterations = 3)
+    assert numpy.allclose(design.T.dot(warm_weight), targets, rtol = 1e-8)
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_calibrate_weights()
+    test_calibrate_weights_warm_start()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+import pandas
+
+
+from openfisca_france_data.model.common import mark_weighted_percentiles
+from openfisca_france_data.surveys import partition_households, recompute_quantile_variables
+
+
+def create_input_data_frame(menages_count = 300, seed = 1):
+    """Individuals of random ménages, some of whose familles and foyers span two ménages"""
+    random_state = numpy.random.RandomState(seed)
+    sizes = random_state.randint(1, 6, menages_count)
+    idmen = numpy.repeat(numpy.arange(menages_count), sizes)
+    # One famille and one foyer by ménage, then some of them are merged with the ones of the next ménage
+    idfam = idmen.copy()
+    idfoy = idmen.copy()
+    for menage in random_state.choice(menages_count - 1, min(20, menages_count - 1), replace = False):
+        idfam[idmen == menage + 1] = idfam[idmen == menage].max()
+    for menage in random_state.choice(menages_count - 1, min(20, menages_count - 1), replace = False):
+        idfoy[idmen == menage + 1] = idfoy[idmen == menage].max()
+    return pandas.DataFrame(dict(idmen = idmen + 1000, idfam = idfam, idfoy = idfoy))
+
+
+def get_biggest_linked_group_size(data_frame):
+    """Number of persons of the biggest group of ménages linked by familles and foyers"""
+    group_by_idmen = dict((idmen, idmen) for idmen in data_frame.idmen.unique())
+
+    def find(idmen):
+        while group_by_idmen[idmen] != idmen:
+            idmen = group_by_idmen[idmen]
+        return idmen
+
+    for id_variable in ['idfam', 'idfoy']:
+        for idmen in data_frame.groupby(id_variable)['idmen'].unique():
+            for other_idmen in idmen[1:]:
+                group_by_idmen[find(other_idmen)] = find(idmen[0])
+    return data_frame.idmen.map(find).value_counts().max()
+
+
+def test_partition_households():
+    data_frame = create_input_data_frame()
+    chunks = partition_households(data_frame, chunk_count = 4)
+    assert len(chunks) == 4
+    # Every ménage is in exactly one chunk
+    all_idmen = numpy.concatenate(chunks)
+    assert len(all_idmen) == len(numpy.unique(all_idmen))
+    assert (numpy.sort(all_idmen) == numpy.unique(data_frame.idmen)).all()
+    chunk_by_idmen = pandas.Series(
+        numpy.concatenate([numpy.repeat(chunk, len(idmen)) for chunk, idmen in enumerate(chunks)]),
+        index = all_idmen,
+        )
+    chunk_by_person = chunk_by_idmen.reindex(data_frame.idmen.values).values
+    # No famille nor foyer is split across chunks
+    for id_variable in ['idfam', 'idfoy']:
+        assert (pandas.Series(chunk_by_person).groupby(data_frame[id_variable].values).nunique() == 1).all()
+    # Chunks are balanced by number of persons: they differ by at most the biggest group of linked ménages
+    persons_by_chunk = numpy.bincount(chunk_by_person)
+    assert persons_by_chunk.sum() == len(data_frame)
+    assert persons_by_chunk.max() - persons_by_chunk.min() <= get_biggest_linked_group_size(data_frame)
+    # A single chunk and more chunks than ménages
+    assert len(partition_households(data_frame, chunk_count = 1)) == 1
+    small_data_frame = create_input_data_frame(menages_count = 5)
+    chunks = partition_households(small_data_frame, chunk_count = 10)
+    assert 1 <= len(chunks) <= 5
+    assert all(len(idmen) > 0 for idmen in chunks)
+
+
+def create_menages_data_frame(menages_count = 1000, seed = 2):
+    random_state = numpy.random.RandomState(seed)
+    return pandas.DataFrame(dict(
+        nivvie = random_state.lognormal(9.8, .6, menages_count),
+        nivvie_net = random_state.lognormal(9.7, .6, menages_count),
+        wprm = random_state.uniform(100, 2000, menages_count),
+        champm = random_state.uniform(size = menages_count) > .05,
+        decile = numpy.zeros(menages_count),
+        decile_net = numpy.zeros(menages_count),
+        pauvre40 = numpy.zeros(menages_count),
+        pauvre50 = numpy.zeros(menages_count),
+        pauvre60 = numpy.zeros(menages_count),
+        ))
+
+
+def test_recompute_quantile_variables():
+    menages_data_frame = recompute_quantile_variables(create_menages_data_frame())
+    nivvie = menages_data_frame.nivvie.values
+    wprm = menages_data_frame.wprm.values
+    champm = menages_data_frame.champm.values
+    # Same computations as the formulas of model/common.py
+    for variable, standard_of_living in [('decile', nivvie), ('decile_net', menages_data_frame.nivvie_net.values)]:
+        decile, values = mark_weighted_percentiles(standard_of_living, numpy.arange(1, 11), wprm * champm, 2,
+            return_quantiles = True)
+        assert (menages_data_frame[variable].values == decile * champm).all()
+    percentile, values = mark_weighted_percentiles(nivvie, numpy.arange(1, 3), wprm * champm, 2,
+        return_quantiles = True)
+    for variable, rate in [('pauvre40', .4), ('pauvre50', .5), ('pauvre60', .6)]:
+        expected = (nivvie <= rate * values[1]) * champm
+        assert (menages_data_frame[variable].values == expected).all()
+    assert set(numpy.unique(menages_data_frame.decile)) == set(range(11))
+    assert 0 < menages_data_frame.pauvre40.sum() < menages_data_frame.pauvre50.sum() < menages_data_frame.pauvre60.sum()
+    # Deciles computed on the whole population differ from the ones computed within chunks
+    order = numpy.argsort(nivvie)
+    chunk_deciles = numpy.concatenate([
+        recompute_quantile_variables(menages_data_frame.iloc[positions].copy()).decile.values
+        for positions in numpy.array_split(order, 4)
+        ])
+    assert (chunk_deciles != menages_data_frame.decile.values[order]).any()
+    # Frames without quantile variable are left untouched
+    data_frame = pandas.DataFrame(dict(nivvie = [1., 2.], wprm = [1., 1.]))
+    assert recompute_quantile_variables(data_frame) is data_frame
+    assert list(data_frame.columns) == ['nivvie', 'wprm']
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_partition_households()
+    test_recompute_quantile_variables()
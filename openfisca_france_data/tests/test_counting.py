@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+
+
+from openfisca_france_data.counting import count_by_category
+
+
+def test_count_by_category():
+    households = numpy.array([3, 1, 3, 3, 5])
+    fuels = numpy.array([1, 2, 2, numpy.nan, 1])
+    counts = count_by_category(households, fuels, {1: 'essence', 2: 'diesel'}, index = [1, 2, 3, 5], total = 'total',
+        shares = {'share_essence': 'essence'})
+    assert (counts.index == [1, 2, 3, 5]).all()
+    assert counts.total.dtype == numpy.int16 and counts.share_essence.dtype == numpy.float32
+    assert counts.total.tolist() == [1, 0, 3, 1]
+    assert counts.essence.tolist() == [0, 0, 1, 1]
+    assert counts.diesel.tolist() == [1, 0, 1, 0]
+    assert numpy.allclose(counts.share_essence, [0, 0, 1 / 3, 1])
+
+
+def test_count_by_category_with_slots():
+    fuels = numpy.array([[1, 2], [1, 1], [numpy.nan, numpy.nan]])
+    counts = count_by_category([10, 20, 30], fuels, {1: 'essence', 2: 'diesel'}, total = 'total')
+    assert counts.total.tolist() == [1, 1, 1]
+    assert counts.essence.tolist() == [1, 2, 0]
+    assert counts.diesel.tolist() == [1, 0, 0]
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_count_by_category()
+    test_count_by_category_with_slots()
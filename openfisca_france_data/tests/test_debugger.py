@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+from pandas import DataFrame
+
+
+from openfisca_france_data.debugger import compute_household_differences, Debugger
+
+
+def test_compute_household_differences():
+    erf_menages_data_frame = DataFrame(dict(
+        idmen = [0, 1, 2, 3],
+        wprm = [1.0, 2.0, 1.0, 3.0],
+        af = [0, 100, 50, 10],
+        rsa = [1, 1, 1, 1],
+        ))
+    of_menages_data_frame = DataFrame(dict(
+        idmen = [3, 2, 1, 0, 9],
+        af = [10, 70, 100, 5, 0],
+        rsa = [1, 1, 1, 1, 1],
+        ))
+    differences, report, top_households_by_variable = compute_household_differences(
+        erf_menages_data_frame,
+        of_menages_data_frame,
+        variables = ['af', 'rsa'],
+        top = 2,
+        )
+    assert len(differences) == 4
+    assert differences.loc[2, 'af_abs_diff'] == 20
+    assert differences.loc[2, 'af_rel_diff'] == .4
+    assert numpy.isnan(differences.loc[0, 'af_rel_diff'])
+    assert numpy.allclose(differences['af_contribution'].sum(), 1)
+    assert report.loc['af', 'gap'] == 25
+    assert report.loc['af', 'differing_households'] == 2
+    assert report.loc['rsa', 'gap'] == 0
+    assert list(top_households_by_variable['af']['idmen']) == [2, 0]
+
+
+class FakeDebugger(Debugger):
+    """Debugger building its ménages data frames from fixed ERF and OpenFisca values"""
+    def __init__(self, erf_values_by_variable, of_values_by_variable):
+        super(FakeDebugger, self).__init__()
+        self.erf_values_by_variable = erf_values_by_variable
+        self.of_values_by_variable = of_values_by_variable
+        self.built_variables = list()
+
+    def build_data_frames(self, variables = None):
+        columns = [self.variable] + list(variables or [])
+        self.built_variables.append(columns)
+        erf_columns = [column for column in columns if column in self.erf_values_by_variable]
+        of_columns = [column for column in columns if column in self.of_values_by_variable]
+        self.erf_menages_data_frame = DataFrame(dict(
+            [('idmen', [0, 1, 2]), ('wprm', [1.0, 2.0, 1.0])] +
+            [(column, self.erf_values_by_variable[column]) for column in erf_columns]
+            ))
+        self.of_menages_data_frame = DataFrame(dict(
+            [('idmen', [0, 1, 2])] + [(column, self.of_values_by_variable[column]) for column in of_columns]
+            ))
+
+def test_get_major_differences_rebuilds_data_frames():
+    debugger = FakeDebugger(
+        dict(af = [10, 20, 30], rsa = [0, 5, 5], aah = [1, 1, 1]),
+        dict(af = [10, 25, 30], rsa = [0, 5, 10], aah = [1, 1, 1]),
+        )
+    debugger.set_variable('af')
+    table = debugger.get_major_differences()
+    assert debugger.built_variables == [['af']]
+    assert list(table.idmen) == [1, 0, 2]
+    # Cached data frames are reused
+    debugger.get_major_differences(variables = ['af'])
+    assert len(debugger.built_variables) == 1
+    # A new debugged variable
+    debugger.set_variable('rsa')
+    table = debugger.get_major_differences()
+    assert debugger.built_variables[-1] == ['rsa']
+    assert list(table.idmen) == [2, 1]
+    # Other variables to compare
+    debugger.get_major_differences(variables = ['af', 'aah'])
+    assert debugger.built_variables[-1] == ['rsa', 'af', 'aah']
+    assert set(debugger.differences_report.index) == set(['rsa', 'af', 'aah'])
+    # Variables without counterpart fail clearly
+    debugger.erf_values_by_variable.pop('aah')
+    debugger.erf_menages_data_frame = None
+    try:
+        debugger.get_major_differences(variables = ['aah'])
+    except AssertionError as error:
+        assert 'aah' in str(error)
+    else:
+        raise AssertionError('Missing variables must fail')
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_compute_household_differences()
+    test_get_major_differences_rebuilds_data_frames()
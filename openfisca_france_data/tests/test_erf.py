@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import shutil
+import tempfile
+
+from pandas import DataFrame
+
+
+from openfisca_france_data import erf, temporary
+
+
+class FakeSurvey(object):
+    """ERFS survey holding its tables in memory, with columns named as by survey.get_values"""
+    def __init__(self):
+        self.data_frame_by_table = dict(
+            erf_menage = DataFrame(dict(ident = [1, 2], m_afm = [0., 120.], wprm = [10., 20.], zimpom = [500, 0])),
+            erf_indivi = DataFrame(dict(ident = [1, 1, 2], noi = [1, 2, 1], zsali = [1000., 0., 2000.])),
+            )
+        self.tables = dict((table, dict()) for table in self.data_frame_by_table)
+        self.read_variables = list()
+
+    def get_values(self, variables = None, table = None):
+        data_frame = self.data_frame_by_table[table]
+        self.read_variables.append((table, variables))
+        if variables is None:
+            return data_frame.copy()
+        return data_frame[variables].copy()
+
+
+class TestErfVariablesIndex(object):
+    def setup(self):
+        self.survey = FakeSurvey()
+        self.directory = tempfile.mkdtemp()
+        self.get_erf_survey = erf.get_erf_survey
+        self.get_tmp_directory = temporary.get_tmp_directory
+        erf.get_erf_survey = lambda year: self.survey
+        temporary.get_tmp_directory = lambda config_files_directory: self.directory
+        erf.erf_variables_index_by_year.clear()
+
+    setup_method = setup
+
+    def teardown(self):
+        erf.get_erf_survey = self.get_erf_survey
+        temporary.get_tmp_directory = self.get_tmp_directory
+        erf.erf_variables_index_by_year.clear()
+        shutil.rmtree(self.directory)
+
+    teardown_method = teardown
+
+    def test_build_erf_variables_index(self):
+        index_data_frame = erf.build_erf_variables_index(2006)
+        assert list(index_data_frame.columns) == ['variable', 'erf_variable', 'table', 'dtype']
+        rows = set(tuple(row) for row in index_data_frame.values)
+        assert ('af', 'm_afm', 'erf_menage', 'float64') in rows
+        assert ('irpp', 'zimpom', 'erf_menage', 'int64') in rows
+        assert ('ident', 'ident', 'erf_indivi', 'int64') in rows
+        assert ('zsali', 'zsali', 'erf_indivi', 'float64') in rows
+        assert len(rows) == 7
+
+    def test_get_erf_variables_index(self):
+        locations_by_variable = erf.get_erf_variables_index(2006)
+        assert locations_by_variable['af'] == [('erf_menage', 'm_afm', 'float64')]
+        assert locations_by_variable['m_afm'] == [('erf_menage', 'm_afm', 'float64')]
+        assert sorted(locations_by_variable['ident']) == [('erf_indivi', 'ident', 'int64'),
+            ('erf_menage', 'ident', 'int64')]
+        read_count = len(self.survey.read_variables)
+        assert read_count == 2
+        # Cached in memory
+        assert erf.get_erf_variables_index(2006) is locations_by_variable
+        # Persisted in the temporary store
+        erf.erf_variables_index_by_year.clear()
+        assert erf.get_erf_variables_index(2006) == locations_by_variable
+        assert len(self.survey.read_variables) == read_count
+        # Rebuilt on demand
+        self.survey.data_frame_by_table['erf_menage']['m_rsam'] = [0., 400.]
+        locations_by_variable = erf.get_erf_variables_index(2006, force_rebuild = True)
+        assert locations_by_variable['rsa'] == [('erf_menage', 'm_rsam', 'float64')]
+
+    def test_get_erf_data_frame_by_table(self):
+        data_frame_by_table = erf.get_erf_data_frame_by_table(
+            variables = ['af', 'zsali', 'ident', 'missing_variable'],
+            year = 2006,
+            )
+        assert sorted(data_frame_by_table) == ['erf_indivi', 'erf_menage']
+        assert sorted(data_frame_by_table['erf_menage'].columns) == ['af', 'ident']
+        assert sorted(data_frame_by_table['erf_indivi'].columns) == ['ident', 'zsali']
+        assert list(data_frame_by_table['erf_menage'].af) == [0., 120.]
+        # Each table is read once
+        reads = [table for table, variables in self.survey.read_variables if variables is not None]
+        assert sorted(reads) == ['erf_indivi', 'erf_menage']
+        data_frame_by_table = erf.get_erf_data_frame_by_table(variables = ['af', 'zsali'], year = 2006,
+            tables = ['erf_menage'])
+        assert list(data_frame_by_table) == ['erf_menage']
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    for test_name in sorted(dir(TestErfVariablesIndex)):
+        if test_name.startswith('test_'):
+            test = TestErfVariablesIndex()
+            test.setup()
+            try:
+                getattr(test, test_name)()
+            finally:
+                test.teardown()
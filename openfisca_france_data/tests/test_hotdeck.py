@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+import pandas
+
+
+from openfisca_france_data.hotdeck import create_fused, nnd_hotdeck, random_hotdeck, widened_random_hotdeck
+
+
+def build_data_frames():
+    random_state = numpy.random.RandomState(1)
+    donors = pandas.DataFrame(dict(
+        classe = random_state.randint(0, 3, 300),
+        x = random_state.uniform(0, 10, 300),
+        y = random_state.uniform(0, 100, 300),
+        z = random_state.lognormal(5, 1, 300),
+        poids = random_state.uniform(1, 10, 300),
+        ))
+    recipients = pandas.DataFrame(dict(
+        classe = random_state.randint(0, 4, 200),
+        x = random_state.uniform(0, 10, 200),
+        y = random_state.uniform(0, 100, 200),
+        ))
+    return recipients, donors
+
+
+def test_random_hotdeck():
+    recipients, donors = build_data_frames()
+    donor_positions = random_hotdeck(recipients, donors, don_class = ['classe'], weight = 'poids', seed = 1)
+    matched = donor_positions >= 0
+    # The class 3 has no donor
+    assert (matched == (recipients.classe != 3).values).all()
+    assert (donors.classe.values[donor_positions[matched]] == recipients.classe.values[matched]).all()
+    assert (donor_positions == random_hotdeck(
+        recipients, donors, don_class = ['classe'], weight = 'poids', seed = 1)).all()
+    fused = create_fused(recipients, donors, donor_positions, ['z'])
+    assert fused.z.notnull().values[matched].all()
+    assert fused.z.isnull().values[~matched].all()
+
+
+def test_random_hotdeck_weights():
+    donors = pandas.DataFrame(dict(
+        classe = [0] * 4 + [1] * 3,
+        poids = [1., 2., 3., 4., 5., 0., 5.],
+        ))
+    recipients = pandas.DataFrame(dict(classe = [0] * 20000 + [1] * 20000))
+    donor_positions = random_hotdeck(recipients, donors, don_class = ['classe'], weight = 'poids', seed = 1)
+    frequencies = numpy.bincount(donor_positions[:20000], minlength = 7) / 20000
+    assert numpy.allclose(frequencies, [.1, .2, .3, .4, 0, 0, 0], atol = .01)
+    frequencies = numpy.bincount(donor_positions[20000:], minlength = 7) / 20000
+    assert numpy.allclose(frequencies, [0, 0, 0, 0, .5, 0, .5], atol = .01)
+    # Uniform draws without weight
+    donor_positions = random_hotdeck(recipients, donors, don_class = ['classe'], seed = 1)
+    frequencies = numpy.bincount(donor_positions[:20000], minlength = 7) / 20000
+    assert numpy.allclose(frequencies, [.25, .25, .25, .25, 0, 0, 0], atol = .01)
+
+
+def test_widened_random_hotdeck():
+    donors = pandas.DataFrame(dict(
+        surface = [1, 1, 2, 2, 3],
+        maison = [0, 1, 0, 0, 1],
+        poids = [1., 1., 1., 1., 1.],
+        ))
+    recipients = pandas.DataFrame(dict(
+        surface = [1, 1, 2, 3, 4, 4],
+        maison = [0, 1, 1, 0, 0, 1],
+        ))
+    don_classes = [['surface', 'maison'], ['surface'], None]
+    donor_positions = widened_random_hotdeck(recipients, donors, don_classes, weight = 'poids', seed = 1)
+    assert (donor_positions >= 0).all()
+    matched_donors = donors.iloc[donor_positions]
+    # Narrowest class with donors
+    assert (matched_donors.surface.values[:2] == [1, 1]).all()
+    assert (matched_donors.maison.values[:2] == [0, 1]).all()
+    # Classes (2, 1) and (3, 0) have no donor: widened to the surface only
+    assert (matched_donors.surface.values[2:4] == [2, 3]).all()
+    # Same draws with the same seed
+    assert (donor_positions == widened_random_hotdeck(recipients, donors, don_classes, weight = 'poids',
+        seed = 1)).all()
+    # Surface 4 has no donor: these recipients are only matched when the classes are widened to all the donors
+    donor_positions = widened_random_hotdeck(recipients, donors, don_classes[:2], weight = 'poids', seed = 1)
+    assert (donor_positions[4:] == -1).all()
+    assert (donor_positions[:4] >= 0).all()
+
+
+def test_nnd_hotdeck():
+    recipients, donors = build_data_frames()
+    donor_positions, distances = nnd_hotdeck(recipients, donors, match_vars = ['x', 'y'], don_class = ['classe'],
+        seed = 1)
+    all_values = pandas.concat([recipients[['x', 'y']], donors[['x', 'y']]])
+    ranges = all_values.max() - all_values.min()
+    for position in numpy.flatnonzero(donor_positions >= 0):
+        recipient = recipients.iloc[position]
+        class_donors = donors[donors.classe == recipient.classe]
+        gower = (abs(class_donors[['x', 'y']] - recipient[['x', 'y']]) / ranges).mean(axis = 1)
+        assert numpy.isclose(distances[position], gower.min())
+        assert donors.classe.values[donor_positions[position]] == recipient.classe
+
+
+def build_discrete_data_frames():
+    random_state = numpy.random.RandomState(2)
+    donors = pandas.DataFrame(dict(
+        classe = random_state.randint(0, 2, 2000),
+        a = random_state.randint(0, 3, 2000),
+        b = random_state.randint(0, 4, 2000),
+        ))
+    recipients = pandas.DataFrame(dict(
+        classe = random_state.randint(0, 2, 5000),
+        a = random_state.randint(0, 3, 5000),
+        b = random_state.randint(0, 4, 5000),
+        ))
+    return recipients, donors
+
+
+def test_nnd_hotdeck_ties():
+    recipients, donors = build_discrete_data_frames()
+    donor_positions, distances = nnd_hotdeck(recipients, donors, match_vars = ['a', 'b'], don_class = ['classe'],
+        seed = 1)
+    # Every cell of the discrete matching variables has donors: all the recipients find an exact match
+    assert (donor_positions >= 0).all()
+    assert (distances == 0).all()
+    matched_donors = donors.iloc[donor_positions]
+    for variable in ['classe', 'a', 'b']:
+        assert (matched_donors[variable].values == recipients[variable].values).all()
+    # The donors are drawn among all the tied donors, not only among the first neighbours found
+    cells = ['classe', 'a', 'b']
+    donor_counts = donors.groupby(cells).size()
+    used_counts = matched_donors.groupby(cells).apply(lambda cell: cell.index.nunique())
+    recipient_counts = recipients.groupby(cells).size()
+    expected_counts = donor_counts * (1 - (1 - 1 / donor_counts) ** recipient_counts)
+    assert (used_counts > .8 * expected_counts).all()
+    assert len(numpy.unique(donor_positions)) > 1500
+    assert numpy.bincount(donor_positions).max() < 15
+
+
+def test_nnd_hotdeck_tie_weights():
+    recipients = pandas.DataFrame(dict(a = numpy.zeros(20000)))
+    donors = pandas.DataFrame(dict(a = numpy.zeros(30), poids = numpy.arange(1, 31, dtype = float)))
+    donor_positions, _ = nnd_hotdeck(recipients, donors, match_vars = ['a'], weight = 'poids', k = 4, seed = 1)
+    frequencies = numpy.bincount(donor_positions, minlength = 30) / len(recipients)
+    assert numpy.allclose(frequencies, donors.poids.values / donors.poids.sum(), atol = .01)
+
+
+def test_nnd_hotdeck_missing_values():
+    recipients = pandas.DataFrame(dict(a = [0., numpy.nan, 2.], b = [1., 1., numpy.nan]))
+    donors = pandas.DataFrame(dict(a = [0., numpy.nan, 2.], b = [1., 1., 1.]))
+    donor_positions, distances = nnd_hotdeck(recipients, donors, match_vars = ['a', 'b'], seed = 1)
+    assert list(donor_positions) == [0, -1, -1]
+    assert distances[0] == 0
+    assert numpy.isnan(distances[1:]).all()
+    # No donor of the class without missing values
+    donor_positions, _ = nnd_hotdeck(recipients.iloc[:1], donors.iloc[1:2], match_vars = ['a', 'b'], seed = 1)
+    assert list(donor_positions) == [-1]
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_random_hotdeck()
+    test_random_hotdeck_weights()
+    test_widened_random_hotdeck()
+    test_nnd_hotdeck()
+    test_nnd_hotdeck_ties()
+    test_nnd_hotdeck_tie_weights()
+    test_nnd_hotdeck_missing_values()
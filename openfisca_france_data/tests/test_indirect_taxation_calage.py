@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import shutil
+import tempfile
+
+import numpy
+import pandas
+
+
+from openfisca_france_data import temporary
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data import utils
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.step_0_1_1_homogeneisation_donnees_depenses \
+    import normalize_coicop
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.step_03_calage import (
+    calage_viellissement_depenses, get_bdf_data_frames)
+
+
+def build_depenses():
+    random_state = numpy.random.RandomState(4)
+    columns = ['01111', '01121', '02111', '02201', '04111', '07211', '12111', '99111', '99211', 'pondmen']
+    depenses = pandas.DataFrame(
+        random_state.lognormal(4, 1, (50, len(columns))),
+        columns = columns,
+        index = numpy.arange(50) + 1000,
+        )
+    return depenses
+
+
+def build_masses(year_data, year_calage, grospostes):
+    random_state = numpy.random.RandomState(5)
+    return pandas.DataFrame(
+        {
+            'ratio_bdf{}_cn{}'.format(year_data, year_data): random_state.uniform(.8, 1.2, len(grospostes)),
+            'ratio_cn{}_cn{}'.format(year_data, year_calage): random_state.uniform(1, 1.1, len(grospostes)),
+            },
+        index = grospostes,
+        )
+
+
+def calage_with_loop(year_data, year_calage, depenses, masses):
+    """Calage as done before the aggregation matrices, column by column"""
+    depenses_calees = pandas.DataFrame()
+    coicop_list = set(depenses.columns)
+    coicop_list.remove('pondmen')
+    for column in coicop_list:
+        coicop = normalize_coicop(column)
+        grosposte = int(coicop[0:2])
+        if grosposte != 99:
+            ratio_bdf_cn = masses.at[grosposte, 'ratio_bdf{}_cn{}'.format(year_data, year_data)]
+            ratio_cn_cn = masses.at[grosposte, 'ratio_cn{}_cn{}'.format(year_data, year_calage)]
+            depenses_calees[column] = depenses[column] * ratio_bdf_cn * ratio_cn_cn
+    return depenses_calees
+
+
+class TestCalage(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.get_tmp_directory = temporary.get_tmp_directory
+        temporary.get_tmp_directory = lambda config_files_directory: self.directory
+        utils.aggregation_matrix_by_name.clear()
+
+    setup_method = setup
+
+    def teardown(self):
+        temporary.get_tmp_directory = self.get_tmp_directory
+        utils.aggregation_matrix_by_name.clear()
+        shutil.rmtree(self.directory)
+
+    teardown_method = teardown
+
+    def test_calage_viellissement_depenses(self):
+        depenses = build_depenses()
+        masses = build_masses(2005, 2010, [1, 2, 4, 7, 12])
+        depenses_calees = calage_viellissement_depenses(2005, 2010, depenses, masses)
+        expected = calage_with_loop(2005, 2010, depenses, masses)
+        # The poste 99 columns and pondmen are dropped
+        assert sorted(depenses_calees.columns) == sorted(expected.columns)
+        assert list(depenses_calees.columns) == ['01111', '01121', '02111', '02201', '04111', '07211', '12111']
+        assert (depenses_calees.index == depenses.index).all()
+        assert numpy.allclose(depenses_calees.values, expected[depenses_calees.columns].values)
+        # Same year
+        masses = build_masses(2005, 2005, [1, 2, 4, 7, 12])
+        assert numpy.allclose(
+            calage_viellissement_depenses(2005, 2005, depenses, masses).values,
+            calage_with_loop(2005, 2005, depenses, masses)[depenses_calees.columns].values,
+            )
+
+    def test_missing_ratio(self):
+        depenses = build_depenses()
+        masses = build_masses(2005, 2010, [1, 2, 4, 12])
+        try:
+            calage_viellissement_depenses(2005, 2010, depenses, masses)
+        except AssertionError as error:
+            assert '[7]' in str(error)
+        else:
+            raise AssertionError('A missing calage ratio must fail')
+
+    def test_get_bdf_data_frames(self):
+        depenses_by_grosposte = build_depenses().iloc[:, 5:]
+        depenses_by_grosposte.columns = [7, 12, 99, 98, 'pondmen']
+        with temporary.TemporaryStore.create(file_name = "indirect_taxation_tmp") as temporary_store:
+            temporary_store['depenses_by_grosposte_2005'] = depenses_by_grosposte
+        weighted_sums = get_bdf_data_frames(2005)
+        for grosposte in [7, 12, 99, 98]:
+            expected = (depenses_by_grosposte[grosposte] * depenses_by_grosposte['pondmen']).sum()
+            assert numpy.isclose(weighted_sums.loc[grosposte, 0], expected)
+        assert len(weighted_sums) == 4
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    for test_name in sorted(dir(TestCalage)):
+        if test_name.startswith('test_'):
+            test = TestCalage()
+            test.setup()
+            try:
+                getattr(test, test_name)()
+            finally:
+                test.teardown()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import shutil
+import tempfile
+
+import numpy
+import pandas
+
+
+from openfisca_france_data import temporary
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data import utils
+from openfisca_france_data.input_data_builders.build_openfisca_indirect_taxation_survey_data.utils import (
+    aggregate_columns, assemble_data_frames, build_aggregation_matrix, collapsesum, get_aggregation_matrix,
+    rank_within_groups, weighted_group_sum, weighted_sum)
+
+
+def build_data_frame():
+    random_state = numpy.random.RandomState(1)
+    data_frame = pandas.DataFrame(dict(
+        ident_men = random_state.randint(0, 50, 300).astype(float),
+        depense = random_state.lognormal(5, 1, 300),
+        pondmen = random_state.uniform(100, 1000, 300),
+        ))
+    data_frame.loc[::17, 'ident_men'] = numpy.nan
+    data_frame.loc[::13, 'depense'] = numpy.nan
+    return data_frame
+
+
+def test_rank_within_groups():
+    data_frame = build_data_frame().dropna(subset = ['ident_men'])
+
+    def add_col_numero(data_frame):
+        data_frame['numero'] = numpy.arange(len(data_frame)) + 3
+        return data_frame
+
+    expected = data_frame.groupby(by = 'ident_men', group_keys = False).apply(add_col_numero)['numero']
+    numero = pandas.Series(rank_within_groups(data_frame.ident_men, start = 3), index = data_frame.index)
+    assert (numero == expected.loc[data_frame.index]).all()
+
+
+def test_weighted_group_sum():
+    data_frame = build_data_frame()
+    expected = data_frame.groupby(['ident_men']).apply(lambda x: weighted_sum(groupe = x, var = 'depense'))
+    result = weighted_group_sum(data_frame.ident_men, data_frame.depense, data_frame.pondmen)
+    # Rows without group are ignored and missing values count as 0
+    assert (result.index == expected.index).all()
+    assert numpy.allclose(result.values, expected.values)
+    assert numpy.allclose(collapsesum(data_frame, by = 'ident_men', var = 'depense').values, expected.values)
+
+
+def test_assemble_data_frames():
+    revenus = pandas.DataFrame(
+        dict(rev_disponible = [1000., 2000., 1500.], pondmen = [10., 20., 30.], age = [30, 40, 50]),
+        index = [1, 2, 3],
+        )
+    vehicules = pandas.DataFrame(
+        dict(veh_tot = numpy.array([1, 2], dtype = numpy.int16), diesel = [True, False], pondmen = [10., 20.]),
+        index = [1, 2],
+        )
+    menage = pandas.DataFrame(
+        dict(age = [30, 40, 50, 60], rev_disponible = [numpy.nan, 2000., 1500., 900.], nom = ['a', 'b', 'c', 'd']),
+        index = [1, 2, 3, 4],
+        )
+    depenses = pandas.DataFrame(dict(veh_tot = [0., 3.], depense = [100., 200.]), index = [4, 5])
+    data_frames = [revenus, vehicules, None, menage, depenses]
+    data_frame = assemble_data_frames(data_frames)
+    expected = pandas.concat(
+        [frame for frame in data_frames if frame is not None], axis = 1).T.groupby(level = 0).first().T
+    assert sorted(data_frame.columns) == sorted(expected.columns)
+    assert list(data_frame.columns) == ['rev_disponible', 'pondmen', 'age', 'veh_tot', 'diesel', 'nom', 'depense']
+    assert (data_frame.index == expected.index).all()
+    for column in data_frame.columns:
+        values = data_frame[column]
+        expected_values = expected[column].loc[data_frame.index]
+        assert ((values == expected_values) | (values.isnull() & expected_values.isnull())).all(), column
+    # Numeric columns stay numeric, even when they need an alignment or are completed by another dtype
+    for column in ['rev_disponible', 'pondmen', 'age', 'veh_tot', 'diesel', 'depense']:
+        assert data_frame[column].dtype.kind in 'biuf', column
+    assert data_frame.age.dtype.kind == 'f'
+    assert data_frame.veh_tot.dtype == numpy.float64
+    assert data_frame.diesel.dtype == numpy.float32
+    # Frames on the same index are not aligned
+    data_frame = assemble_data_frames([revenus.iloc[:2], vehicules])
+    assert data_frame.age.dtype == revenus.age.dtype
+    assert data_frame.diesel.dtype == bool
+
+
+def build_consumption_data_frame():
+    random_state = numpy.random.RandomState(3)
+    columns = ['c01111', 'c01112', 'c02111', 'c01211', 'c99000', 'c02211', 'c04111']
+    data_frame = pandas.DataFrame(
+        random_state.lognormal(3, 1, (20, len(columns))),
+        columns = columns,
+        index = numpy.arange(20) + 100,
+        )
+    data_frame.iloc[::3, 1] = numpy.nan
+    return data_frame
+
+
+def group_by_poste(column):
+    poste = column[1:3]
+    return None if poste == '99' else int(poste)
+
+
+def aggregate_with_groupby(data_frame, groups):
+    """Regrouping as done before the aggregation matrices, with MultiIndex columns"""
+    data_frame = data_frame.copy()
+    data_frame.columns = pandas.MultiIndex.from_tuples(list(zip(groups, data_frame.columns)),
+        names = ['group', 'column'])
+    # Same as data_frame.groupby(level = 0, axis = 1).sum(), which recent pandas versions do not support any more
+    return data_frame.T.groupby(level = 0).sum().T
+
+
+def test_aggregate_columns():
+    data_frame = build_consumption_data_frame()
+    groups_by_column = [group_by_poste(column) for column in data_frame.columns]
+    matrix, groups = build_aggregation_matrix(groups_by_column)
+    assert groups == [1, 2, 4]
+    assert matrix.shape == (7, 3)
+    result = aggregate_columns(data_frame, matrix, groups)
+    expected = aggregate_with_groupby(data_frame, groups_by_column)
+    # The None group (poste 99) is dropped, missing values count as 0
+    assert list(result.columns) == list(expected.columns) == [1, 2, 4]
+    assert (result.index == data_frame.index).all()
+    assert numpy.allclose(result.values, expected.values.astype(float))
+    # String groups, as the catégories fiscales
+    labels = [None if group is None else 'tva_taux_{}'.format(group) for group in groups_by_column]
+    matrix, groups = build_aggregation_matrix(labels)
+    assert numpy.allclose(aggregate_columns(data_frame, matrix, groups).values,
+        aggregate_with_groupby(data_frame, labels).values.astype(float))
+
+
+class TestAggregationMatrix(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.get_tmp_directory = temporary.get_tmp_directory
+        temporary.get_tmp_directory = lambda config_files_directory: self.directory
+        utils.aggregation_matrix_by_name.clear()
+        self.compiled_columns = list()
+
+    setup_method = setup
+
+    def teardown(self):
+        temporary.get_tmp_directory = self.get_tmp_directory
+        utils.aggregation_matrix_by_name.clear()
+        shutil.rmtree(self.directory)
+
+    teardown_method = teardown
+
+    def get_matrix(self, columns, correspondance):
+        def get_group(column):
+            self.compiled_columns.append(column)
+            return correspondance.get(column)
+        return get_aggregation_matrix('test_matrix', columns, get_group, correspondance = correspondance)
+
+    def test_get_aggregation_matrix(self):
+        data_frame = build_consumption_data_frame()
+        columns = list(data_frame.columns)
+        correspondance = dict((column, group_by_poste(column)) for column in columns)
+        matrix, groups = self.get_matrix(columns, correspondance)
+        assert len(self.compiled_columns) == len(columns)
+        expected = aggregate_with_groupby(data_frame, [correspondance[column] for column in columns])
+        assert numpy.allclose(aggregate_columns(data_frame, matrix, groups).values, expected.values.astype(float))
+        # Memory cache
+        assert self.get_matrix(columns, correspondance)[0] is matrix
+        # Disk cache, as in a new process
+        utils.aggregation_matrix_by_name.clear()
+        cached_matrix, cached_groups = self.get_matrix(columns, correspondance)
+        assert len(self.compiled_columns) == len(columns)
+        assert cached_groups == groups
+        assert (cached_matrix != matrix).nnz == 0
+        # A changed column list is compiled again
+        del self.compiled_columns[:]
+        matrix, groups = self.get_matrix(columns[:-1], correspondance)
+        assert self.compiled_columns == columns[:-1]
+        assert groups == [1, 2]
+        # A changed correspondance too, even with the same columns
+        del self.compiled_columns[:]
+        correspondance['c02211'] = 4
+        matrix, groups = self.get_matrix(columns[:-1], correspondance)
+        assert self.compiled_columns == columns[:-1]
+        assert groups == [1, 2, 4]
+        assert matrix[columns.index('c02211'), groups.index(4)] == 1
+        utils.aggregation_matrix_by_name.clear()
+        del self.compiled_columns[:]
+        assert self.get_matrix(columns[:-1], correspondance)[1] == [1, 2, 4]
+        assert self.compiled_columns == []
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_rank_within_groups()
+    test_weighted_group_sum()
+    test_assemble_data_frames()
+    test_aggregate_columns()
+    test = TestAggregationMatrix()
+    test.setup()
+    try:
+        test.test_get_aggregation_matrix()
+    finally:
+        test.teardown()
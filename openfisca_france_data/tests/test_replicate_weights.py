@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+
+
+from openfisca_france_data.replicate_weights import (build_bootstrap_factors, build_jackknife_factors,
+    ReplicateWeights)
+
+
+def test_replicate_factors():
+    strata = numpy.repeat([0, 1, 2], [10, 30, 1])
+    factors = build_bootstrap_factors(len(strata), replicates = 50, strata = strata, seed = 1)
+    assert factors.shape == (41, 50)
+    assert (factors[-1] == 1).all()
+    # Each stratum keeps its size in every replicate
+    assert numpy.allclose(factors[:10].sum(axis = 0), 10)
+    assert numpy.allclose(factors[10:40].sum(axis = 0), 30)
+
+    factors = build_jackknife_factors(len(strata), replicates = 5, strata = strata, seed = 1)
+    assert ((factors == 0).sum(axis = 1) == 1).all()
+    assert numpy.allclose(factors.sum(axis = 0), 41 * 5 / 4 - (factors == 0).sum(axis = 0) * 5 / 4)
+
+
+def test_compute_aggregates():
+    random_state = numpy.random.RandomState(1)
+    values = random_state.lognormal(5, 1, 2000)
+    weight = numpy.full(2000, 100.0)
+    for method in ['bootstrap', 'jackknife']:
+        replicate_weights = ReplicateWeights.create(len(weight), method = method, replicates = 100, seed = 1)
+        aggregates = replicate_weights.compute_aggregates(values, weight, names = ['values'])
+        standard_error = numpy.sqrt(len(values)) * 100 * values.std()
+        assert numpy.allclose(aggregates.amount['values'], values.dot(weight))
+        assert .7 < aggregates.standard_error['values'] / standard_error < 1.3
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_replicate_factors()
+    test_compute_aggregates()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import numpy
+import pandas
+
+
+from openfisca_france_data.surveys import sample_input_data_frame, select_input_data_frame
+
+
+def create_input_data_frame():
+    # Foyer 1 spans households 1 and 2
+    return pandas.DataFrame(dict(
+        idmen = [0, 0, 1, 2, 3, 3, 4],
+        quimen = [0, 1, 0, 0, 0, 1, 0],
+        idfoy = [0, 0, 1, 1, 2, 3, 4],
+        quifoy = [0, 1, 0, 2, 0, 0, 0],
+        idfam = [0, 0, 1, 2, 3, 3, 4],
+        quifam = [0, 1, 0, 0, 0, 1, 0],
+        region = [1, 1, 2, 2, 2, 2, 2],
+        wprm = [10.0] * 7,
+        ))
+
+
+def test_select_input_data_frame():
+    data_frame = select_input_data_frame(create_input_data_frame(), idmen = [2])
+    assert len(data_frame) == 2
+    assert (data_frame.idmen.values == [0, 1]).all()
+    assert (data_frame.idfoy.values == [0, 0]).all()
+    assert (data_frame.idfam.values == [0, 1]).all()
+
+
+def test_sample_input_data_frame_weights():
+    input_data_frame = create_input_data_frame()
+    data_frame = sample_input_data_frame(input_data_frame, idmen = [0, 3])
+    assert (data_frame.wprm.values == 10.0 * 5 / 2).all()
+
+    data_frame = sample_input_data_frame(input_data_frame, fraction = .5, strata = 'region', seed = 1)
+    heads = data_frame.quimen.values == 0
+    total_weight = data_frame.wprm.values[heads].sum()
+    assert numpy.allclose(total_weight, input_data_frame.wprm.values[input_data_frame.quimen.values == 0].sum())
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_select_input_data_frame()
+    test_sample_input_data_frame_weights()
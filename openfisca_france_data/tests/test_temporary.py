@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import fcntl
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import pandas
+
+
+from openfisca_france_data.temporary import lock_by_path, TemporaryStore
+
+
+def can_lock(file_path, exclusive):
+    """Tells whether another process could take the lock of the store file_path right now"""
+    lock_file = open("{}.lock".format(file_path), 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except IOError:
+        return False
+    finally:
+        lock_file.close()
+    return True
+
+
+def can_lock_in_other_process(file_path, exclusive):
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(can_lock, (file_path, exclusive))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class TestTemporaryStore(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'temporary.h5')
+        with TemporaryStore.create(file_path = self.file_path, mode = 'w') as temporary_store:
+            temporary_store['data_frame'] = pandas.DataFrame(dict(a = [1, 2, 3]))
+
+    setup_method = setup
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    teardown_method = teardown
+
+    def is_free(self):
+        return os.path.abspath(self.file_path) not in lock_by_path and can_lock_in_other_process(
+            self.file_path, exclusive = True)
+
+    def test_lazy_open(self):
+        temporary_store = TemporaryStore.create(file_path = self.file_path)
+        assert self.is_free()
+        assert 'data_frame' in temporary_store
+        assert not can_lock_in_other_process(self.file_path, exclusive = False)
+        temporary_store.close()
+        assert self.is_free()
+
+    def test_shared_sessions(self):
+        with TemporaryStore.create(file_path = self.file_path, mode = 'r') as first_store:
+            with TemporaryStore.create(file_path = self.file_path, mode = 'r') as second_store:
+                assert lock_by_path[os.path.abspath(self.file_path)][1:3] == [2, 0]
+                assert can_lock_in_other_process(self.file_path, exclusive = False)
+                assert not can_lock_in_other_process(self.file_path, exclusive = True)
+                assert (second_store['data_frame'].a == [1, 2, 3]).all()
+            # The first session still holds the lock
+            assert not can_lock_in_other_process(self.file_path, exclusive = True)
+            assert (first_store['data_frame'].a == [1, 2, 3]).all()
+        assert self.is_free()
+
+    def test_exclusive_session(self):
+        with TemporaryStore.create(file_path = self.file_path) as temporary_store:
+            assert not can_lock_in_other_process(self.file_path, exclusive = False)
+            temporary_store['other_data_frame'] = pandas.DataFrame(dict(b = [4, 5]))
+        assert self.is_free()
+
+    def test_nested_sessions(self):
+        with TemporaryStore.create(file_path = self.file_path) as first_store:
+            with TemporaryStore.create(file_path = self.file_path) as second_store:
+                assert lock_by_path[os.path.abspath(self.file_path)][1:3] == [0, 2]
+                second_store['other_data_frame'] = pandas.DataFrame(dict(b = [4, 5]))
+            # The first session still holds the lock
+            assert lock_by_path[os.path.abspath(self.file_path)][1:3] == [0, 1]
+            assert not can_lock_in_other_process(self.file_path, exclusive = False)
+            assert (first_store['other_data_frame'].b == [4, 5]).all()
+        assert self.is_free()
+
+    def test_no_upgrade(self):
+        with TemporaryStore.create(file_path = self.file_path, mode = 'r') as reading_store:
+            writing_store = TemporaryStore.create(file_path = self.file_path)
+            try:
+                writing_store['other_data_frame'] = pandas.DataFrame(dict(b = [4, 5]))
+            except AssertionError:
+                pass
+            else:
+                raise AssertionError("A writing session must not start while a reading session is open")
+            # The reading session keeps its shared lock
+            assert lock_by_path[os.path.abspath(self.file_path)][1:3] == [1, 0]
+            assert can_lock_in_other_process(self.file_path, exclusive = False)
+            assert not can_lock_in_other_process(self.file_path, exclusive = True)
+            assert (reading_store['data_frame'].a == [1, 2, 3]).all()
+        assert self.is_free()
+        with TemporaryStore.create(file_path = self.file_path) as writing_store:
+            writing_store['other_data_frame'] = pandas.DataFrame(dict(b = [4, 5]))
+        assert self.is_free()
+
+    def test_release_on_exception(self):
+        try:
+            with TemporaryStore.create(file_path = self.file_path) as temporary_store:
+                temporary_store['data_frame']
+                raise ValueError
+        except ValueError:
+            pass
+        assert self.is_free()
+        try:
+            with TemporaryStore.create(file_path = self.file_path, mode = 'r') as temporary_store:
+                temporary_store['missing_data_frame']
+        except KeyError:
+            pass
+        assert self.is_free()
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    for test_name in sorted(dir(TestTemporaryStore)):
+        if test_name.startswith('test_'):
+            test = TestTemporaryStore()
+            test.setup()
+            try:
+                getattr(test, test_name)()
+            finally:
+                test.teardown()
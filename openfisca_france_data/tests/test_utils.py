@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+
+
+import os
+import shutil
+import tempfile
+
+import numpy
+from pandas import DataFrame
+import tables
+
+
+from openfisca_france_data.utils import (DependencyGraph, EntityProjector, export_simulation_results,
+    get_dependency_graph, load_simulation_results)
+
+
+class FakeColumn(object):
+    def __init__(self, entity):
+        self.entity = entity
+
+
+class FakeEntity(object):
+    def __init__(self, key_plural, column_by_name):
+        self.key_plural = key_plural
+        self.column_by_name = column_by_name
+
+
+class FakeHolder(object):
+    def __init__(self, entity):
+        self.entity = entity
+
+
+class FakeTaxBenefitSystem(object):
+    def __init__(self, column_by_name):
+        self.column_by_name = column_by_name
+
+
+class FakeSimulation(object):
+    """Simulation of 7 individuals in 3 familles, 4 foyers fiscaux and 2 ménages"""
+    def __init__(self):
+        self.array_by_variable = dict(
+            idfam = numpy.array([0, 0, 0, 1, 2, 2, 1]),
+            quifam = numpy.array([0, 1, 2, 0, 0, 1, 2]),
+            idfoy = numpy.array([0, 0, 1, 2, 3, 3, 2]),
+            quifoy = numpy.array([0, 1, 0, 0, 0, 1, 2]),
+            idmen = numpy.array([0, 0, 0, 0, 1, 1, 0]),
+            quimen = numpy.array([0, 1, 2, 2, 0, 1, 2]),
+            salaire = numpy.array([1000., 800., 0., 300., 1200., 0., 50.]),
+            af = numpy.array([120., 0., 60.]),
+            irpp = numpy.array([-100., 0., -20., -300.]),
+            loyer = numpy.array([500., 700.]),
+            date_naissance = numpy.array(['1970-01-02', '1980-05-01', '2000-01-01', '1960-03-04', '1975-12-31',
+                '1977-07-14', '2010-01-01'], dtype = 'datetime64[D]'),
+            nom = numpy.array(['a', 'b', 'c', 'd', 'e', 'f', 'g'], dtype = object),
+            )
+        self.tax_benefit_system = FakeTaxBenefitSystem(dict(
+            salaire = FakeColumn('ind'),
+            af = FakeColumn('fam'),
+            irpp = FakeColumn('foy'),
+            loyer = FakeColumn('men'),
+            date_naissance = FakeColumn('ind'),
+            nom = FakeColumn('ind'),
+            ))
+
+        key_plural_by_symbol = dict(ind = 'individus', fam = 'familles', foy = 'foyers_fiscaux', men = 'menages')
+        self.entity_by_key_plural = dict(
+            (key_plural, FakeEntity(key_plural, dict(
+                (variable, column)
+                for variable, column in self.tax_benefit_system.column_by_name.items()
+                if column.entity == symbol
+                )))
+            for symbol, key_plural in key_plural_by_symbol.items()
+            )
+        self.entity_by_variable = dict(
+            (variable, self.entity_by_key_plural[key_plural_by_symbol[column.entity]])
+            for variable, column in self.tax_benefit_system.column_by_name.items()
+            )
+
+    def calculate(self, variable):
+        return self.array_by_variable[variable]
+
+    def get_or_new_holder(self, variable):
+        return FakeHolder(self.entity_by_variable[variable])
+
+
+def project_with_groupby(simulation, variable, entity, heads_only):
+    """Projection as done before EntityProjector, with loc assignments on the individuals"""
+    individual_data_frame = DataFrame(dict(
+        (name, simulation.calculate(name)) for name in ["id{}".format(entity), "qui{}".format(entity)]))
+    values = simulation.calculate(variable)
+    if heads_only:
+        boolean_index = individual_data_frame["qui{}".format(entity)] == 0
+    else:
+        boolean_index = individual_data_frame["qui{}".format(entity)] >= 0
+    index_entity = individual_data_frame.loc[boolean_index, "id{}".format(entity)].values
+    individual_data_frame.loc[boolean_index, variable] = values[index_entity]
+    return individual_data_frame[variable].fillna(0).values
+
+
+def sum_with_groupby(simulation, values, entity):
+    """Sum by entity as done before EntityProjector, with a groupby of the individuals"""
+    individual_data_frame = DataFrame(dict(values = values, id = simulation.calculate("id{}".format(entity))))
+    return individual_data_frame.groupby(by = 'id').agg('sum')['values'].values
+
+
+def test_entity_projector():
+    simulation = FakeSimulation()
+    entity_projector = EntityProjector(simulation)
+    assert entity_projector.count_by_entity == dict(fam = 3, foy = 4, men = 2)
+    assert (entity_projector.project_to_individuals('salaire') == simulation.calculate('salaire')).all()
+    for variable, entity in [('af', 'fam'), ('irpp', 'foy'), ('loyer', 'men')]:
+        for heads_only in [False, True]:
+            assert numpy.allclose(
+                entity_projector.project_to_individuals(variable, heads_only = heads_only),
+                project_with_groupby(simulation, variable, entity, heads_only),
+                )
+        # Projecting on the heads and summing gives back the entity values
+        assert numpy.allclose(entity_projector.sum_by_entity(variable, entity), simulation.calculate(variable))
+    for entity in ['fam', 'foy', 'men']:
+        salaire = simulation.calculate('salaire')
+        assert numpy.allclose(
+            entity_projector.sum_by_entity('salaire', entity),
+            sum_with_groupby(simulation, salaire, entity),
+            )
+        assert numpy.allclose(
+            entity_projector.sum_by_entity(salaire * 2, entity),
+            sum_with_groupby(simulation, salaire * 2, entity),
+            )
+    # Entity variables summed on another entity through their heads
+    assert numpy.allclose(
+        entity_projector.sum_by_entity('irpp', 'men'),
+        sum_with_groupby(simulation, project_with_groupby(simulation, 'irpp', 'foy', True), 'men'),
+        )
+
+
+def test_export_simulation_results():
+    simulation = FakeSimulation()
+    directory = tempfile.mkdtemp()
+    try:
+        # Only the listed variables are exported, object variables are skipped
+        export_simulation_results(directory = directory, variables = ['salaire', 'af', 'loyer', 'date_naissance',
+            'nom'], simulation = simulation)
+        assert sorted(name for name in os.listdir(directory)) == ['familles.h5', 'individus.h5', 'menages.h5']
+        individus = load_simulation_results(directory = directory, entity_key_plural = 'individus')
+        assert sorted(individus.columns) == ['date_naissance', 'salaire']
+        assert (individus.salaire.values == simulation.calculate('salaire')).all()
+        # Dates are stored as days since epoch
+        assert (individus.date_naissance.values ==
+            simulation.calculate('date_naissance').astype(numpy.int64)).all()
+        assert (load_simulation_results(directory = directory, entity_key_plural = 'familles').af.values ==
+            simulation.calculate('af')).all()
+        h5_file = tables.open_file(os.path.join(directory, 'individus.h5'), mode = 'r')
+        try:
+            filters = h5_file.get_node('/reference/salaire').filters
+            assert filters.complevel == 5 and filters.complib == 'blosc'
+        finally:
+            h5_file.close()
+
+        # A second partition, uncompressed, does not touch the first one
+        simulation.array_by_variable['salaire'] = simulation.calculate('salaire') * 2
+        export_simulation_results(directory = directory, variables = ['salaire'], partition = 'reform',
+            simulation = simulation, complevel = 0)
+        reform = load_simulation_results(directory = directory, entity_key_plural = 'individus',
+            partition = 'reform')
+        assert list(reform.columns) == ['salaire']
+        assert (reform.salaire.values == simulation.calculate('salaire')).all()
+        reference = load_simulation_results(directory = directory, entity_key_plural = 'individus',
+            variables = ['salaire'])
+        assert (reference.salaire.values * 2 == reform.salaire.values).all()
+        h5_file = tables.open_file(os.path.join(directory, 'individus.h5'), mode = 'r')
+        try:
+            assert h5_file.get_node('/reform/salaire').filters.complevel == 0
+        finally:
+            h5_file.close()
+
+        # Exporting again a partition replaces its arrays
+        export_simulation_results(directory = directory, variables = ['salaire'], simulation = simulation)
+        reference = load_simulation_results(directory = directory, entity_key_plural = 'individus')
+        assert (reference.salaire.values == simulation.calculate('salaire')).all()
+        assert 'date_naissance' in reference.columns
+    finally:
+        shutil.rmtree(directory)
+
+
+class FakeFormula(object):
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+
+class FakeGraphColumn(object):
+    def __init__(self, consumers):
+        self.consumers = consumers
+
+
+class FakeGraphHolder(object):
+    def __init__(self, real_formula):
+        self.real_formula = real_formula
+
+
+class FakeGraphSimulation(object):
+    """Diamond of variables: b and c use the input variable a, d uses b and c, e uses a and d"""
+    def __init__(self):
+        self.parameters_by_name = dict(
+            b = ['a'],
+            c = ['a_holder'],
+            d = ['c', 'b'],
+            e = ['d', 'a'],
+            )
+        self.tax_benefit_system = FakeTaxBenefitSystem(dict(
+            a = FakeGraphColumn(['b', 'c', 'e']),
+            b = FakeGraphColumn(['d']),
+            c = FakeGraphColumn(['d']),
+            d = FakeGraphColumn(['e']),
+            e = FakeGraphColumn(None),
+            ))
+        self.requested_holders = list()
+
+    def get_or_new_holder(self, variable):
+        self.requested_holders.append(variable)
+        parameters = self.parameters_by_name.get(variable)
+        return FakeGraphHolder(FakeFormula(parameters) if parameters is not None else None)
+
+
+def assert_ordered(variables, parameters_by_name):
+    """Checks that the parameters of each variable come before it"""
+    for index, variable in enumerate(variables):
+        for parameter in parameters_by_name.get(variable, []):
+            parameter = parameter.replace('_holder', '')
+            if parameter in variables:
+                assert variables.index(parameter) < index, "{} before {} in {}".format(variable, parameter, variables)
+
+
+def test_dependency_graph():
+    simulation = FakeGraphSimulation()
+    dependency_graph = DependencyGraph(simulation.tax_benefit_system)
+    assert dependency_graph.get_parameters('c', simulation) == ['a']
+    assert dependency_graph.get_parameters('a', simulation) == []
+    ancestors = dependency_graph.get_ancestors('e', simulation)
+    assert sorted(ancestors) == ['a', 'b', 'c', 'd']
+    assert_ordered(ancestors, simulation.parameters_by_name)
+    # The shared ancestor a is only expanded once
+    assert sorted(simulation.requested_holders) == ['a', 'b', 'c', 'd', 'e']
+    assert dependency_graph.get_ancestors('e', simulation) is ancestors
+    assert dependency_graph.get_ancestors('a', simulation) == []
+    assert len(simulation.requested_holders) == 5
+
+    # Ancestors reusing the ancestors already known of a parameter
+    simulation = FakeGraphSimulation()
+    dependency_graph = DependencyGraph(simulation.tax_benefit_system)
+    assert sorted(dependency_graph.get_ancestors('d', simulation)) == ['a', 'b', 'c']
+    ancestors = dependency_graph.get_ancestors('e', simulation)
+    assert sorted(ancestors) == ['a', 'b', 'c', 'd']
+    assert_ordered(ancestors, simulation.parameters_by_name)
+    assert sorted(simulation.requested_holders) == ['a', 'b', 'c', 'd', 'e']
+
+    consumers = dependency_graph.get_consumers('a')
+    assert sorted(consumers) == ['b', 'c', 'd', 'e']
+    assert_ordered(consumers, simulation.parameters_by_name)
+    assert dependency_graph.get_consumers('a') is consumers
+    assert dependency_graph.get_consumers('b') == ['d', 'e']
+    assert dependency_graph.get_consumers('e') == []
+
+    # One graph by tax-benefit system
+    tax_benefit_system = simulation.tax_benefit_system
+    assert get_dependency_graph(tax_benefit_system) is get_dependency_graph(tax_benefit_system)
+    assert get_dependency_graph(tax_benefit_system) is not get_dependency_graph(
+        FakeGraphSimulation().tax_benefit_system)
+
+
+if __name__ == '__main__':
+    import logging
+    log = logging.getLogger(__name__)
+    import sys
+    logging.basicConfig(level = logging.INFO, stream = sys.stdout)
+    test_entity_projector()
+    test_export_simulation_results()
+    test_dependency_graph()
@@ -22,13 +22,20 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import os
+import weakref
 
-from pandas import DataFrame, concat
+import numpy as np
+import tables
+from pandas import DataFrame
 
 from openfisca_core.columns import EnumCol, IntCol, BoolCol, AgeCol, FloatCol, DateCol
 
 
+log = logging.getLogger(__name__)
+
+
 def check_consistency(table_simu, dataframe, corrige = True):
     '''
     Studies dataframe columns as described in a simulation table columns attribute, and should eventually
@@ -228,6 +235,11 @@ def check_consistency(table_simu, dataframe, corrige = True):
 
 
 def dump_simulation_results_data_frame(survey_scenario, collection = None):
+    """
+    Store all the computed variables in the openfisca survey collection
+
+    Builds one DataFrame by entity in memory: prefer export_simulation_results for large simulations.
+    """
     assert collection is not None
     year = survey_scenario.year
     data_frame_by_entity = get_calculated_data_frame_by_entity(survey_scenario)
@@ -251,6 +263,85 @@ def dump_simulation_results_data_frame(survey_scenario, collection = None):
         openfisca_survey_collection.dump(collection = "openfisca")
 
 
+def export_simulation_results(survey_scenario = None, directory = None, variables = None, partition = 'reference',
+        simulation = None, complevel = 5, complib = 'blosc'):
+    """
+    Write computed variables in a columnar layout: one HDF5 file by entity, one compressed array by variable
+
+    Arrays are written as soon as they are computed, without building any DataFrame, under the group named partition
+    of {directory}/{entity_key_plural}.h5. Existing partitions (of other reforms for instance) are kept, so that
+    several simulations can be appended to the same files.
+
+    Parameters
+    ----------
+    survey_scenario : SurveyScenario
+                      scenario whose simulation is exported
+    directory : string
+                directory of the entity files
+    variables : list of strings, default None
+                variables to export, all the variables of all the entities when None
+    partition : string, default 'reference'
+                name of the group where the arrays are stored (reform name)
+    simulation : Simulation, default None
+                 simulation to export when not survey_scenario.simulation
+    complevel : int, default 5
+                compression level (0 to disable compression)
+    complib : string, default 'blosc'
+              compression library (see tables.Filters)
+    """
+    assert directory is not None
+    if simulation is None:
+        if survey_scenario.simulation is None:
+            survey_scenario.new_simulation()
+        simulation = survey_scenario.simulation
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    if variables is None:
+        variables = [
+            variable
+            for entity in simulation.entity_by_key_plural.itervalues()
+            for variable in entity.column_by_name.keys()
+            ]
+    filters = tables.Filters(complevel = complevel, complib = complib)
+    h5_file_by_entity_key_plural = dict()
+    try:
+        for variable in variables:
+            array = simulation.calculate(variable)
+            if array.dtype.kind == 'M':
+                array = array.astype('datetime64[D]').astype(np.int64)  # Days since epoch
+            elif array.dtype.kind == 'O':
+                log.info("Variable {} of object dtype is not exported".format(variable))
+                continue
+            entity_key_plural = simulation.get_or_new_holder(variable).entity.key_plural
+            h5_file = h5_file_by_entity_key_plural.get(entity_key_plural)
+            if h5_file is None:
+                h5_file = h5_file_by_entity_key_plural[entity_key_plural] = tables.open_file(
+                    os.path.join(directory, "{}.h5".format(entity_key_plural)), mode = 'a')
+            node_path = "/{}/{}".format(partition, variable)
+            if node_path in h5_file:
+                h5_file.remove_node(node_path)
+            h5_file.create_carray("/{}".format(partition), variable, obj = array, filters = filters,
+                createparents = True)
+    finally:
+        for h5_file in h5_file_by_entity_key_plural.itervalues():
+            h5_file.close()
+
+
+def load_simulation_results(directory = None, entity_key_plural = None, variables = None, partition = 'reference'):
+    """
+    Read a DataFrame of the variables exported by export_simulation_results for an entity and a partition
+    """
+    assert directory is not None and entity_key_plural is not None
+    h5_file = tables.open_file(os.path.join(directory, "{}.h5".format(entity_key_plural)), mode = 'r')
+    try:
+        group = h5_file.get_node("/{}".format(partition))
+        if variables is None:
+            variables = [node._v_name for node in h5_file.list_nodes(group)]
+        return DataFrame(dict((variable, h5_file.get_node(group, variable).read()) for variable in variables))
+    finally:
+        h5_file.close()
+
+
 def get_data_frame(columns_name, survey_scenario, load_first = False, collection = None):
     year = survey_scenario.year
     if survey_scenario.simulation is None:
@@ -286,6 +377,189 @@ def get_calculated_data_frame_by_entity(survey_scenario = None):
     return data_frame_by_entity
 
 
+class EntityProjector(object):
+    """
+    Vectorized projections of variables between individuals and the other entities of a simulation
+
+    The id and role arrays of the individuals are read once. Entities are designated by their symbol ('fam', 'foy',
+    'men'). Only a weak reference to the simulation is kept, so that caching the projector does not keep the simulation
+    alive.
+    """
+    def __init__(self, simulation):
+        self.simulation_reference = weakref.ref(simulation)
+        self.id_by_entity = dict()
+        self.head_by_entity = dict()
+        self.count_by_entity = dict()
+        for entity in ['fam', 'foy', 'men']:
+            self.id_by_entity[entity] = simulation.calculate("id{}".format(entity))
+            self.head_by_entity[entity] = head = simulation.calculate("qui{}".format(entity)) == 0
+            self.count_by_entity[entity] = head.sum()
+
+    @property
+    def simulation(self):
+        simulation = self.simulation_reference()
+        assert simulation is not None, "The simulation of this projector has been garbage collected"
+        return simulation
+
+    def get_entity(self, variable):
+        return self.simulation.tax_benefit_system.column_by_name[variable].entity
+
+    def project_to_individuals(self, variable, heads_only = False):
+        """
+        Return the values of the entity variable for each individual of the entity
+
+        When heads_only is True, the value is only given to the head of the entity (qui == 0) and the other members
+        get 0, so that summing over individuals gives back the entity total.
+        """
+        values = self.simulation.calculate(variable)
+        entity = self.get_entity(variable)
+        if entity == 'ind':
+            return values
+        projected = np.take(values, self.id_by_entity[entity])
+        if heads_only:
+            projected = projected * self.head_by_entity[entity]
+        return projected
+
+    def sum_by_entity(self, variable, entity):
+        """
+        Return the sum over the members of each entity of the individual variable (or of an entity variable projected
+        on the heads of its entity)
+        """
+        assert entity != 'ind'
+        if isinstance(variable, np.ndarray):
+            values = variable
+        else:
+            values = self.project_to_individuals(variable, heads_only = True)
+        return np.bincount(
+            self.id_by_entity[entity],
+            weights = values,
+            minlength = self.count_by_entity[entity],
+            )
+
+
+entity_projector_by_simulation = weakref.WeakKeyDictionary()
+
+
+def get_entity_projector(simulation):
+    """
+    Return the EntityProjector of the simulation, built at first call
+    """
+    entity_projector = entity_projector_by_simulation.get(simulation)
+    if entity_projector is None:
+        entity_projector = entity_projector_by_simulation[simulation] = EntityProjector(simulation)
+    return entity_projector
+
+
+class DependencyGraph(object):
+    """
+    Dependencies between the variables of a tax-benefit system
+
+    Direct parameters of the formulas and full ancestor and consumer sets are computed once for each variable and
+    returned in topological order: ancestors come before the variables using them, consumers after the variables they
+    use.
+    """
+    def __init__(self, tax_benefit_system):
+        self.column_by_name = tax_benefit_system.column_by_name
+        self.parameters_by_name = dict()
+        self.ancestors_by_name = dict()
+        self.consumers_by_name = dict()
+
+    def get_parameters(self, variable, simulation):
+        """
+        Return the names of the variables directly used by the formula of variable (empty for input variables)
+        """
+        parameters = self.parameters_by_name.get(variable)
+        if parameters is None:
+            formula = simulation.get_or_new_holder(variable).real_formula
+            if formula is None:
+                parameters = []
+            else:
+                parameters = [
+                    parameter[:-len('_holder')] if parameter.endswith('_holder') else parameter
+                    for parameter in formula.parameters
+                    ]
+            self.parameters_by_name[variable] = parameters
+        return parameters
+
+    def get_ancestors(self, variable, simulation):
+        """
+        Return the names of all the variables variable depends on, each dependency before its own consumers
+        """
+        ancestors = self.ancestors_by_name.get(variable)
+        if ancestors is not None:
+            return ancestors
+        # Iterative post-order walk: a variable is emitted once all its parameters have been emitted
+        ordered = list()
+        emitted = set()
+        in_progress = set([variable])
+        stack = [(variable, iter(self.get_parameters(variable, simulation)))]
+        while stack:
+            name, parameters = stack[-1]
+            for parameter in parameters:
+                if parameter in emitted or parameter in in_progress:
+                    continue
+                known_ancestors = self.ancestors_by_name.get(parameter)
+                if known_ancestors is not None:
+                    for ancestor in known_ancestors:
+                        if ancestor not in emitted:
+                            emitted.add(ancestor)
+                            ordered.append(ancestor)
+                    emitted.add(parameter)
+                    ordered.append(parameter)
+                    continue
+                in_progress.add(parameter)
+                stack.append((parameter, iter(self.get_parameters(parameter, simulation))))
+                break
+            else:
+                stack.pop()
+                in_progress.discard(name)
+                if name != variable:
+                    emitted.add(name)
+                    ordered.append(name)
+        self.ancestors_by_name[variable] = ordered
+        return ordered
+
+    def get_consumers(self, variable):
+        """
+        Return the names of all the variables depending on variable, each consumer after the variables it uses
+        """
+        consumers = self.consumers_by_name.get(variable)
+        if consumers is not None:
+            return consumers
+        column_by_name = self.column_by_name
+        # Reverse post-order of a depth-first walk along the consumers edges
+        post_order = list()
+        visited = set([variable])
+        stack = [(variable, iter(sorted(column_by_name[variable].consumers or [])))]
+        while stack:
+            name, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(sorted(column_by_name[child].consumers or []))))
+                    break
+            else:
+                stack.pop()
+                if name != variable:
+                    post_order.append(name)
+        consumers = self.consumers_by_name[variable] = post_order[::-1]
+        return consumers
+
+
+dependency_graph_by_tax_benefit_system = weakref.WeakKeyDictionary()
+
+
+def get_dependency_graph(tax_benefit_system):
+    """
+    Return the DependencyGraph of the tax-benefit system, built at first call
+    """
+    dependency_graph = dependency_graph_by_tax_benefit_system.get(tax_benefit_system)
+    if dependency_graph is None:
+        dependency_graph = dependency_graph_by_tax_benefit_system[tax_benefit_system] = DependencyGraph(
+            tax_benefit_system)
+    return dependency_graph
+
+
 def simulation_results_as_data_frame(survey_scenario = None, column_names = None, entity = None, force_sum = False):
     assert survey_scenario is not None
     assert force_sum is False or entity != 'ind', "force_sum cannot be True when entity is 'ind'"
@@ -297,65 +571,43 @@ def simulation_results_as_data_frame(survey_scenario = None, column_names = None
 
     if force_sum is False and entity != 'ind':
         assert len(entities) == 1
-        data_frame = get_data_frame(column_names, survey_scenario, load_first = False, collection = None)
-    else:
-        if 'ind' in entities:
-            entities.remove('ind')
-        if entity is None and len(entities) == 1:
-            entity = entities[0]
-
-        data_frame_by_entity = dict()
-        individual_column_names = [
-            column_name for column_name in column_names if column_by_name[column_name].entity == 'ind'
+        return get_data_frame(column_names, survey_scenario, load_first = False, collection = None)
+
+    if 'ind' in entities:
+        entities.remove('ind')
+    if entity is None and len(entities) == 1:
+        entity = entities[0]
+
+    entity_projector = get_entity_projector(simulation)
+    id_column_names = list()
+    for selected_entity in entities:
+        id_column_names.extend(["id{}".format(selected_entity), "qui{}".format(selected_entity)])
+    individual_column_names = [
+        column_name for column_name in column_names
+        if column_by_name[column_name].entity == 'ind' or column_by_name[column_name].entity != entity
+        ]
+    individual_data_frame = DataFrame(dict(
+        [(column_name, simulation.calculate(column_name)) for column_name in id_column_names] +
+        [
+            (column_name, entity_projector.project_to_individuals(column_name, heads_only = True))
+            for column_name in individual_column_names
+            if column_name not in id_column_names
             ]
-        for selected_entity in entities:
-            id_variables_column_names = ["id{}".format(selected_entity), "qui{}".format(selected_entity)]
-            individual_column_names.extend(id_variables_column_names)
-            selected_entity_column_names = [
-                column_name for column_name in column_names if column_by_name[column_name].entity == selected_entity
-                ]
-            data_frame_by_entity[selected_entity] = get_data_frame(
-                selected_entity_column_names,
-                survey_scenario,
-                load_first = False,
-                collection = None
-                )
-            data_frame_by_entity[selected_entity]["id{}".format(entity)] = data_frame_by_entity[selected_entity].index
-
-        individual_data_frame = get_data_frame(
-            individual_column_names,
-            survey_scenario,
-            load_first = False,
-            collection = None
-            )
-
-        for other_entity in entities:
-            if other_entity != entity:
-                boolean_index = individual_data_frame["qui{}".format(other_entity)] == 0
-                index_other_entity = individual_data_frame.loc[boolean_index, "id{}".format(other_entity)].values
-                for column_name, column_series in data_frame_by_entity[other_entity].iteritems():
-                    individual_data_frame.loc[boolean_index, column_name] \
-                        = column_series.iloc[index_other_entity].values
-                    individual_data_frame[column_name].fillna(0)
-
-        if entity == 'ind' and force_sum is False:
-            return individual_data_frame
-
-        entity_column_names = [
-            column_name for column_name in column_names if column_by_name[column_name].entity == entity
-            ]
-        entity_data_frame = get_data_frame(
-            entity_column_names,
-            survey_scenario,
-            load_first = False,
-            collection = None
-            )
-
-        grouped_data_frame = individual_data_frame.groupby(by = "id{}".format(entity)).agg(sum)
-        grouped_data_frame.drop("qui{}".format(entity), axis = 1, inplace = True)
-        data_frame = concat([entity_data_frame, grouped_data_frame], axis = 1)
-
-    return data_frame
+        ))
+
+    if entity == 'ind' and force_sum is False:
+        return individual_data_frame
+
+    entity_column_names = [
+        column_name for column_name in column_names if column_by_name[column_name].entity == entity
+        ]
+    entity_data_frame = get_data_frame(entity_column_names, survey_scenario, load_first = False, collection = None)
+    for column_name in individual_column_names:
+        if column_name in id_column_names:
+            continue
+        entity_data_frame[column_name] = entity_projector.sum_by_entity(
+            individual_data_frame[column_name].values, entity)
+    return entity_data_frame
 
 
 if __name__ == '__main__':